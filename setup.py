@@ -23,6 +23,9 @@ setup(
         "smsapi-client>=2.4.5",
     ],
     extras_require={
+        "async": [
+            "aiohttp>=3.8",
+        ],
         "docs": [
             "sphinx >= 1.4",
             "sphinx_rtd_theme",
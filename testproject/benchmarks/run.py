@@ -0,0 +1,241 @@
+"""
+Benchmarks of trench's login and management flows.
+
+Runs every scenario against a test database created for ``testproject`` and
+reports median wall and CPU time (after a warm-up run), the number of
+database queries and the number of password hasher calls. Results are
+compared against ``baseline.json``: more queries or hasher calls are reported
+as regressions.
+
+Times depend on the machine, so they're only reported. They're also shown
+relative to a calibration run, a single hash of the default password hasher,
+and the baseline keeps this ratio rather than absolute times.
+
+Usage (from the ``testproject`` directory)::
+
+    python -m benchmarks.run [--repeat 3] [--scenario NAME] [--save-baseline]
+"""
+import django
+from django.contrib.auth.hashers import get_hasher, get_hashers
+from django.db import connection
+from django.db.transaction import atomic, set_rollback
+from django.test.utils import (
+    CaptureQueriesContext,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List
+from unittest import mock
+
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+Result = Dict[str, float]
+# Counters compared against the baseline, as they don't depend on the machine.
+GATED_METRICS = ("queries", "hasher_calls")
+
+
+class HasherCallCounter:
+    """
+    Counts calls to ``encode`` and ``verify`` of configured password hashers.
+    """
+
+    def __init__(self) -> None:
+        self.calls = 0
+        # Codes may be hashed on a pool of threads.
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def count(self) -> Iterator["HasherCallCounter"]:
+        with ExitStack() as stack:
+            for hasher in get_hashers():
+                for method_name in ("encode", "verify"):
+                    stack.enter_context(
+                        mock.patch.object(
+                            hasher,
+                            method_name,
+                            self._wrap(getattr(hasher, method_name)),
+                        )
+                    )
+            yield self
+
+    def _wrap(self, method: Callable) -> Callable:
+        def counted(*args: Any, **kwargs: Any) -> Any:
+            # ``verify`` calls ``encode`` internally, count it only once.
+            depth = getattr(self._local, "depth", 0)
+            if depth == 0:
+                with self._lock:
+                    self.calls += 1
+            self._local.depth = depth + 1
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._local.depth = depth
+
+        return counted
+
+
+def calibrate(repeat: int) -> float:
+    """
+    Returns the median wall time in milliseconds of hashing a password with
+    the default hasher, which dominates the slowest scenarios.
+    """
+    hasher = get_hasher()
+    wall_times = []
+    for _ in range(repeat + 1):
+        start = time.perf_counter()
+        hasher.encode("calibration", hasher.salt())
+        wall_times.append(time.perf_counter() - start)
+    return statistics.median(wall_times[1:]) * 1000
+
+
+def measure(setup: Callable, repeat: int, warmup: int = 1) -> Result:
+    wall_times: List[float] = []
+    cpu_times: List[float] = []
+    queries: List[int] = []
+    hasher_calls: List[int] = []
+    for iteration in range(warmup + repeat):
+        with atomic():
+            request = setup()
+            hasher_counter = HasherCallCounter()
+            with CaptureQueriesContext(connection) as context:
+                with hasher_counter.count():
+                    wall_start, cpu_start = time.perf_counter(), time.process_time()
+                    response = request()
+                    wall_times.append(time.perf_counter() - wall_start)
+                    cpu_times.append(time.process_time() - cpu_start)
+            if response.status_code >= 400:
+                raise AssertionError(
+                    f"Unexpected response {response.status_code}: {response.data}"
+                )
+            queries.append(len(context.captured_queries))
+            hasher_calls.append(hasher_counter.calls)
+            set_rollback(True)
+        if iteration < warmup:
+            # Imports, URL resolution, template loading etc. happen once.
+            wall_times.clear()
+            cpu_times.clear()
+    return {
+        "wall_ms": round(statistics.median(wall_times) * 1000, 2),
+        "cpu_ms": round(statistics.median(cpu_times) * 1000, 2),
+        "queries": max(queries),
+        "hasher_calls": max(hasher_calls),
+    }
+
+
+def load_baseline(path: Path) -> Dict[str, Result]:
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def to_baseline(result: Result, calibration_ms: float) -> Result:
+    return {
+        "queries": result["queries"],
+        "hasher_calls": result["hasher_calls"],
+        "wall_ratio": round(result["wall_ms"] / calibration_ms, 2),
+    }
+
+
+def compare(results: Dict[str, Result], baseline: Dict[str, Result]) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        for metric in GATED_METRICS:
+            if result[metric] > expected[metric]:
+                regressions.append(
+                    f"{name}: {metric} {expected[metric]} -> {result[metric]}"
+                )
+    return regressions
+
+
+def report(
+    results: Dict[str, Result], baseline: Dict[str, Result], calibration_ms: float
+) -> None:
+    print(f"Calibration: {calibration_ms:.2f} ms per password hash\n")
+    header = (
+        f"{'scenario':<40}{'wall ms':>12}{'cpu ms':>12}{'ratio':>9}"
+        f"{'queries':>9}{'hashes':>8}"
+    )
+    print(header)
+    print("-" * len(header))
+    for name, result in results.items():
+        expected = baseline.get(name, {})
+        print(
+            f"{name:<40}{result['wall_ms']:>12.2f}{result['cpu_ms']:>12.2f}"
+            f"{result['wall_ms'] / calibration_ms:>9.2f}"
+            f"{result['queries']:>9}{result['hasher_calls']:>8}"
+            + (
+                f"  (baseline: ratio {expected['wall_ratio']:.2f}, "
+                f"{expected['queries']} queries, {expected['hasher_calls']} hashes)"
+                if expected
+                else ""
+            )
+        )
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--scenario", action="append", help="Run only the given scenario(s)."
+    )
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Store results as the new baseline instead of comparing.",
+    )
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
+    django.setup()
+    from benchmarks.scenarios import SCENARIOS
+
+    names = args.scenario or list(SCENARIOS)
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        calibration_ms = calibrate(repeat=args.repeat)
+        results = {
+            name: measure(setup=SCENARIOS[name], repeat=args.repeat) for name in names
+        }
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+    if args.save_baseline:
+        baseline = load_baseline(path=args.baseline)
+        baseline.update(
+            (name, to_baseline(result, calibration_ms=calibration_ms))
+            for name, result in results.items()
+        )
+        args.baseline.write_text(json.dumps(baseline, indent=4, sort_keys=True) + "\n")
+        report(results=results, baseline={}, calibration_ms=calibration_ms)
+        return 0
+
+    baseline = load_baseline(path=args.baseline)
+    report(results=results, baseline=baseline, calibration_ms=calibration_ms)
+    regressions = compare(results=results, baseline=baseline)
+    if regressions:
+        print("\nRegressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
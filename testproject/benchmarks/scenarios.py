@@ -0,0 +1,185 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import AbstractUser
+
+from functools import lru_cache
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+from typing import Callable, Dict, List, Tuple
+
+from trench.backends.provider import get_mfa_handler
+from trench.command.create_secret import create_secret_command
+from trench.command.generate_backup_codes import generate_backup_codes_command
+from trench.models import MFABackupCode, MFAMethod
+from trench.utils import user_token_generator
+
+
+User = get_user_model()
+
+Request = Callable[[], Response]
+
+PASSWORD = "secretkey"
+# Methods which can be verified offline, in the order they are activated.
+METHOD_NAMES = ("email", "app", "sms_twilio", "sms_api", "sms_aws", "yubi")
+
+SCENARIOS: Dict[str, Callable[[], Request]] = {}
+
+
+def scenario(name: str) -> Callable:
+    def register(setup: Callable[[], Request]) -> Callable[[], Request]:
+        SCENARIOS[name] = setup
+        return setup
+
+    return register
+
+
+@lru_cache(maxsize=None)
+def get_password_hash() -> str:
+    return make_password(PASSWORD)
+
+
+@lru_cache(maxsize=None)
+def get_backup_codes() -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """
+    Returns backup codes with their hashes, computed once for all runs.
+    """
+    backup_codes = tuple(generate_backup_codes_command())
+    return backup_codes, tuple(make_password(code) for code in backup_codes)
+
+
+def create_user(methods_count: int = 0, methods_active: bool = True) -> AbstractUser:
+    user = User.objects.create(
+        username="benchmark",
+        email="benchmark@example.com",
+        password=get_password_hash(),
+        is_active=True,
+    )
+    _, digests = get_backup_codes()
+    for index, name in enumerate(METHOD_NAMES[:methods_count]):
+        mfa_method = MFAMethod.objects.create(
+            user=user,
+            name=name,
+            secret=create_secret_command(),
+            is_primary=index == 0 and methods_active,
+            is_active=methods_active,
+        )
+        MFABackupCode.objects.replace(mfa_method_id=mfa_method.pk, digests=digests)
+    return user
+
+
+def get_code(user: AbstractUser, name: str) -> str:
+    return get_mfa_handler(
+        mfa_method=MFAMethod.objects.get(user=user, name=name)
+    ).create_code()
+
+
+def authenticated_client(user: AbstractUser) -> APIClient:
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client
+
+
+def post(client: APIClient, path: str, data: Dict) -> Request:
+    return lambda: client.post(path=path, data=data, format="json")
+
+
+def login_data(user: AbstractUser) -> Dict:
+    return {
+        User.USERNAME_FIELD: getattr(user, User.USERNAME_FIELD),
+        "password": PASSWORD,
+    }
+
+
+@scenario("first_step_without_mfa")
+def first_step_without_mfa() -> Request:
+    user = create_user()
+    return post(APIClient(), "/auth/jwt/login/", login_data(user))
+
+
+@scenario("first_step_with_mfa")
+def first_step_with_mfa() -> Request:
+    user = create_user(methods_count=1)
+    return post(APIClient(), "/auth/jwt/login/", login_data(user))
+
+
+def get_last_checked_backup_code(user: AbstractUser, name: str) -> str:
+    """
+    Returns the backup code checked last, so the number of hasher calls
+    does not depend on the order of random digests.
+    """
+    backup_codes, digests = get_backup_codes()
+    mfa_method = MFAMethod.objects.get(user=user, name=name)
+    last_digest = MFABackupCode.objects.list_unused_digests(
+        mfa_method_id=mfa_method.pk
+    )[-1]
+    return backup_codes[digests.index(last_digest)]
+
+
+def second_step(methods_count: int, use_backup_code: bool) -> Request:
+    user = create_user(methods_count=methods_count)
+    code = (
+        get_last_checked_backup_code(user, METHOD_NAMES[0])
+        if use_backup_code
+        else get_code(user, METHOD_NAMES[0])
+    )
+    data = {"ephemeral_token": user_token_generator.make_token(user), "code": code}
+    return post(APIClient(), "/auth/jwt/login/code/", data)
+
+
+def register_second_step_scenarios(methods_counts: List[int]) -> None:
+    for methods_count in methods_counts:
+        for use_backup_code, kind in ((False, "totp"), (True, "backup_code")):
+            scenario(f"second_step_{kind}_{methods_count}_methods")(
+                lambda count=methods_count, backup=use_backup_code: second_step(
+                    methods_count=count, use_backup_code=backup
+                )
+            )
+
+
+register_second_step_scenarios(methods_counts=[1, 3, 6])
+
+
+@scenario("activation")
+def activation() -> Request:
+    user = create_user()
+    return post(authenticated_client(user), "/auth/email/activate/", {})
+
+
+@scenario("activation_confirm")
+def activation_confirm() -> Request:
+    user = create_user(methods_count=1, methods_active=False)
+    return post(
+        authenticated_client(user),
+        "/auth/email/activate/confirm/",
+        {"code": get_code(user, "email")},
+    )
+
+
+@scenario("backup_codes_regeneration")
+def backup_codes_regeneration() -> Request:
+    user = create_user(methods_count=1)
+    return post(
+        authenticated_client(user),
+        "/auth/email/codes/regenerate/",
+        {"code": get_code(user, "email")},
+    )
+
+
+@scenario("deactivation")
+def deactivation() -> Request:
+    user = create_user(methods_count=2)
+    return post(
+        authenticated_client(user),
+        "/auth/app/deactivate/",
+        {"code": get_code(user, "app")},
+    )
+
+
+@scenario("primary_method_change")
+def primary_method_change() -> Request:
+    user = create_user(methods_count=2)
+    return post(
+        authenticated_client(user),
+        "/auth/mfa/change-primary-method/",
+        {"method": "app", "code": get_code(user, "app")},
+    )
@@ -7,13 +7,14 @@ from django.db.transaction import atomic
 
 from os import environ
 from testapp.models import User as UserModel
-from typing import Any, Set, Tuple
+from typing import Any, Callable, Iterable, Set, Tuple
 from yubico_client import Yubico
 from yubico_client.otp import OTP
 
 from trench.command.create_secret import create_secret_command
 from trench.command.generate_backup_codes import generate_backup_codes_command
-from trench.models import MFAMethod as MFAMethodModel
+from trench.hashers import make_backup_code_digest
+from trench.models import MFABackupCode, MFAMethod as MFAMethodModel
 
 
 User = get_user_model()
@@ -34,10 +35,14 @@ def tests_setup_and_teardown():
 
 
 def mfa_method_creator(
-    user: UserModel, method_name: str, is_primary: bool = True, **method_args: Any
+    user: UserModel,
+    method_name: str,
+    is_primary: bool = True,
+    backup_codes: Iterable[str] = (),
+    **method_args: Any,
 ) -> MFAMethodModel:
     MFAMethod = apps.get_model("trench.MFAMethod")
-    return MFAMethod.objects.create(
+    mfa_method = MFAMethod.objects.create(
         user=user,
         secret=method_args.pop("secret", create_secret_command()),
         is_primary=is_primary,
@@ -45,6 +50,8 @@ def mfa_method_creator(
         is_active=method_args.pop("is_active", True),
         **method_args,
     )
+    MFABackupCode.objects.replace(mfa_method_id=mfa_method.pk, digests=backup_codes)
+    return mfa_method
 
 
 @pytest.fixture()
@@ -166,21 +173,30 @@ def active_user_with_non_encrypted_backup_codes() -> Tuple[UserModel, Set[str]]:
     return active_user_with_backup_codes(encrypt_codes=False)
 
 
-def active_user_with_backup_codes(encrypt_codes: bool) -> Tuple[UserModel, Set[str]]:
+@pytest.fixture()
+def active_user_with_hmac_backup_codes() -> Tuple[UserModel, Set[str]]:
+    return active_user_with_backup_codes(
+        encrypt_codes=True, code_hasher=make_backup_code_digest
+    )
+
+
+def active_user_with_backup_codes(
+    encrypt_codes: bool, code_hasher: Callable = make_password
+) -> Tuple[UserModel, Set[str]]:
     user, created = User.objects.get_or_create(
         username="cleopatra",
         email="cleopatra@pyramids.eg",
     )
     backup_codes = generate_backup_codes_command()
-    serialized_backup_codes = MFAMethodModel._BACKUP_CODES_DELIMITER.join(
-        [make_password(code) if encrypt_codes else code for code in backup_codes]
-    )
+    stored_backup_codes = [
+        code_hasher(code) if encrypt_codes else code for code in backup_codes
+    ]
     if created:
         user.set_password("secretkey"),
         user.is_active = True
         user.save()
         mfa_method_creator(
-            user=user, method_name="email", _backup_codes=serialized_backup_codes
+            user=user, method_name="email", backup_codes=stored_backup_codes
         )
     return user, backup_codes
 
@@ -193,36 +209,34 @@ def active_user_with_many_otp_methods() -> Tuple[UserModel, str]:
         email="ramses@thegreat.eg",
     )
     backup_codes = generate_backup_codes_command()
-    encrypted_backup_codes = MFAMethodModel._BACKUP_CODES_DELIMITER.join(
-        [make_password(_) for _ in backup_codes]
-    )
+    encrypted_backup_codes = [make_password(_) for _ in backup_codes]
     if created:
         user.set_password("secretkey"),
         user.is_active = True
         user.save()
         mfa_method_creator(
-            user=user, method_name="email", _backup_codes=encrypted_backup_codes
+            user=user, method_name="email", backup_codes=encrypted_backup_codes
         )
         mfa_method_creator(
             user=user,
             method_name="sms_twilio",
             is_primary=False,
             is_active=True,
-            _backup_codes=encrypted_backup_codes,
+            backup_codes=encrypted_backup_codes,
         )
         mfa_method_creator(
             user=user,
             method_name="app",
             is_primary=False,
             is_active=True,
-            _backup_codes=encrypted_backup_codes,
+            backup_codes=encrypted_backup_codes,
         )
         mfa_method_creator(
             user=user,
             method_name="yubi",
             is_primary=False,
             is_active=True,
-            _backup_codes=encrypted_backup_codes,
+            backup_codes=encrypted_backup_codes,
         )
     return user, next(iter(backup_codes))
 
@@ -275,9 +289,7 @@ def active_user_with_yubi() -> UserModel:
         email="ramses@thegreat.eg",
     )
     backup_codes = generate_backup_codes_command()
-    encrypted_backup_codes = MFAMethodModel._BACKUP_CODES_DELIMITER.join(
-        [make_password(_) for _ in backup_codes]
-    )
+    encrypted_backup_codes = [make_password(_) for _ in backup_codes]
     if created:
         user.set_password("secretkey"),
         user.is_active = True
@@ -286,7 +298,7 @@ def active_user_with_yubi() -> UserModel:
             user=user,
             method_name="yubi",
             secret=FAKE_YUBI_SECRET,
-            _backup_codes=encrypted_backup_codes,
+            backup_codes=encrypted_backup_codes,
         )
     return user
 
@@ -1,9 +1,9 @@
 import pytest
 
-from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AbstractUser
 
+from copy import deepcopy
 from flaky import flaky
 from rest_framework.status import HTTP_200_OK, HTTP_400_BAD_REQUEST
 
@@ -33,11 +33,15 @@ def test_add_user_mfa(active_user):
 
 
 @pytest.mark.django_db
-def test_should_fail_on_add_user_mfa_with_invalid_source_field(active_user: User):
+def test_should_fail_on_add_user_mfa_with_invalid_source_field(
+    active_user: User, settings
+):
     client = TrenchAPIClient()
     client.authenticate(user=active_user)
     secret = create_secret_command()
-    settings.TRENCH_AUTH["MFA_METHODS"]["email"]["SOURCE_FIELD"] = "email_test"
+    trench_auth = deepcopy(settings.TRENCH_AUTH)
+    trench_auth["MFA_METHODS"]["email"]["SOURCE_FIELD"] = "email_test"
+    settings.TRENCH_AUTH = trench_auth
 
     response = client.post(
         path="/auth/email/activate/",
@@ -53,7 +57,6 @@ def test_should_fail_on_add_user_mfa_with_invalid_source_field(active_user: User
         response.data.get("error")
         == "Field name `email_test` is not valid for model `User`."
     )
-    settings.TRENCH_AUTH["MFA_METHODS"]["email"]["SOURCE_FIELD"] = "email"
 
 
 @flaky
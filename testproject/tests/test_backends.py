@@ -1,13 +1,42 @@
 import pytest
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+
+import os
+import sys
+import time
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from asgiref.sync import async_to_sync
+from copy import deepcopy
+from functools import partial
+from typing import Any, List, cast
+from yarl import URL
+from yubico_client import Yubico
 
 from trench.backends.application import ApplicationMessageDispatcher
 from trench.backends.aws import AWSMessageDispatcher
+from trench.backends.base import AbstractMessageDispatcher
+from trench.backends.basic_mail import SendMailMessageDispatcher
+from trench.backends.clients import (
+    ClientRegistry,
+    aclose_http_session,
+    client_registry,
+    get_http_session,
+)
+from trench.backends.queue import AbstractDispatchQueue, ThreadPoolDispatchQueue
+from trench.backends.resilience import acall_provider, bulkhead, call_provider
+from trench.backends.routing import RoutingMessageDispatcher, provider_statistics
 from trench.backends.sms_api import SMSAPIMessageDispatcher
 from trench.backends.twilio import TwilioMessageDispatcher
 from trench.backends.yubikey import YubiKeyMessageDispatcher
+from trench.command.dispatch_message import DispatchMessageCommand
 from trench.exceptions import MissingConfigurationError
+from trench.responses import FailedDispatchResponse, SuccessfulDispatchResponse
+from trench.settings import DEFAULTS, TrenchAPISettings
+from trench.signals import message_dispatch_failed
 
 
 User = get_user_model()
@@ -89,3 +118,610 @@ def test_sms_aws_backend_without_credentials(active_user_with_sms_aws_otp, setti
         mfa_method=auth_method, config=conf
     ).dispatch_message()
     assert response.data.get("details")[:38] == "Could not connect to the endpoint URL:"
+
+
+def test_client_registry_reuses_clients():
+    registry = ClientRegistry()
+    first_client = registry.get(key=("provider", "token"), factory=object)
+    assert registry.get(key=("provider", "token"), factory=object) is first_client
+    assert registry.get(key=("provider", "other"), factory=object) is not first_client
+    registry.clear()
+    assert registry.get(key=("provider", "token"), factory=object) is not first_client
+
+
+def test_client_registry_recreates_clients_after_fork(monkeypatch):
+    registry = ClientRegistry()
+    parent_client = registry.get(key="provider", factory=object)
+    monkeypatch.setattr(target=os, name="getpid", value=lambda: -1)
+    assert registry.get(key="provider", factory=object) is not parent_client
+
+
+@pytest.mark.django_db
+def test_sms_aws_backend_reuses_client(active_user_with_sms_aws_otp, settings):
+    auth_method = active_user_with_sms_aws_otp.mfa_methods.get(name="sms_aws")
+    conf = settings.TRENCH_AUTH["MFA_METHODS"]["sms_aws"]
+    client_registry.clear()
+    AWSMessageDispatcher(mfa_method=auth_method, config=conf).dispatch_message()
+    client = client_registry.get(
+        key=("sns", "access_key", "secret_key", "region", 5, 10), factory=object
+    )
+    AWSMessageDispatcher(mfa_method=auth_method, config=conf).dispatch_message()
+    assert (
+        client_registry.get(
+            key=("sns", "access_key", "secret_key", "region", 5, 10), factory=object
+        )
+        is client
+    )
+
+
+class RecordingDispatchQueue(AbstractDispatchQueue):
+    handlers: List[AbstractMessageDispatcher] = []
+
+    def enqueue(self, handler: AbstractMessageDispatcher) -> None:
+        self.handlers.append(handler)
+
+
+@pytest.mark.django_db
+def test_dispatch_message_command_enqueues_message(
+    active_user_with_email_otp, mailoutbox
+):
+    RecordingDispatchQueue.handlers.clear()
+    command = DispatchMessageCommand(
+        settings=TrenchAPISettings(
+            user_settings={
+                "DISPATCH_QUEUE": f"{__name__}.{RecordingDispatchQueue.__name__}"
+            },
+            defaults=DEFAULTS,
+        )
+    )
+    mfa_method = active_user_with_email_otp.mfa_methods.get(name="email")
+    response = command.execute(mfa_method=mfa_method)
+    assert response.status_code == 202
+    assert len(mailoutbox) == 0
+    (handler,) = RecordingDispatchQueue.handlers
+    assert handler.mfa_method == mfa_method
+
+
+@pytest.mark.django_db
+def test_dispatch_message_command_dispatches_inline_when_required(
+    active_user_with_application_otp,
+):
+    RecordingDispatchQueue.handlers.clear()
+    command = DispatchMessageCommand(
+        settings=TrenchAPISettings(
+            user_settings={
+                "DISPATCH_QUEUE": f"{__name__}.{RecordingDispatchQueue.__name__}"
+            },
+            defaults=DEFAULTS,
+        )
+    )
+    mfa_method = active_user_with_application_otp.mfa_methods.get(name="app")
+    response = command.execute(mfa_method=mfa_method)
+    assert response.status_code == 200
+    assert response.data.get("details").startswith("otpauth://")
+    assert RecordingDispatchQueue.handlers == []
+
+
+@pytest.mark.django_db
+def test_thread_pool_dispatch_queue_delivers_message(
+    active_user_with_email_otp, settings, mailoutbox
+):
+    auth_method = active_user_with_email_otp.mfa_methods.get(name="email")
+    conf = settings.TRENCH_AUTH["MFA_METHODS"]["email"]
+    queue = ThreadPoolDispatchQueue(max_workers=1, max_size=1)
+    queue.enqueue(SendMailMessageDispatcher(mfa_method=auth_method, config=conf))
+    queue.shutdown()
+    assert len(mailoutbox) == 1
+
+
+class FailingMessageDispatcher(SendMailMessageDispatcher):
+    def dispatch_message(self) -> FailedDispatchResponse:
+        return FailedDispatchResponse(details="Provider unavailable.")
+
+
+@pytest.mark.django_db
+def test_thread_pool_dispatch_queue_reports_failed_delivery(
+    active_user_with_email_otp, settings
+):
+    auth_method = active_user_with_email_otp.mfa_methods.get(name="email")
+    conf = settings.TRENCH_AUTH["MFA_METHODS"]["email"]
+    failures = []
+
+    def receiver(sender, mfa_method, response, **kwargs):
+        failures.append((mfa_method, response.data.get("details")))
+
+    message_dispatch_failed.connect(receiver)
+    try:
+        queue = ThreadPoolDispatchQueue(max_workers=1, max_size=1)
+        queue.enqueue(FailingMessageDispatcher(mfa_method=auth_method, config=conf))
+        queue.shutdown()
+    finally:
+        message_dispatch_failed.disconnect(receiver)
+    assert failures == [(auth_method, "Provider unavailable.")]
+
+
+def serve_and_dispatch(handler: AbstractMessageDispatcher, routes: List) -> Any:
+    """
+    Dispatches the message with ``adispatch_message`` while a local server
+    answers requests of the backend with the given routes.
+    """
+
+    async def dispatch(base_url: URL) -> Any:
+        application = web.Application()
+        application.add_routes(routes)
+        server = TestServer(application)
+        await server.start_server()
+        try:
+            cast(Any, handler).API_URL = str(server.make_url(base_url))
+            return await handler.adispatch_message()
+        finally:
+            await aclose_http_session()
+            await server.close()
+
+    return dispatch
+
+
+@pytest.mark.django_db
+def test_twilio_backend_dispatches_message_asynchronously(
+    active_user_with_twilio_otp, settings, monkeypatch
+):
+    monkeypatch.setenv("TWILIO_ACCOUNT_SID", "sid")
+    monkeypatch.setenv("TWILIO_AUTH_TOKEN", "token")
+    requests = []
+
+    async def create_message(request: web.Request) -> web.Response:
+        requests.append((request.path, request.headers["Authorization"]))
+        requests.append(dict(await request.post()))
+        return web.json_response({"sid": "SM1"}, status=201)
+
+    auth_method = active_user_with_twilio_otp.mfa_methods.get(name="sms_twilio")
+    conf = settings.TRENCH_AUTH["MFA_METHODS"]["sms_twilio"]
+    handler = TwilioMessageDispatcher(mfa_method=auth_method, config=conf)
+    response = async_to_sync(
+        serve_and_dispatch(
+            handler, [web.post("/Accounts/sid/Messages.json", create_message)]
+        )
+    )(URL(""))
+    assert response.status_code == 200
+    (path, authorization), data = requests
+    assert authorization == "Basic c2lkOnRva2Vu"
+    assert data["To"] == active_user_with_twilio_otp.phone_number
+    assert data["Body"].startswith("Your verification code is: ")
+
+
+@pytest.mark.django_db
+def test_twilio_backend_reports_asynchronous_dispatch_error(
+    active_user_with_twilio_otp, settings, monkeypatch
+):
+    monkeypatch.setenv("TWILIO_ACCOUNT_SID", "sid")
+    monkeypatch.setenv("TWILIO_AUTH_TOKEN", "token")
+
+    async def create_message(request: web.Request) -> web.Response:
+        return web.json_response(
+            {"code": 21211, "message": "Invalid 'To' Phone Number"}, status=400
+        )
+
+    auth_method = active_user_with_twilio_otp.mfa_methods.get(name="sms_twilio")
+    conf = settings.TRENCH_AUTH["MFA_METHODS"]["sms_twilio"]
+    handler = TwilioMessageDispatcher(mfa_method=auth_method, config=conf)
+    response = async_to_sync(
+        serve_and_dispatch(
+            handler, [web.post("/Accounts/sid/Messages.json", create_message)]
+        )
+    )(URL(""))
+    assert response.status_code == 422
+    assert response.data.get("details") == "Invalid 'To' Phone Number"
+
+
+@pytest.mark.django_db
+def test_sms_api_backend_reports_asynchronous_dispatch_error(
+    active_user_with_sms_otp, settings
+):
+    async def send_sms(request: web.Request) -> web.Response:
+        return web.json_response({"error": 101, "message": "Authorization failed"})
+
+    auth_method = active_user_with_sms_otp.mfa_methods.get(name="sms_api")
+    conf = settings.TRENCH_AUTH["MFA_METHODS"]["sms_api"]
+    handler = SMSAPIMessageDispatcher(mfa_method=auth_method, config=conf)
+    response = async_to_sync(
+        serve_and_dispatch(handler, [web.post("/sms.do", send_sms)])
+    )(URL("/sms.do"))
+    assert response.data.get("details") == "Authorization failed"
+
+
+@pytest.mark.django_db
+def test_sms_aws_backend_signs_asynchronous_dispatch(
+    active_user_with_sms_aws_otp, settings
+):
+    requests = []
+
+    async def publish(request: web.Request) -> web.Response:
+        requests.append((request.headers["Authorization"], dict(await request.post())))
+        return web.Response(
+            status=403,
+            text="<ErrorResponse><Error><Code>InvalidClientTokenId</Code>"
+            "<Message>The security token included in the request is invalid."
+            "</Message></Error></ErrorResponse>",
+        )
+
+    auth_method = active_user_with_sms_aws_otp.mfa_methods.get(name="sms_aws")
+    conf = settings.TRENCH_AUTH["MFA_METHODS"]["sms_aws"]
+    handler = AWSMessageDispatcher(mfa_method=auth_method, config=conf)
+    response = async_to_sync(serve_and_dispatch(handler, [web.post("/", publish)]))(
+        URL("/")
+    )
+    ((authorization, data),) = requests
+    assert authorization.startswith("AWS4-HMAC-SHA256 Credential=access_key/")
+    assert data["Action"] == "Publish"
+    assert data["PhoneNumber"] == active_user_with_sms_aws_otp.phone_number
+    assert response.data.get("details") == (
+        "An error occurred (InvalidClientTokenId) when calling the Publish "
+        "operation: The security token included in the request is invalid."
+    )
+
+
+@pytest.mark.django_db
+def test_yubikey_backend_fails_over_to_next_server_asynchronously(
+    active_user_with_yubi, fake_yubikey, settings, monkeypatch
+):
+    async def fail(request: web.Request) -> web.Response:
+        return web.Response(status=503)
+
+    async def verify(request: web.Request) -> web.Response:
+        return web.Response(text="status=OK\r\n")
+
+    auth_method = active_user_with_yubi.mfa_methods.get(name="yubi")
+    conf = settings.TRENCH_AUTH["MFA_METHODS"]["yubi"]
+    handler = YubiKeyMessageDispatcher(mfa_method=auth_method, config=conf)
+
+    async def validate() -> bool:
+        application = web.Application()
+        application.add_routes([web.get("/fail", fail), web.get("/verify", verify)])
+        server = TestServer(application)
+        await server.start_server()
+        monkeypatch.setattr(
+            "trench.backends.yubikey.Yubico",
+            partial(
+                Yubico,
+                api_urls=(
+                    str(server.make_url(URL("/fail"))),
+                    str(server.make_url(URL("/verify"))),
+                ),
+            ),
+        )
+        try:
+            return await handler.avalidate_code(
+                "cccccccfhcbelrhifnjrrddcgrburluurftrgfdrdifj"
+            )
+        finally:
+            await server.close()
+
+    assert async_to_sync(validate)() is True
+
+
+async def get_session() -> Any:
+    return get_http_session()
+
+
+def test_http_session_is_closed_with_event_loop():
+    sessions = [async_to_sync(get_session)() for _ in range(2)]
+    assert sessions[0] is not sessions[1]
+    assert all(session.closed for session in sessions)
+
+
+def test_http_session_requires_aiohttp(monkeypatch):
+    monkeypatch.setitem(sys.modules, "aiohttp", None)
+    with pytest.raises(ImproperlyConfigured):
+        async_to_sync(get_session)()
+
+
+@pytest.mark.django_db
+def test_email_backend_dispatches_message_in_thread(
+    active_user_with_email_otp, settings, mailoutbox
+):
+    auth_method = active_user_with_email_otp.mfa_methods.get(name="email")
+    conf = settings.TRENCH_AUTH["MFA_METHODS"]["email"]
+    response = async_to_sync(
+        SendMailMessageDispatcher(mfa_method=auth_method, config=conf).adispatch_message
+    )()
+    assert response.status_code == 200
+    assert len(mailoutbox) == 1
+
+
+@pytest.mark.django_db
+def test_dispatch_message_command_reports_failed_asynchronous_delivery(
+    active_user_with_email_otp, settings
+):
+    auth_method = active_user_with_email_otp.mfa_methods.get(name="email")
+    trench_auth = deepcopy(settings.TRENCH_AUTH)
+    trench_auth["MFA_METHODS"]["email"][
+        "HANDLER"
+    ] = f"{__name__}.{FailingMessageDispatcher.__name__}"
+    settings.TRENCH_AUTH = trench_auth
+    failures = []
+
+    def receiver(sender, mfa_method, response, **kwargs):
+        failures.append(response.data.get("details"))
+
+    message_dispatch_failed.connect(receiver)
+    try:
+        command = DispatchMessageCommand(
+            settings=TrenchAPISettings(user_settings={}, defaults=DEFAULTS)
+        )
+        response = async_to_sync(command.aexecute)(mfa_method=auth_method)
+    finally:
+        message_dispatch_failed.disconnect(receiver)
+    assert response.status_code == 422
+    assert failures == ["Provider unavailable."]
+
+
+class FastProviderDispatcher(AbstractMessageDispatcher):
+    DELAY = 0.0
+
+    def dispatch_message(self) -> SuccessfulDispatchResponse:
+        time.sleep(self.DELAY)
+        return SuccessfulDispatchResponse(details=self.__class__.__name__)
+
+
+class SlowProviderDispatcher(FastProviderDispatcher):
+    DELAY = 1.0
+
+
+def get_routing_config(hedge_delay=None, **providers: type) -> Any:
+    trench_settings = TrenchAPISettings(
+        user_settings={
+            "MFA_METHODS": {
+                "sms": {
+                    "HANDLER": "trench.backends.routing.RoutingMessageDispatcher",
+                    "SOURCE_FIELD": "phone_number",
+                    "VALIDITY_PERIOD": 60,
+                    "HEDGE_DELAY": hedge_delay,
+                    "PROVIDERS": {
+                        name: {"HANDLER": f"{__name__}.{handler.__name__}"}
+                        for name, handler in providers.items()
+                    },
+                }
+            }
+        },
+        defaults=DEFAULTS,
+    )
+    return trench_settings.MFA_METHODS["sms"]
+
+
+def test_routing_providers_share_code_settings_of_method():
+    config = get_routing_config(first=FastProviderDispatcher)
+    provider_config = config["PROVIDERS"]["first"]
+    assert provider_config["HANDLER"] is FastProviderDispatcher
+    assert provider_config["VALIDITY_PERIOD"] == 60
+    assert provider_config["SOURCE_FIELD"] == "phone_number"
+
+
+def test_provider_statistics_rank_providers_by_expected_time_to_success():
+    provider_statistics.clear()
+    provider_statistics.record("slow", latency=2.0, succeeded=True)
+    provider_statistics.record("fast", latency=0.5, succeeded=True)
+    assert provider_statistics.rank(["slow", "fast", "new"]) == ["fast", "new", "slow"]
+    for _ in range(7):
+        provider_statistics.record("fast", latency=0.5, succeeded=False)
+    assert provider_statistics.rank(["slow", "fast"]) == ["slow", "fast"]
+    assert provider_statistics.snapshot()["fast"].failures == 7
+    provider_statistics.clear()
+
+
+@pytest.mark.django_db
+def test_routing_backend_fails_over_to_next_provider(active_user_with_twilio_otp):
+    provider_statistics.clear()
+    mfa_method = active_user_with_twilio_otp.mfa_methods.get(name="sms_twilio")
+    handler = RoutingMessageDispatcher(
+        mfa_method=mfa_method,
+        config=get_routing_config(
+            failing=FailingMessageDispatcher, fast=FastProviderDispatcher
+        ),
+    )
+    response = handler.dispatch_message()
+    assert response.data.get("details") == "FastProviderDispatcher"
+    statistics = provider_statistics.snapshot()
+    assert statistics["failing"].failures == 1
+    assert statistics["fast"].dispatches == 1
+    provider_statistics.clear()
+
+
+@pytest.mark.django_db
+def test_routing_backend_returns_last_failure(active_user_with_twilio_otp):
+    provider_statistics.clear()
+    mfa_method = active_user_with_twilio_otp.mfa_methods.get(name="sms_twilio")
+    handler = RoutingMessageDispatcher(
+        mfa_method=mfa_method,
+        config=get_routing_config(failing=FailingMessageDispatcher),
+    )
+    response = handler.dispatch_message()
+    assert response.status_code == 422
+    assert response.data.get("details") == "Provider unavailable."
+    provider_statistics.clear()
+
+
+@pytest.mark.django_db
+def test_routing_backend_hedges_slow_provider(active_user_with_twilio_otp):
+    provider_statistics.clear()
+    mfa_method = active_user_with_twilio_otp.mfa_methods.get(name="sms_twilio")
+    handler = RoutingMessageDispatcher(
+        mfa_method=mfa_method,
+        config=get_routing_config(
+            hedge_delay=0.05, slow=SlowProviderDispatcher, fast=FastProviderDispatcher
+        ),
+    )
+    start = time.perf_counter()
+    response = handler.dispatch_message()
+    assert time.perf_counter() - start < SlowProviderDispatcher.DELAY
+    assert response.data.get("details") == "FastProviderDispatcher"
+    assert provider_statistics.snapshot()["slow"].hedges == 1
+    provider_statistics.clear()
+
+
+@pytest.mark.django_db
+def test_routing_backend_hedges_slow_provider_asynchronously(
+    active_user_with_twilio_otp,
+):
+    provider_statistics.clear()
+    mfa_method = active_user_with_twilio_otp.mfa_methods.get(name="sms_twilio")
+    handler = RoutingMessageDispatcher(
+        mfa_method=mfa_method,
+        config=get_routing_config(
+            hedge_delay=0.05, slow=SlowProviderDispatcher, fast=FastProviderDispatcher
+        ),
+    )
+
+    async def dispatch() -> Any:
+        start = time.perf_counter()
+        response = await handler.adispatch_message()
+        return response, time.perf_counter() - start
+
+    response, duration = async_to_sync(dispatch)()
+    assert duration < SlowProviderDispatcher.DELAY
+    assert response.data.get("details") == "FastProviderDispatcher"
+    assert provider_statistics.snapshot()["slow"].hedges == 1
+    provider_statistics.clear()
+
+
+@pytest.mark.django_db
+def test_sms_aws_backend_sets_timeouts(active_user_with_sms_aws_otp, settings):
+    auth_method = active_user_with_sms_aws_otp.mfa_methods.get(name="sms_aws")
+    conf = {
+        **settings.TRENCH_AUTH["MFA_METHODS"]["sms_aws"],
+        "CONNECT_TIMEOUT": 1,
+        "READ_TIMEOUT": 2,
+    }
+    client_registry.clear()
+    AWSMessageDispatcher(mfa_method=auth_method, config=conf).dispatch_message()
+    client = client_registry.get(
+        key=("sns", "access_key", "secret_key", "region", 1, 2), factory=object
+    )
+    assert client.meta.config.connect_timeout == 1
+    assert client.meta.config.read_timeout == 2
+
+
+@pytest.mark.django_db
+def test_email_backend_sets_timeout_of_method_only(
+    active_user_with_email_otp, settings
+):
+    settings.EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+    settings.EMAIL_TIMEOUT = 7
+    auth_method = active_user_with_email_otp.mfa_methods.get(name="email")
+    conf = settings.TRENCH_AUTH["MFA_METHODS"]["email"]
+    handler = SendMailMessageDispatcher(mfa_method=auth_method, config=conf)
+    assert handler._get_connection().timeout == 7
+    handler = SendMailMessageDispatcher(
+        mfa_method=auth_method, config={**conf, "CONNECT_TIMEOUT": 1, "READ_TIMEOUT": 2}
+    )
+    assert handler._get_connection().timeout == 2
+
+
+class CountingFailingMessageDispatcher(FailingMessageDispatcher):
+    calls = 0
+
+    def dispatch_message(self) -> FailedDispatchResponse:
+        CountingFailingMessageDispatcher.calls += 1
+        return super().dispatch_message()
+
+
+@pytest.mark.django_db
+def test_circuit_breaker_fails_fast_after_consecutive_failures(
+    active_user_with_email_otp,
+):
+    cache.clear()
+    CountingFailingMessageDispatcher.calls = 0
+    handler = CountingFailingMessageDispatcher(
+        mfa_method=active_user_with_email_otp.mfa_methods.get(name="email"),
+        config={"CIRCUIT_BREAKER_FAILURES": 2, "CIRCUIT_BREAKER_RESET_TIMEOUT": 60},
+    )
+    for _ in range(2):
+        assert call_provider(handler).data.get("details") == "Provider unavailable."
+    response = call_provider(handler)
+    assert response.status_code == 422
+    assert response.data.get("details").startswith("Message provider is unavailable")
+    response = async_to_sync(acall_provider)(handler)
+    assert response.data.get("details").startswith("Message provider is unavailable")
+    assert CountingFailingMessageDispatcher.calls == 2
+    cache.clear()
+
+
+class FlakyMessageDispatcher(SendMailMessageDispatcher):
+    succeeds = False
+
+    def dispatch_message(self) -> FailedDispatchResponse:
+        if self.succeeds:
+            return SuccessfulDispatchResponse(details="Sent.")
+        return FailedDispatchResponse(details="Provider unavailable.")
+
+
+@pytest.mark.django_db
+def test_circuit_breaker_is_reset_by_successful_call(active_user_with_email_otp):
+    cache.clear()
+    handler = FlakyMessageDispatcher(
+        mfa_method=active_user_with_email_otp.mfa_methods.get(name="email"),
+        config={"CIRCUIT_BREAKER_FAILURES": 2},
+    )
+    call_provider(handler)
+    handler.succeeds = True
+    call_provider(handler)
+    handler.succeeds = False
+    call_provider(handler)
+    assert call_provider(handler).data.get("details") == "Provider unavailable."
+    assert (
+        call_provider(handler)
+        .data.get("details")
+        .startswith("Message provider is unavailable")
+    )
+    cache.clear()
+
+
+@pytest.mark.django_db
+def test_circuit_breaker_is_kept_per_routed_provider(active_user_with_email_otp):
+    cache.clear()
+    CountingFailingMessageDispatcher.calls = 0
+    handler = CountingFailingMessageDispatcher(
+        mfa_method=active_user_with_email_otp.mfa_methods.get(name="email"),
+        config={"CIRCUIT_BREAKER_FAILURES": 1},
+    )
+    call_provider(handler, provider="first")
+    assert (
+        call_provider(handler, provider="first")
+        .data.get("details")
+        .startswith("Message provider is unavailable")
+    )
+    assert call_provider(handler, provider="second").data.get("details") == (
+        "Provider unavailable."
+    )
+    assert CountingFailingMessageDispatcher.calls == 2
+    cache.clear()
+
+
+class ReentrantMessageDispatcher(FastProviderDispatcher):
+    CALLS_PROVIDER = True
+
+    def dispatch_message(self) -> SuccessfulDispatchResponse:
+        nested = call_provider(
+            ReentrantMessageDispatcher(mfa_method=self.mfa_method, config=self.config)
+        )
+        return SuccessfulDispatchResponse(details=nested.data.get("details"))
+
+
+@pytest.mark.django_db
+def test_bulkhead_rejects_calls_over_limit(active_user_with_email_otp):
+    handler = ReentrantMessageDispatcher(
+        mfa_method=active_user_with_email_otp.mfa_methods.get(name="email"),
+        config={"MAX_CONCURRENT_CALLS": 1},
+    )
+    response = call_provider(handler)
+    assert response.data.get("details").startswith("Too many messages")
+
+
+def test_bulkhead_keeps_slots_of_each_limit():
+    slots = bulkhead.get_slots("email", limit=1)
+    assert slots.acquire(blocking=False)
+    try:
+        assert bulkhead.get_slots("email", limit=2) is not slots
+        assert bulkhead.get_slots("email", limit=1) is slots
+        assert not slots.acquire(blocking=False)
+    finally:
+        slots.release()
@@ -1,12 +1,56 @@
 import pytest
 
+from django.contrib.auth.hashers import make_password
+from django.db.models import QuerySet
+
+import threading
+from copy import deepcopy
+from datetime import datetime
+from pyotp import TOTP
+from typing import Callable
+
+from trench.backends.provider import get_mfa_handler
+from trench.command.activate_mfa_method import activate_mfa_method_command
+from trench.command.consume_backup_code import (
+    ConsumeBackupCodeCommand,
+    consume_backup_code_command,
+)
+from trench.command.create_otp import CreateOTPCommand, PreparedTOTP, create_otp_command
 from trench.command.deactivate_mfa_method import deactivate_mfa_method_command
+from trench.command.generate_backup_codes import generate_backup_codes_command
+from trench.command.hash_backup_codes import (
+    HashBackupCodesCommand,
+    backup_codes_hasher,
+    hash_backup_codes_command,
+)
 from trench.command.remove_backup_code import (
     RemoveBackupCodeCommand,
     remove_backup_code_command,
 )
-from trench.exceptions import MFAMethodDoesNotExistError, MFANotEnabledError
-from trench.settings import DEFAULTS, TrenchAPISettings
+from trench.command.replace_mfa_method_backup_codes import (
+    RegenerateBackupCodesForMFAMethodCommand,
+    regenerate_backup_codes_for_mfa_method_command,
+)
+from trench.command.set_primary_mfa_method import set_primary_mfa_method_command
+from trench.command.validate_backup_code import (
+    ValidateBackupCodeCommand,
+    validate_backup_code_command,
+)
+from trench.command.validate_mfa_code import (
+    ValidateMFACodeCommand,
+    validate_mfa_code_command,
+)
+from trench.exceptions import (
+    DeactivationOfPrimaryMFAMethodError,
+    InvalidCodeError,
+    MFAMethodDoesNotExistError,
+    MFANotEnabledError,
+    MFAPrimaryMethodInactiveError,
+)
+from trench.hashers import make_backup_code_digest
+from trench.models import MFABackupCode
+from trench.settings import DEFAULTS, TrenchAPISettings, trench_settings
+from trench.signals import backup_codes_hashing_failed
 from trench.utils import get_mfa_model
 
 
@@ -22,15 +66,25 @@ def test_remove_backup_code_from_non_existing_method(
         )
 
 
+def make_remove_backup_code(settings: TrenchAPISettings) -> Callable:
+    return RemoveBackupCodeCommand(
+        mfa_model=get_mfa_model(),
+        backup_code_consumer=ConsumeBackupCodeCommand(
+            backup_code_model=MFABackupCode,
+            settings=settings,
+            backup_code_validator=ValidateBackupCodeCommand(settings=settings).execute,
+            backup_codes_hasher=hash_backup_codes_command,
+        ).execute,
+    ).execute
+
+
 @pytest.mark.django_db
 def test_remove_not_encrypted_code(active_user_with_non_encrypted_backup_codes):
     user, codes = active_user_with_non_encrypted_backup_codes
     settings = TrenchAPISettings(
         user_settings={"ENCRYPT_BACKUP_CODES": False}, defaults=DEFAULTS
     )
-    remove_backup_code_command = RemoveBackupCodeCommand(
-        mfa_model=get_mfa_model(), settings=settings
-    ).execute
+    remove_backup_code_command = make_remove_backup_code(settings=settings)
     code = next(iter(codes))
     remove_backup_code_command(
         user_id=user.id,
@@ -66,3 +120,465 @@ def test_deactivate_an_only_mfa_method(active_user_with_application_otp):
         len(mfa_model.objects.list_active(user_id=active_user_with_application_otp.id))
         == 0
     )
+
+
+@pytest.mark.django_db
+def test_deactivate_mfa_method(
+    active_user_with_email_and_active_other_methods_otp, django_assert_num_queries
+):
+    user = active_user_with_email_and_active_other_methods_otp
+    with django_assert_num_queries(2):
+        deactivate_mfa_method_command(user_id=user.id, mfa_method_name="app")
+    assert {mfa.name for mfa in user.mfa_methods.filter(is_active=True)} == {
+        "email",
+        "sms_twilio",
+    }
+
+
+@pytest.mark.django_db
+def test_deactivate_primary_mfa_method_with_other_active_methods(
+    active_user_with_email_and_active_other_methods_otp,
+):
+    user = active_user_with_email_and_active_other_methods_otp
+    with pytest.raises(DeactivationOfPrimaryMFAMethodError):
+        deactivate_mfa_method_command(user_id=user.id, mfa_method_name="email")
+
+
+@pytest.mark.django_db
+def test_deactivate_non_existing_mfa_method(active_user_with_application_otp):
+    with pytest.raises(MFAMethodDoesNotExistError):
+        deactivate_mfa_method_command(
+            user_id=active_user_with_application_otp.id, mfa_method_name="email"
+        )
+
+
+@pytest.mark.django_db
+def test_validate_mfa_code_checks_otp_before_backup_codes(
+    active_user_with_encrypted_backup_codes,
+):
+    user, _ = active_user_with_encrypted_backup_codes
+    mfa_method = user.mfa_methods.get(name="email")
+    consumed_backup_codes = []
+    validate_mfa_code = ValidateMFACodeCommand(
+        settings=trench_settings,
+        backup_code_consumer=lambda **kwargs: consumed_backup_codes.append(kwargs),
+    ).execute
+    code = get_mfa_handler(mfa_method=mfa_method).create_code()
+    assert validate_mfa_code(mfa_methods=(mfa_method,), code=code) is True
+    assert consumed_backup_codes == []
+
+
+@pytest.mark.django_db
+def test_validate_mfa_code_skips_codes_not_shaped_like_backup_codes(
+    active_user_with_encrypted_backup_codes,
+):
+    user, _ = active_user_with_encrypted_backup_codes
+    mfa_method = user.mfa_methods.get(name="email")
+    consumed_backup_codes = []
+    validate_mfa_code = ValidateMFACodeCommand(
+        settings=trench_settings,
+        backup_code_consumer=lambda **kwargs: consumed_backup_codes.append(kwargs),
+    ).execute
+    assert validate_mfa_code(mfa_methods=(mfa_method,), code="invalid") is False
+    assert consumed_backup_codes == []
+
+
+@pytest.mark.django_db
+def test_validate_mfa_code_consumes_backup_code(
+    active_user_with_encrypted_backup_codes,
+):
+    user, codes = active_user_with_encrypted_backup_codes
+    mfa_method = user.mfa_methods.get(name="email")
+    assert validate_mfa_code_command(mfa_methods=(mfa_method,), code=codes.pop())
+    assert len(mfa_method.backup_codes) == len(codes)
+
+
+@pytest.mark.django_db
+def test_validate_hmac_backup_code(active_user_with_hmac_backup_codes):
+    user, codes = active_user_with_hmac_backup_codes
+    settings = TrenchAPISettings(
+        user_settings={"HMAC_BACKUP_CODES": True}, defaults=DEFAULTS
+    )
+    validate_backup_code = ValidateBackupCodeCommand(settings=settings).execute
+    mfa_method = user.mfa_methods.get(name="email")
+    code = next(iter(codes))
+    assert validate_backup_code(
+        value=code, backup_codes=mfa_method.backup_codes
+    ) == make_backup_code_digest(code)
+    assert (
+        validate_backup_code(value="0" * 12, backup_codes=mfa_method.backup_codes)
+        is None
+    )
+
+
+@pytest.mark.django_db
+def test_validate_password_hashed_backup_code_with_hmac_enabled(
+    active_user_with_encrypted_backup_codes,
+):
+    user, codes = active_user_with_encrypted_backup_codes
+    settings = TrenchAPISettings(
+        user_settings={"HMAC_BACKUP_CODES": True}, defaults=DEFAULTS
+    )
+    validate_backup_code = ValidateBackupCodeCommand(settings=settings).execute
+    mfa_method = user.mfa_methods.get(name="email")
+    assert validate_backup_code(
+        value=next(iter(codes)), backup_codes=mfa_method.backup_codes
+    )
+
+
+@pytest.mark.django_db
+def test_remove_hmac_backup_code(active_user_with_hmac_backup_codes):
+    user, codes = active_user_with_hmac_backup_codes
+    settings = TrenchAPISettings(
+        user_settings={"HMAC_BACKUP_CODES": True}, defaults=DEFAULTS
+    )
+    remove_backup_code = make_remove_backup_code(settings=settings)
+    code = next(iter(codes))
+    remove_backup_code(user_id=user.id, method_name="email", code=code)
+    mfa_method = user.mfa_methods.get(name="email")
+    assert make_backup_code_digest(code) not in mfa_method.backup_codes
+    assert len(mfa_method.backup_codes) == len(codes) - 1
+    with pytest.raises(InvalidCodeError):
+        remove_backup_code(user_id=user.id, method_name="email", code=code)
+
+
+@pytest.mark.django_db
+def test_consume_backup_code(active_user_with_encrypted_backup_codes):
+    user, codes = active_user_with_encrypted_backup_codes
+    mfa_method = user.mfa_methods.get(name="email")
+    code = codes.pop()
+    assert consume_backup_code_command(mfa_method=mfa_method, code=code) is True
+    assert len(mfa_method.backup_codes) == len(codes)
+    assert consume_backup_code_command(mfa_method=mfa_method, code=code) is False
+
+
+@pytest.mark.django_db
+def test_consume_hmac_backup_code_with_single_query(
+    active_user_with_hmac_backup_codes, django_assert_num_queries
+):
+    user, codes = active_user_with_hmac_backup_codes
+    mfa_method = user.mfa_methods.get(name="email")
+    consume_backup_code = ConsumeBackupCodeCommand(
+        backup_code_model=MFABackupCode,
+        settings=TrenchAPISettings(
+            user_settings={"HMAC_BACKUP_CODES": True}, defaults=DEFAULTS
+        ),
+        backup_code_validator=validate_backup_code_command,
+        backup_codes_hasher=backup_codes_hasher.execute,
+    ).execute
+    with django_assert_num_queries(1):
+        assert consume_backup_code(mfa_method=mfa_method, code=codes.pop())
+    assert len(mfa_method.backup_codes) == len(codes)
+
+
+@pytest.mark.django_db
+def test_consume_plain_backup_code_rehashes_remaining_codes(
+    active_user_with_non_encrypted_backup_codes,
+):
+    user, codes = active_user_with_non_encrypted_backup_codes
+    mfa_method = user.mfa_methods.get(name="email")
+    hashed_code = codes.pop()
+    MFABackupCode.objects.filter(mfa_method=mfa_method, digest=hashed_code).update(
+        digest=make_password(hashed_code)
+    )
+    settings = TrenchAPISettings(
+        user_settings={"HMAC_BACKUP_CODES": True}, defaults=DEFAULTS
+    )
+    consume_backup_code = ConsumeBackupCodeCommand(
+        backup_code_model=MFABackupCode,
+        settings=settings,
+        backup_code_validator=ValidateBackupCodeCommand(settings=settings).execute,
+        backup_codes_hasher=HashBackupCodesCommand(settings=settings).execute,
+    ).execute
+    code = codes.pop()
+    assert consume_backup_code(mfa_method=mfa_method, code=code) is True
+    assert consume_backup_code(mfa_method=mfa_method, code=code) is False
+    remaining_digests = set(mfa_method.backup_codes)
+    assert {make_backup_code_digest(code) for code in codes} < remaining_digests
+    assert len(remaining_digests) == len(codes) + 1
+    assert consume_backup_code(mfa_method=mfa_method, code=codes.pop()) is True
+    assert consume_backup_code(mfa_method=mfa_method, code=hashed_code) is True
+    assert len(mfa_method.backup_codes) == len(codes)
+
+
+@pytest.mark.django_db
+def test_consume_plain_backup_code_keeps_codes_when_rehashing_fails(
+    active_user_with_non_encrypted_backup_codes,
+):
+    user, codes = active_user_with_non_encrypted_backup_codes
+    mfa_method = user.mfa_methods.get(name="email")
+
+    def failing_hasher(backup_codes):
+        raise RuntimeError()
+
+    consume_backup_code = ConsumeBackupCodeCommand(
+        backup_code_model=MFABackupCode,
+        settings=trench_settings,
+        backup_code_validator=validate_backup_code_command,
+        backup_codes_hasher=failing_hasher,
+    ).execute
+    with pytest.raises(RuntimeError):
+        consume_backup_code(mfa_method=mfa_method, code=next(iter(codes)))
+    assert set(mfa_method.backup_codes) == codes
+
+
+@pytest.mark.django_db
+def test_consume_plain_backup_code_writes_nothing_for_wrong_code(
+    active_user_with_non_encrypted_backup_codes, django_assert_num_queries
+):
+    user, codes = active_user_with_non_encrypted_backup_codes
+    mfa_method = user.mfa_methods.get(name="email")
+    # SELECTs of hashed and of plain codes, and no transaction.
+    with django_assert_num_queries(2):
+        assert not consume_backup_code_command(mfa_method=mfa_method, code="wrong")
+    assert set(mfa_method.backup_codes) == codes
+
+
+@pytest.mark.django_db
+def test_activate_mfa_method_keeps_existing_primary(
+    active_user_with_email_and_inactive_other_methods_otp,
+    django_assert_num_queries,
+):
+    user = active_user_with_email_and_inactive_other_methods_otp
+    # SELECTs of the method and of a primary method, UPDATE, DELETE and
+    # INSERT of backup codes, and a savepoint.
+    with django_assert_num_queries(7):
+        backup_codes = activate_mfa_method_command(
+            user_id=user.id, name="app", code="whatever"
+        )
+    app = user.mfa_methods.get(name="app")
+    assert app.is_active is True
+    assert app.is_primary is False
+    assert user.mfa_methods.get(is_primary=True).name == "email"
+    assert len(app.backup_codes) == len(backup_codes)
+    assert len(backup_codes) == trench_settings.BACKUP_CODES_QUANTITY
+
+
+@pytest.mark.django_db
+def test_activate_first_mfa_method_makes_it_primary(active_user):
+    get_mfa_model().objects.create(
+        user=active_user, name="app", secret="secret", is_active=False
+    )
+    activate_mfa_method_command(user_id=active_user.id, name="app", code="whatever")
+    app = active_user.mfa_methods.get(name="app")
+    assert app.is_active is True
+    assert app.is_primary is True
+
+
+@pytest.mark.django_db
+def test_activate_mfa_method_concurrently_with_another_method(
+    active_user_with_email_and_inactive_other_methods_otp, monkeypatch
+):
+    # Simulates the lookup missing a primary method activated concurrently.
+    monkeypatch.setattr(QuerySet, "exists", lambda queryset: False)
+    user = active_user_with_email_and_inactive_other_methods_otp
+    activate_mfa_method_command(user_id=user.id, name="app", code="whatever")
+    app = user.mfa_methods.get(name="app")
+    assert app.is_active is True
+    assert app.is_primary is False
+    assert user.mfa_methods.get(is_primary=True).name == "email"
+
+
+@pytest.mark.django_db
+def test_activate_non_existing_mfa_method(active_user):
+    with pytest.raises(MFAMethodDoesNotExistError):
+        activate_mfa_method_command(user_id=active_user.id, name="app", code="any")
+
+
+@pytest.mark.django_db
+def test_set_primary_mfa_method(
+    active_user_with_email_and_active_other_methods_otp, django_assert_num_queries
+):
+    user = active_user_with_email_and_active_other_methods_otp
+    # Two UPDATEs and a savepoint.
+    with django_assert_num_queries(4):
+        set_primary_mfa_method_command(user_id=user.id, name="app")
+    assert user.mfa_methods.get(is_primary=True).name == "app"
+    set_primary_mfa_method_command(user_id=user.id, name="app")
+    assert user.mfa_methods.get(is_primary=True).name == "app"
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "name,error",
+    (
+        ("sms_twilio", MFAPrimaryMethodInactiveError),
+        ("sms_api", MFAMethodDoesNotExistError),
+    ),
+)
+def test_set_primary_mfa_method_keeps_primary_on_error(
+    active_user_with_email_and_inactive_other_methods_otp, name, error
+):
+    user = active_user_with_email_and_inactive_other_methods_otp
+    with pytest.raises(error):
+        set_primary_mfa_method_command(user_id=user.id, name=name)
+    assert user.mfa_methods.get(is_primary=True).name == "email"
+
+
+def fake_make_backup_code_hash(backup_code, hasher_path=None):
+    return f"{threading.current_thread().name}:{backup_code}"
+
+
+def test_hash_backup_codes_in_parallel(monkeypatch):
+    monkeypatch.setattr(
+        "trench.command.hash_backup_codes.make_backup_code_hash",
+        fake_make_backup_code_hash,
+    )
+    hash_backup_codes_command = HashBackupCodesCommand(
+        settings=TrenchAPISettings(
+            user_settings={"BACKUP_CODES_HASHING_WORKERS": 3}, defaults=DEFAULTS
+        )
+    ).execute
+    backup_codes = [f"code{index}" for index in range(6)]
+    digests = hash_backup_codes_command(backup_codes)
+    assert [digest.split(":")[1] for digest in digests] == backup_codes
+    assert all(digest.startswith("trench-hashing") for digest in digests)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_regenerate_backup_codes_in_background(
+    active_user_with_email_otp, settings, monkeypatch
+):
+    monkeypatch.setattr(
+        "trench.command.hash_backup_codes.make_backup_code_hash",
+        fake_make_backup_code_hash,
+    )
+    settings.TRENCH_AUTH = {
+        **settings.TRENCH_AUTH,
+        "BACKUP_CODES_BACKGROUND_HASHING": True,
+        "BACKUP_CODES_HASHING_WORKERS": 2,
+    }
+    mfa_method = active_user_with_email_otp.mfa_methods.get(name="email")
+    backup_codes = regenerate_backup_codes_for_mfa_method_command(
+        user_id=active_user_with_email_otp.id, name="email"
+    )
+    backup_codes_hasher.shutdown(wait=True)
+    digests = mfa_method.backup_codes
+    assert {digest.split(":")[1] for digest in digests} == backup_codes
+    assert all(digest.startswith("trench-hashing") for digest in digests)
+
+
+def make_background_regeneration(background_codes_hasher):
+    settings = TrenchAPISettings(
+        user_settings={"BACKUP_CODES_BACKGROUND_HASHING": True}, defaults=DEFAULTS
+    )
+    return RegenerateBackupCodesForMFAMethodCommand(
+        settings=settings,
+        mfa_model=get_mfa_model(),
+        backup_code_model=MFABackupCode,
+        codes_generator=generate_backup_codes_command,
+        codes_hasher=hash_backup_codes_command,
+        background_codes_hasher=background_codes_hasher,
+    ).execute
+
+
+@pytest.mark.django_db(transaction=True)
+def test_regenerate_backup_codes_in_background_drops_stale_codes(
+    active_user_with_email_otp,
+):
+    pending = []
+
+    def background_codes_hasher(backup_codes, callback, errback):
+        pending.append(lambda: callback(sorted(backup_codes)))
+
+    regenerate = make_background_regeneration(background_codes_hasher)
+    mfa_method = active_user_with_email_otp.mfa_methods.get(name="email")
+    regenerate(user_id=active_user_with_email_otp.id, name="email")
+    backup_codes = regenerate(user_id=active_user_with_email_otp.id, name="email")
+    # Hashing of the earlier codes completes last.
+    for store in reversed(pending):
+        store()
+    assert set(mfa_method.backup_codes) == backup_codes
+
+
+@pytest.mark.django_db(transaction=True)
+def test_regenerate_backup_codes_in_background_reports_failure(
+    active_user_with_email_otp,
+):
+    failures = []
+
+    def receiver(sender, mfa_method_id, exception, **kwargs):
+        failures.append((mfa_method_id, exception))
+
+    def background_codes_hasher(backup_codes, callback, errback):
+        errback(RuntimeError("Hasher unavailable."))
+
+    regenerate = make_background_regeneration(background_codes_hasher)
+    mfa_method = active_user_with_email_otp.mfa_methods.get(name="email")
+    backup_codes = set(mfa_method.backup_codes)
+    backup_codes_hashing_failed.connect(receiver)
+    try:
+        regenerate(user_id=active_user_with_email_otp.id, name="email")
+    finally:
+        backup_codes_hashing_failed.disconnect(receiver)
+    ((mfa_method_id, exception),) = failures
+    assert mfa_method_id == mfa_method.pk
+    assert str(exception) == "Hasher unavailable."
+    assert set(mfa_method.backup_codes) == backup_codes
+
+
+def test_backup_codes_hasher():
+    settings = TrenchAPISettings(
+        user_settings={
+            "BACKUP_CODES_HASHER": "trench.hashers.BackupCodePBKDF2PasswordHasher",
+            "BACKUP_CODES_HASHING_WORKERS": 1,
+        },
+        defaults=DEFAULTS,
+    )
+    validate_backup_code = ValidateBackupCodeCommand(settings=settings).execute
+    (digest,) = HashBackupCodesCommand(settings=settings).execute(["abcdef123456"])
+    legacy_digest = make_password("123456abcdef")
+    assert digest.startswith("trench_backup_code_pbkdf2_sha256$10000$")
+    assert (
+        validate_backup_code(value="abcdef123456", backup_codes=[legacy_digest, digest])
+        == digest
+    )
+    assert (
+        validate_backup_code(value="123456abcdef", backup_codes=[digest, legacy_digest])
+        == legacy_digest
+    )
+    assert validate_backup_code(value="abcdef654321", backup_codes=[digest]) is None
+
+
+def test_prepared_totp_generates_codes_of_totp():
+    secret = "JBSWY3DPEHPK3PXP"
+    prepared_totp = PreparedTOTP(secret, interval=30)
+    totp = TOTP(secret, interval=30)
+    for for_time in range(0, 10**9, 7919 * 30):
+        assert prepared_totp.at(for_time) == totp.at(for_time)
+
+
+def test_prepared_totp_verifies_codes_of_drift_window():
+    totp = PreparedTOTP("JBSWY3DPEHPK3PXP", interval=30)
+    for_time = 1_700_000_000
+    previous_code = totp.at(for_time - 30)
+    assert totp.verify(totp.at(for_time), for_time=for_time) is True
+    assert totp.verify(previous_code, for_time=for_time) is False
+    assert totp.verify(previous_code, for_time=for_time, valid_window=1) is True
+    assert totp.verify(totp.at(for_time + 60), for_time=for_time, valid_window=1) is (
+        False
+    )
+
+
+def test_create_otp_reuses_totp_instances():
+    create_otp = CreateOTPCommand(
+        settings=TrenchAPISettings(
+            user_settings={"OTP_CACHE_SIZE": 1}, defaults=DEFAULTS
+        )
+    ).execute
+    totp = create_otp(secret="JBSWY3DPEHPK3PXP", interval=30)
+    assert create_otp(secret="JBSWY3DPEHPK3PXP", interval=30) is totp
+    assert create_otp(secret="JBSWY3DPEHPK3PXP", interval=60) is not totp
+    assert create_otp(secret="JBSWY3DPEHPK3PXP", interval=30) is not totp
+
+
+@pytest.mark.django_db
+def test_validate_code_within_drift_window(active_user_with_email_otp, settings):
+    mfa_method = active_user_with_email_otp.mfa_methods.get(name="email")
+    totp = create_otp_command(secret=mfa_method.secret, interval=600)
+    previous_code = totp.at(datetime.now(), counter_offset=-1)
+    assert get_mfa_handler(mfa_method).validate_code(previous_code) is False
+    trench_auth = deepcopy(settings.TRENCH_AUTH)
+    trench_auth["MFA_METHODS"]["email"]["VALID_WINDOW"] = 1
+    settings.TRENCH_AUTH = trench_auth
+    assert get_mfa_handler(mfa_method).validate_code(previous_code) is True
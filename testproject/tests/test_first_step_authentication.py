@@ -4,8 +4,10 @@ from django.contrib.auth import get_user_model
 
 from rest_framework.status import HTTP_200_OK, HTTP_400_BAD_REQUEST
 
-from tests.utils import TrenchAPIClient
+from tests.utils import TrenchAPIClient, call_async_view
+from trench.exceptions import AsyncViewsUnsupportedError
 from trench.utils import user_token_generator
+from trench.views.authtoken import AsyncMFAFirstStepAuthTokenView
 
 
 User = get_user_model()
@@ -85,3 +87,25 @@ def test_login_wrong_password(active_user):
     )
     assert response.status_code == HTTP_400_BAD_REQUEST
     assert response.data.get("error") == "Unable to login with provided credentials."
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_view_returns_token_without_otp(active_user):
+    response = call_async_view(
+        AsyncMFAFirstStepAuthTokenView,
+        data={"username": active_user.username, "password": "secretkey"},
+    )
+    assert response.status_code == HTTP_200_OK
+    assert response.data["auth_token"] == active_user.auth_token.key
+
+    response = call_async_view(
+        AsyncMFAFirstStepAuthTokenView,
+        data={"username": active_user.username, "password": "wrong"},
+    )
+    assert response.status_code == HTTP_400_BAD_REQUEST
+
+
+def test_async_view_requires_django_5(monkeypatch):
+    monkeypatch.setattr("trench.views.base.DJANGO_VERSION", (4, 2, 0, "final", 0))
+    with pytest.raises(AsyncViewsUnsupportedError):
+        AsyncMFAFirstStepAuthTokenView.as_view()
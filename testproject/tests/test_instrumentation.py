@@ -0,0 +1,129 @@
+import pytest
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+
+from asgiref.sync import async_to_sync
+
+from tests.utils import TrenchAPIClient, call_async_view
+from trench.instrumentation import (
+    Measurement,
+    StatsdSink,
+    _execute_query,
+    _install_query_wrapper,
+    capture_measurements,
+    measure,
+)
+from trench.testing import assert_query_budget
+from trench.utils import run_in_executor
+from trench.views.authtoken import AsyncMFAFirstStepAuthTokenView
+
+
+@pytest.mark.django_db
+def test_second_factor_login_is_measured(active_user_with_email_otp):
+    client = TrenchAPIClient()
+    with capture_measurements() as measurements:
+        client.authenticate_multi_factor(
+            mfa_method=active_user_with_email_otp.mfa_methods.first(),
+            user=active_user_with_email_otp,
+        )
+    by_name = {measurement.name: measurement for measurement in measurements}
+    assert {
+        "view.MFAFirstStepJWTView",
+        "command.authenticate_user",
+        "command.dispatch_message",
+        "view.MFASecondStepJWTView",
+        "command.authenticate_second_factor",
+        "command.validate_mfa_code",
+    } <= set(by_name)
+    assert by_name["command.authenticate_user"].hash_calls == 1
+    assert by_name["view.MFAFirstStepJWTView"].hash_calls == 1
+    assert by_name["command.dispatch_message"].provider_time > 0
+    assert (
+        by_name["view.MFASecondStepJWTView"].queries
+        >= by_name["command.authenticate_second_factor"].queries
+        > 0
+    )
+
+
+@pytest.mark.django_db
+def test_query_budget(active_user_with_email_otp):
+    with assert_query_budget(name="view.MFAFirstStepJWTView", max_queries=10):
+        TrenchAPIClient().authenticate(user=active_user_with_email_otp)
+    with pytest.raises(AssertionError, match="budget is 0"):
+        with assert_query_budget(name="view.MFAFirstStepJWTView", max_queries=0):
+            TrenchAPIClient().authenticate(user=active_user_with_email_otp)
+    with pytest.raises(AssertionError, match="was not called"):
+        with assert_query_budget(name="command.activate_mfa_method", max_queries=10):
+            TrenchAPIClient().authenticate(user=active_user_with_email_otp)
+
+
+class FakeStatsClient:
+    def __init__(self):
+        self.stats = {}
+
+    def timing(self, stat, value):
+        self.stats[stat] = value
+
+    def incr(self, stat, count=1):
+        self.stats[stat] = count
+
+
+@pytest.mark.django_db
+def test_measurements_are_passed_to_sinks(settings, active_user_with_email_otp):
+    received = []
+    stats_client = FakeStatsClient()
+    settings.TRENCH_AUTH = {
+        **settings.TRENCH_AUTH,
+        "INSTRUMENTATION_SINKS": (received.append, StatsdSink(client=stats_client)),
+    }
+    TrenchAPIClient().authenticate(user=active_user_with_email_otp)
+    assert all(isinstance(measurement, Measurement) for measurement in received)
+    assert "view.MFAFirstStepJWTView" in {measurement.name for measurement in received}
+    assert stats_client.stats["trench.view.MFAFirstStepJWTView.hash_calls"] == 1
+    assert stats_client.stats["trench.view.MFAFirstStepJWTView.queries"] > 0
+
+
+@pytest.mark.django_db
+def test_nothing_is_measured_without_sinks(monkeypatch, active_user_with_email_otp):
+    measured = []
+    monkeypatch.setattr("trench.instrumentation.Measurement", measured.append)
+    TrenchAPIClient().authenticate(user=active_user_with_email_otp)
+    assert measured == []
+
+
+def test_query_wrapper_is_kept_by_other_execute_wrappers():
+    def wrapper(execute, sql, params, many, context):
+        return execute(sql, params, many, context)
+
+    connection.execute_wrappers.remove(_execute_query)
+    with connection.execute_wrapper(wrapper):
+        # As when the connection is opened within the block.
+        _install_query_wrapper(connection)
+    assert connection.execute_wrappers == [_execute_query]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_queries_in_executor_threads_are_measured(active_user):
+    async def count_users() -> int:
+        with measure("count_users"):
+            return await run_in_executor(get_user_model().objects.count)()
+
+    with capture_measurements() as measurements:
+        assert async_to_sync(count_users)() == 1
+    assert measurements[0].queries == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_view_queries_are_measured(active_user):
+    with capture_measurements() as measurements:
+        call_async_view(
+            AsyncMFAFirstStepAuthTokenView,
+            data={"username": active_user.username, "password": "secretkey"},
+        )
+    view_measurement = next(
+        measurement
+        for measurement in measurements
+        if measurement.name == "view.AsyncMFAFirstStepAuthTokenView"
+    )
+    assert view_measurement.queries > 0
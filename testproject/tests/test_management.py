@@ -0,0 +1,112 @@
+import pytest
+
+from django.contrib.auth.hashers import check_password
+from django.core.management import CommandError, call_command
+
+import csv
+import json
+import pyotp
+import stat
+from io import StringIO
+
+from trench.models import MFABackupCode
+from trench.settings import trench_settings
+from trench.utils import get_mfa_model
+
+
+@pytest.mark.django_db
+def test_enroll_mfa_methods_from_csv(
+    active_user, active_user_with_email_and_inactive_other_methods_otp, tmp_path
+):
+    input_path = tmp_path / "enrollments.csv"
+    input_path.write_text(
+        "user,method\n"
+        "hetephernebti,email\n"
+        "hetephernebti,app\n"
+        "imhotep,app\n"
+        "imhotep,email\n"
+        "nobody,email\n"
+        "hetephernebti,carrier_pigeon\n"
+        "hetephernebti,yubi\n"
+    )
+    stdout, stderr = StringIO(), StringIO()
+    call_command(
+        "enroll_mfa_methods",
+        str(input_path),
+        "--workers=0",
+        "--chunk-size=2",
+        stdout=stdout,
+        stderr=stderr,
+    )
+
+    lines = stdout.getvalue().splitlines()
+    assert lines[0] == "user,method,backup_codes,provisioning_uri"
+    rows = list(csv.reader(lines[1:]))
+    assert [row[:2] for row in rows] == [
+        ["hetephernebti", "email"],
+        ["hetephernebti", "app"],
+        ["imhotep", "app"],
+    ]
+    mfa_model = get_mfa_model()
+    for username, name, backup_codes, provisioning_uri in rows:
+        mfa_method = mfa_model.objects.get(user__username=username, name=name)
+        assert mfa_method.is_active is True
+        assert mfa_method.secret
+        if name == "app":
+            assert pyotp.parse_uri(provisioning_uri).secret == mfa_method.secret
+        else:
+            assert provisioning_uri == ""
+        digests = mfa_method.backup_codes
+        codes = backup_codes.split(" ")
+        assert len(codes) == len(digests) == trench_settings.BACKUP_CODES_QUANTITY
+        assert any(check_password(codes[0], digest) for digest in digests)
+    assert {
+        user: name
+        for user, name in mfa_model.objects.filter(is_primary=True).values_list(
+            "user__username", "name"
+        )
+    } == {"hetephernebti": "email", "imhotep": "email"}
+    assert not mfa_model.objects.filter(name="yubi").exists()
+    assert "Enrolled 3 MFA methods, skipped 4." in stderr.getvalue()
+    assert "Skipping email of imhotep: method is already active." in stderr.getvalue()
+    assert (
+        "Skipping yubi of hetephernebti: method requires confirmation."
+        in stderr.getvalue()
+    )
+
+
+@pytest.mark.django_db
+def test_enroll_mfa_methods_from_jsonl_with_worker_processes(active_user, tmp_path):
+    input_path = tmp_path / "enrollments.jsonl"
+    input_path.write_text(
+        json.dumps({"user": "hetephernebti", "method": "email"})
+        + "\n\n"
+        + json.dumps({"user": "hetephernebti", "method": "sms_twilio"})
+        + "\n"
+    )
+    output_path = tmp_path / "codes.jsonl"
+    call_command(
+        "enroll_mfa_methods",
+        str(input_path),
+        f"--output={output_path}",
+        "--workers=2",
+        stderr=StringIO(),
+    )
+
+    assert stat.S_IMODE(output_path.stat().st_mode) == 0o600
+    rows = [json.loads(line) for line in output_path.read_text().splitlines()]
+    assert "provisioning_uri" not in rows[0]
+    assert [(row["user"], row["method"]) for row in rows] == [
+        ("hetephernebti", "email"),
+        ("hetephernebti", "sms_twilio"),
+    ]
+    assert MFABackupCode.objects.filter(
+        mfa_method__user=active_user, used_at__isnull=True
+    ).count() == 2 * len(rows[0]["backup_codes"])
+
+
+def test_enroll_mfa_methods_with_invalid_input(tmp_path):
+    input_path = tmp_path / "enrollments.csv"
+    input_path.write_text("username,name\nadmin,email\n")
+    with pytest.raises(CommandError):
+        call_command("enroll_mfa_methods", str(input_path), "--workers=0")
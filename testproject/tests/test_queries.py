@@ -1,10 +1,176 @@
 import pytest
 
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+
+from asgiref.sync import async_to_sync
+from copy import deepcopy
+
+from trench.backends.provider import get_mfa_handler
+from trench.cache import MFAMethodCache, mfa_method_cache
+from trench.command.deactivate_mfa_method import deactivate_mfa_method_command
+from trench.command.set_primary_mfa_method import set_primary_mfa_method_command
 from trench.exceptions import MFAMethodDoesNotExistError
+from trench.hashers import make_backup_code_digest
+from trench.models import MFABackupCode, MFAMethod
+from trench.query.count_legacy_backup_codes import CountLegacyBackupCodesQuery
 from trench.query.get_mfa_config_by_name import get_mfa_config_by_name_query
+from trench.settings import DEFAULTS, TrenchAPISettings
+from trench.utils import get_mfa_model
 
 
 @pytest.mark.django_db
 def test_get_non_existing_mfa_method_by_name():
     with pytest.raises(MFAMethodDoesNotExistError):
         get_mfa_config_by_name_query(name="not_existing")
+
+
+def test_backup_codes_reference_configured_mfa_model():
+    field = MFABackupCode._meta.get_field("mfa_method")
+    assert field.related_model is get_mfa_model()
+
+
+@pytest.mark.django_db
+def test_backup_codes_are_replaced_by_assignment(
+    active_user_with_non_encrypted_backup_codes,
+):
+    user, _codes = active_user_with_non_encrypted_backup_codes
+    mfa_method = user.mfa_methods.first()
+    mfa_method.backup_codes = ["first", "second"]
+    assert sorted(mfa_method.backup_codes) == ["first", "second"]
+
+
+@pytest.mark.django_db
+def test_count_legacy_backup_codes(active_user_with_hmac_backup_codes):
+    user, codes = active_user_with_hmac_backup_codes
+    mfa_method = user.mfa_methods.get(name="email")
+    MFABackupCode.objects.bulk_create(
+        [
+            MFABackupCode(mfa_method=mfa_method, digest="plaincode"),
+            MFABackupCode(mfa_method=mfa_method, digest=make_password("hashedcode")),
+        ]
+    )
+    MFABackupCode.objects.consume(
+        mfa_method_id=mfa_method.pk, digests=(make_backup_code_digest(codes.pop()),)
+    )
+
+    def count_legacy_backup_codes(**user_settings) -> int:
+        return CountLegacyBackupCodesQuery(
+            settings=TrenchAPISettings(user_settings=user_settings, defaults=DEFAULTS),
+            backup_code_model=MFABackupCode,
+        ).execute()
+
+    assert count_legacy_backup_codes(HMAC_BACKUP_CODES=True) == 2
+    assert count_legacy_backup_codes() == len(codes) + 1
+    assert (
+        count_legacy_backup_codes(
+            BACKUP_CODES_HASHER="trench.hashers.BackupCodePBKDF2PasswordHasher"
+        )
+        == len(codes) + 2
+    )
+    assert count_legacy_backup_codes(ENCRYPT_BACKUP_CODES=False) == len(codes) + 1
+
+
+@pytest.mark.django_db
+def test_validating_code_does_not_load_user(
+    active_user_with_email_otp, django_assert_num_queries
+):
+    mfa_method = MFAMethod.objects.get(user=active_user_with_email_otp, name="email")
+    handler = get_mfa_handler(mfa_method)
+    with django_assert_num_queries(0):
+        assert handler.validate_code(handler.create_code()) is True
+
+
+@pytest.mark.django_db
+def test_mfa_method_with_recipient_is_dispatched_without_queries(
+    active_user_with_email_otp, django_assert_num_queries, mailoutbox
+):
+    with django_assert_num_queries(1):
+        mfa_method = MFAMethod.objects.get_by_name(
+            user_id=active_user_with_email_otp.id,
+            name="email",
+            select_recipient=True,
+        )
+    with django_assert_num_queries(0):
+        get_mfa_handler(mfa_method).dispatch_message()
+    assert mailoutbox[0].to == [active_user_with_email_otp.email]
+
+
+@pytest.mark.parametrize(
+    "source_field", ("email", "email.upper", "mfa_methods.first", "missing.field")
+)
+def test_with_recipient_selects_only_one_to_one_relations(source_field, settings):
+    trench_auth = deepcopy(settings.TRENCH_AUTH)
+    trench_auth["MFA_METHODS"]["email"]["SOURCE_FIELD"] = source_field
+    settings.TRENCH_AUTH = trench_auth
+    assert MFAMethod.objects.with_recipient(name="email").query.select_related == {
+        "user": {}
+    }
+
+
+@pytest.fixture
+def mfa_methods_cache(settings) -> MFAMethodCache:
+    settings.TRENCH_AUTH = {**settings.TRENCH_AUTH, "MFA_METHODS_CACHE": "default"}
+    caches["default"].clear()
+    mfa_method_cache.reset_stats()
+    return mfa_method_cache
+
+
+@pytest.mark.django_db
+def test_active_mfa_methods_are_served_from_cache(
+    mfa_methods_cache, active_user_with_email_otp, django_assert_num_queries
+):
+    user_id = active_user_with_email_otp.id
+    with django_assert_num_queries(1):
+        MFAMethod.objects.list_active_methods(user_id=user_id)
+    with django_assert_num_queries(0):
+        mfa_method = MFAMethod.objects.get_primary_active(user_id=user_id)
+        assert MFAMethod.objects.get_primary_active_name(user_id=user_id) == "email"
+    assert mfa_method == active_user_with_email_otp.mfa_methods.get(name="email")
+    assert mfa_method.secret == active_user_with_email_otp.mfa_methods.first().secret
+    assert mfa_methods_cache.get_stats() == {"hits": 2, "misses": 1}
+
+
+@pytest.mark.django_db
+def test_mfa_methods_cache_keeps_no_secrets(
+    mfa_methods_cache, active_user_with_many_otp_methods, django_assert_num_queries
+):
+    user, _ = active_user_with_many_otp_methods
+    MFAMethod.objects.list_active_methods(user_id=user.id)
+    secrets = {mfa_method.secret for mfa_method in user.mfa_methods.all()}
+    record = caches["default"].get(f"trench:mfa_methods:{user.id}")
+    assert not secrets & {value for row in record[1] for value in row}
+    with django_assert_num_queries(1):
+        mfa_methods = MFAMethod.objects.list_active_methods(
+            user_id=user.id, with_secrets=True
+        )
+        assert {mfa_method.secret for mfa_method in mfa_methods} == secrets
+    mfa_method = async_to_sync(MFAMethod.objects.aget_primary_active)(user_id=user.id)
+    assert mfa_method.secret == user.mfa_methods.get(name="email").secret
+
+
+@pytest.mark.django_db
+def test_mfa_methods_cache_is_invalidated_by_commands(
+    mfa_methods_cache, active_user_with_many_otp_methods
+):
+    user, _ = active_user_with_many_otp_methods
+    assert MFAMethod.objects.get_primary_active_name(user_id=user.id) == "email"
+    set_primary_mfa_method_command(user_id=user.id, name="sms_twilio")
+    assert MFAMethod.objects.get_primary_active_name(user_id=user.id) == "sms_twilio"
+    deactivate_mfa_method_command(mfa_method_name="email", user_id=user.id)
+    assert "email" not in {
+        mfa_method.name
+        for mfa_method in MFAMethod.objects.list_active_methods(user_id=user.id)
+    }
+
+
+@pytest.mark.django_db
+def test_mfa_methods_cache_is_invalidated_on_save(
+    mfa_methods_cache, active_user_with_email_otp
+):
+    user_id = active_user_with_email_otp.id
+    MFAMethod.objects.list_active_methods(user_id=user_id)
+    mfa_method = active_user_with_email_otp.mfa_methods.get(name="email")
+    mfa_method.secret = "NEWSECRET"
+    mfa_method.save()
+    assert MFAMethod.objects.get_primary_active(user_id=user_id).secret == "NEWSECRET"
@@ -2,6 +2,7 @@ import pytest
 
 from django.contrib.auth import get_user_model
 
+from copy import deepcopy
 from flaky import flaky
 from rest_framework.status import (
     HTTP_200_OK,
@@ -13,13 +14,15 @@ from rest_framework.test import APIClient
 from time import sleep
 from twilio.base.exceptions import TwilioException, TwilioRestException
 
-from tests.utils import TrenchAPIClient
+from tests.utils import TrenchAPIClient, call_async_view
 from trench.backends.provider import get_mfa_handler
 from trench.command.replace_mfa_method_backup_codes import (
     regenerate_backup_codes_for_mfa_method_command,
 )
 from trench.exceptions import MFAMethodDoesNotExistError
-from trench.models import MFAMethod
+from trench.models import MFABackupCode, MFAMethod
+from trench.views import AsyncMFAMethodRequestCodeView
+from trench.views.jwt import AsyncMFAFirstStepJWTView, AsyncMFASecondStepJWTView
 
 
 User = get_user_model()
@@ -36,17 +39,22 @@ def test_mfa_model(active_user_with_email_otp):
     mfa_method = active_user_with_email_otp.mfa_methods.first()
     assert "email" in str(mfa_method)
 
-    mfa_method.backup_codes = ["test1", "test2"]
-    assert mfa_method.backup_codes == ["test1", "test2"]
-    mfa_method.backup_codes = ""
+    MFABackupCode.objects.replace(
+        mfa_method_id=mfa_method.pk, digests=["test1", "test2"]
+    )
+    assert sorted(mfa_method.backup_codes) == ["test1", "test2"]
+    assert MFABackupCode.objects.consume(
+        mfa_method_id=mfa_method.pk, digests=["test1"]
+    )
+    assert mfa_method.backup_codes == ["test2"]
+    assert "Backup code" in str(mfa_method.backup_code_set.first())
 
 
 @pytest.mark.django_db
 def test_custom_validity_period(active_user_with_email_otp, settings):
-    ORIGINAL_VALIDITY_PERIOD = settings.TRENCH_AUTH["MFA_METHODS"]["email"][
-        "VALIDITY_PERIOD"
-    ]
-    settings.TRENCH_AUTH["MFA_METHODS"]["email"]["VALIDITY_PERIOD"] = 3
+    trench_auth = deepcopy(settings.TRENCH_AUTH)
+    trench_auth["MFA_METHODS"]["email"]["VALIDITY_PERIOD"] = 3
+    settings.TRENCH_AUTH = trench_auth
 
     mfa_method = active_user_with_email_otp.mfa_methods.first()
     client = TrenchAPIClient()
@@ -69,10 +77,6 @@ def test_custom_validity_period(active_user_with_email_otp, settings):
     )
     assert response_second_step.status_code == HTTP_200_OK
 
-    settings.TRENCH_AUTH["MFA_METHODS"]["email"][
-        "VALIDITY_PERIOD"
-    ] = ORIGINAL_VALIDITY_PERIOD
-
 
 @flaky
 @pytest.mark.django_db
@@ -131,6 +135,18 @@ def test_wrong_second_step_verification_with_ephemeral_token(
     assert response.status_code == HTTP_401_UNAUTHORIZED
 
 
+@pytest.mark.django_db
+def test_invalid_ephemeral_token_is_rejected_without_database_queries(
+    django_assert_num_queries,
+):
+    client = TrenchAPIClient()
+    with django_assert_num_queries(0):
+        response = client._second_factor_request(
+            code="123456", ephemeral_token="1-invalid-token"
+        )
+    assert response.status_code == HTTP_401_UNAUTHORIZED
+
+
 @flaky
 @pytest.mark.django_db
 def test_second_method_activation(active_user_with_email_otp):
@@ -186,6 +202,27 @@ def test_use_backup_code(active_user_with_encrypted_backup_codes):
     assert len(mfa_method.backup_codes) == 7
 
 
+@pytest.mark.django_db
+def test_backup_code_is_kept_for_rejected_token(
+    active_user_with_encrypted_backup_codes,
+):
+    client = TrenchAPIClient()
+    active_user, backup_codes = active_user_with_encrypted_backup_codes
+    response_first_step = client._first_factor_request(user=active_user)
+    ephemeral_token = client._extract_ephemeral_token_from_response(
+        response=response_first_step
+    )
+    # Changing the password invalidates the fingerprint of the token.
+    active_user.set_password("newsecretkey")
+    active_user.save()
+    response_second_step = client._second_factor_request(
+        code=backup_codes.pop(), ephemeral_token=ephemeral_token
+    )
+    assert response_second_step.status_code == HTTP_401_UNAUTHORIZED
+    mfa_method = active_user.mfa_methods.first()
+    assert len(mfa_method.backup_codes) == 8
+
+
 @pytest.mark.django_db
 def test_activation_otp(active_user):
     client = TrenchAPIClient()
@@ -651,3 +688,43 @@ def test_get_mfa_config():
         format="json",
     )
     assert response.status_code == HTTP_200_OK
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_views_authenticate_with_email_otp(active_user_with_email_otp):
+    response = call_async_view(
+        AsyncMFAFirstStepJWTView,
+        data={"username": active_user_with_email_otp.username, "password": "secretkey"},
+    )
+    assert response.status_code == HTTP_200_OK
+    assert response.data["method"] == "email"
+    ephemeral_token = response.data["ephemeral_token"]
+    handler = get_mfa_handler(
+        mfa_method=active_user_with_email_otp.mfa_methods.get(name="email")
+    )
+
+    response = call_async_view(
+        AsyncMFASecondStepJWTView,
+        data={"ephemeral_token": ephemeral_token, "code": "invalid"},
+    )
+    assert response.status_code == HTTP_401_UNAUTHORIZED
+
+    response = call_async_view(
+        AsyncMFASecondStepJWTView,
+        data={"ephemeral_token": ephemeral_token, "code": handler.create_code()},
+    )
+    assert response.status_code == HTTP_200_OK
+    assert TrenchAPIClient.get_username_from_jwt(response=response) == (
+        active_user_with_email_otp.username
+    )
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_request_code_view(active_user_with_email_otp, mailoutbox):
+    response = call_async_view(
+        AsyncMFAMethodRequestCodeView, data={}, user=active_user_with_email_otp
+    )
+    assert response.status_code == HTTP_200_OK
+    assert mailoutbox[0].to == [active_user_with_email_otp.email]
+    response = call_async_view(AsyncMFAMethodRequestCodeView, data={})
+    assert response.status_code == HTTP_401_UNAUTHORIZED
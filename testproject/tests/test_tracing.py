@@ -0,0 +1,69 @@
+import pytest
+
+from tests.utils import TrenchAPIClient
+from trench.backends.provider import get_mfa_handler
+from trench.tracing import get_tracer, span
+
+
+@pytest.fixture
+def tracer(settings):
+    settings.TRENCH_AUTH = {
+        **settings.TRENCH_AUTH,
+        "TRACER": "tests.utils.RecordingTracer",
+    }
+    tracer = get_tracer()
+    tracer.spans.clear()
+    return tracer
+
+
+def test_span_is_no_op_without_tracer():
+    assert get_tracer() is None
+    with span("anything", attribute=1):
+        pass
+
+
+@pytest.mark.django_db
+def test_second_factor_login_is_traced(tracer, active_user_with_email_otp):
+    mfa_method = active_user_with_email_otp.mfa_methods.first()
+    client = TrenchAPIClient()
+    response = client._first_factor_request(user=active_user_with_email_otp)
+    ephemeral_token = client._extract_ephemeral_token_from_response(response)
+    first_step_spans = list(tracer.spans)
+    tracer.spans.clear()
+    client._second_factor_request(
+        handler=get_mfa_handler(mfa_method=mfa_method),
+        ephemeral_token=ephemeral_token,
+    )
+
+    assert first_step_spans[0] == ("view.MFAFirstStepJWTView", {}, 0)
+    assert ("command.authenticate_user", {}, 1) in first_step_spans
+    assert (
+        "provider.dispatch_message",
+        {"mfa_method": "email", "handler": "SendMailMessageDispatcher"},
+        2,
+    ) in first_step_spans
+    assert tracer.spans == [
+        ("view.MFASecondStepJWTView", {}, 0),
+        ("command.authenticate_second_factor", {}, 1),
+        ("ephemeral_token.parse", {}, 2),
+        ("ephemeral_token.get_user", {}, 2),
+        ("command.validate_mfa_code", {}, 2),
+        ("otp.verify", {"mfa_method": "email"}, 3),
+    ]
+
+
+@pytest.mark.django_db
+def test_backup_code_hashing_is_traced(
+    tracer, active_user_with_encrypted_backup_codes
+):
+    user, backup_codes = active_user_with_encrypted_backup_codes
+    client = TrenchAPIClient()
+    response = client._first_factor_request(user=user)
+    tracer.spans.clear()
+    client._second_factor_request(
+        code=backup_codes.pop(),
+        ephemeral_token=client._extract_ephemeral_token_from_response(response),
+    )
+    names = [name for name, _, _ in tracer.spans]
+    assert "command.consume_backup_code" in names
+    assert "hasher.check_password" in names
@@ -1,9 +1,15 @@
 import pytest
 
+from copy import deepcopy
+
 from trench.backends.application import ApplicationMessageDispatcher
 from trench.backends.base import AbstractMessageDispatcher
+from trench.backends.basic_mail import SendMailMessageDispatcher
 from trench.backends.provider import get_mfa_handler
+from trench.command.generate_backup_codes import generate_backup_codes_command
+from trench.exceptions import BackupCodesCharactersError
 from trench.models import MFAMethod
+from trench.settings import DEFAULTS, TrenchAPISettings, trench_settings
 from trench.utils import UserTokenGenerator
 
 
@@ -52,3 +58,73 @@ def test_validate_code_yubikey(active_user_with_many_otp_methods):
     yubi_method = active_user.mfa_methods.get(name="yubi")
     handler = get_mfa_handler(mfa_method=yubi_method)
     assert handler.validate_code("t" * 44) is False
+
+
+def test_mfa_methods_settings_are_compiled_without_modifying_user_settings():
+    user_settings = {
+        "MFA_METHODS": {
+            "email": {
+                "HANDLER": "trench.backends.basic_mail.SendMailMessageDispatcher"
+            },
+            "custom": {
+                "HANDLER": "trench.backends.application.ApplicationMessageDispatcher"
+            },
+        }
+    }
+    original_user_settings = deepcopy(user_settings)
+    settings = TrenchAPISettings(user_settings=user_settings, defaults=DEFAULTS)
+    email_config = settings.MFA_METHODS["email"]
+    assert email_config["HANDLER"] is SendMailMessageDispatcher
+    assert email_config["SOURCE_FIELD"] == "email"
+    assert settings.MFA_METHODS["custom"]["HANDLER"] is ApplicationMessageDispatcher
+    assert user_settings == original_user_settings
+    with pytest.raises(TypeError):
+        email_config["SOURCE_FIELD"] = "phone_number"
+
+
+def test_backup_codes_characters_must_not_contain_hash_separator():
+    settings = TrenchAPISettings(
+        user_settings={"BACKUP_CODES_CHARACTERS": "abc$"}, defaults=DEFAULTS
+    )
+    with pytest.raises(BackupCodesCharactersError):
+        settings.BACKUP_CODES_CHARACTERS
+
+
+def test_generate_no_backup_codes():
+    assert generate_backup_codes_command(quantity=0) == set()
+    assert len(generate_backup_codes_command()) == trench_settings.BACKUP_CODES_QUANTITY
+
+
+def test_settings_are_recompiled_on_setting_change(settings):
+    compiled_methods = trench_settings.MFA_METHODS
+    assert trench_settings.MFA_METHODS is compiled_methods
+    trench_auth = deepcopy(settings.TRENCH_AUTH)
+    trench_auth["MFA_METHODS"]["email"]["VALIDITY_PERIOD"] = 3
+    settings.TRENCH_AUTH = trench_auth
+    assert trench_settings.MFA_METHODS["email"]["VALIDITY_PERIOD"] == 3
+
+
+@pytest.mark.django_db
+def test_ephemeral_token_is_parsed_without_database_queries(
+    active_user_with_email_otp, django_assert_num_queries
+):
+    token_generator = UserTokenGenerator()
+    token = token_generator.make_token(active_user_with_email_otp)
+    with django_assert_num_queries(0):
+        ephemeral_token = token_generator.parse_token(token)
+        assert token_generator.parse_token(token[:-1]) is None
+        assert token_generator.parse_token(f"1{token}") is None
+    assert ephemeral_token.user_pk == str(active_user_with_email_otp.pk)
+    assert token_generator.get_user(ephemeral_token) == active_user_with_email_otp
+
+
+@pytest.mark.django_db
+def test_ephemeral_token_is_invalidated_by_password_change(
+    active_user_with_email_otp,
+):
+    token_generator = UserTokenGenerator()
+    token = token_generator.make_token(active_user_with_email_otp)
+    active_user_with_email_otp.set_password("new-password")
+    active_user_with_email_otp.save()
+    assert token_generator.parse_token(token) is not None
+    assert token_generator.check_token(user=None, token=token) is None
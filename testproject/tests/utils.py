@@ -1,15 +1,21 @@
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AbstractUser
+from django.test import AsyncRequestFactory
 
 import jwt
+from asgiref.sync import async_to_sync
+from contextlib import contextmanager
 from rest_framework.response import Response
 from rest_framework.test import APIClient
-from typing import Optional
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import RefreshToken
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Type
 
 from trench.backends.base import AbstractMessageDispatcher
 from trench.backends.provider import get_mfa_handler
 from trench.models import MFAMethod
+from trench.tracing import AbstractTracer
 
 
 User = get_user_model()
@@ -99,3 +105,32 @@ class TrenchAPIClient(APIClient):
             verify=False,
             algorithms=["HS256"],
         ).get(User.USERNAME_FIELD)
+
+
+def call_async_view(
+    view_class: Type[APIView],
+    data: Dict[str, Any],
+    user: Optional[AbstractUser] = None,
+) -> Response:
+    headers = {}
+    if user is not None:
+        headers["authorization"] = f"Bearer {RefreshToken.for_user(user).access_token}"
+    request = AsyncRequestFactory().post(
+        "/", data=data, content_type="application/json", headers=headers
+    )
+    return async_to_sync(view_class.as_view())(request)
+
+
+class RecordingTracer(AbstractTracer):
+    def __init__(self) -> None:
+        self.spans: List[Tuple[str, Dict[str, Any], int]] = []
+        self._depth = 0
+
+    @contextmanager
+    def start_span(self, name: str, attributes: Dict[str, Any]) -> Iterator[None]:
+        self.spans.append((name, attributes, self._depth))
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class TrenchConfig(AppConfig):
     name = "trench"
     verbose_name = "django-trench"
+
+    def ready(self) -> None:
+        from trench.cache import invalidate_mfa_method_cache
+        from trench.utils import get_mfa_model
+
+        mfa_model = get_mfa_model()
+        post_save.connect(invalidate_mfa_method_cache, sender=mfa_model)
+        post_delete.connect(invalidate_mfa_method_cache, sender=mfa_model)
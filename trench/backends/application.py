@@ -24,8 +24,13 @@ class ApplicationMessageDispatcher(AbstractMessageDispatcher):
             logging.error(cause, exc_info=True)  # pragma: nocover
             return FailedDispatchResponse(details=str(cause))  # pragma: nocover
 
-    def _create_qr_link(self, user: User) -> str:
+    def create_provisioning_uri(self, username: str) -> str:
+        """
+        Returns the URI of the secret to be added to an authenticator app.
+        """
         return self._get_otp().provisioning_uri(
-            getattr(user, User.USERNAME_FIELD),
-            trench_settings.APPLICATION_ISSUER_NAME,
+            username, trench_settings.APPLICATION_ISSUER_NAME
         )
+
+    def _create_qr_link(self, user: User) -> str:
+        return self.create_provisioning_uri(getattr(user, User.USERNAME_FIELD))
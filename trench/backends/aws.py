@@ -1,38 +1,127 @@
 from django.utils.translation import gettext_lazy as _
 
-import logging
+import asyncio
 import boto3
-import botocore.exceptions
+import logging
+from botocore.auth import SigV4Auth
+from botocore.awsrequest import AWSRequest
+from botocore.config import Config
+from botocore.credentials import Credentials
+from botocore.exceptions import ClientError, EndpointConnectionError, ReadTimeoutError
+from urllib.parse import urlencode
+from xml.etree import ElementTree
 
 from trench.backends.base import AbstractMessageDispatcher
+from trench.backends.clients import get_http_session, import_aiohttp
 from trench.responses import (
     DispatchResponse,
     FailedDispatchResponse,
     SuccessfulDispatchResponse,
 )
-from trench.settings import AWS_ACCESS_KEY, AWS_SECRET_KEY, AWS_REGION
-from botocore.exceptions import ClientError, EndpointConnectionError
+from trench.settings import AWS_ACCESS_KEY, AWS_REGION, AWS_SECRET_KEY
+
 
 class AWSMessageDispatcher(AbstractMessageDispatcher):
+    SUPPORTS_BACKGROUND_DISPATCH = True
+    CALLS_PROVIDER = True
     _SMS_BODY = _("Your verification code is: ")
     _SUCCESS_DETAILS = _("SMS message with MFA code has been sent.")
+    API_URL = "https://sns.{region}.amazonaws.com/"
 
     def dispatch_message(self) -> DispatchResponse:
+        to = self._to
         try:
-            client = boto3.client(
-                "sns",
-                aws_access_key_id=self._config.get(AWS_ACCESS_KEY),
-                aws_secret_access_key=self._config.get(AWS_SECRET_KEY),
-                region_name=self._config.get(AWS_REGION),
+            access_key = self._config.get(AWS_ACCESS_KEY)
+            secret_key = self._config.get(AWS_SECRET_KEY)
+            region = self._config.get(AWS_REGION)
+            connect_timeout, read_timeout = self._get_timeouts()
+            client = self._get_client(
+                key=(
+                    "sns",
+                    access_key,
+                    secret_key,
+                    region,
+                    connect_timeout,
+                    read_timeout,
+                ),
+                factory=lambda: boto3.client(
+                    "sns",
+                    aws_access_key_id=access_key,
+                    aws_secret_access_key=secret_key,
+                    region_name=region,
+                    config=Config(
+                        connect_timeout=connect_timeout, read_timeout=read_timeout
+                    ),
+                ),
             )
             client.publish(
-                PhoneNumber=self._to,
+                PhoneNumber=to,
                 Message=self._SMS_BODY + self.create_code(),
             )
             return SuccessfulDispatchResponse(details=self._SUCCESS_DETAILS)
         except ClientError as cause:
             logging.error(cause, exc_info=True)
             return FailedDispatchResponse(details=str(cause))
-        except EndpointConnectionError as cause:
+        except (EndpointConnectionError, ReadTimeoutError) as cause:
             logging.error(cause, exc_info=True)
             return FailedDispatchResponse(details=str(cause))
+
+    async def adispatch_message(self) -> DispatchResponse:
+        aiohttp = import_aiohttp()
+        to = await self._aget_to()
+        region = self._config.get(AWS_REGION)
+        request = AWSRequest(
+            method="POST",
+            url=self.API_URL.format(region=region),
+            data=urlencode(
+                {
+                    "Action": "Publish",
+                    "Version": "2010-03-31",
+                    "PhoneNumber": to,
+                    "Message": self._SMS_BODY + self.create_code(),
+                }
+            ),
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+        )
+        SigV4Auth(
+            Credentials(
+                self._config.get(AWS_ACCESS_KEY), self._config.get(AWS_SECRET_KEY)
+            ),
+            "sns",
+            region,
+        ).add_auth(request)
+        try:
+            async with get_http_session().post(
+                request.url,
+                data=request.body,
+                headers=dict(request.headers),
+                timeout=self._get_client_timeout(),
+            ) as response:
+                if response.status < 400:
+                    return SuccessfulDispatchResponse(details=self._SUCCESS_DETAILS)
+                details = self._get_error(await response.text())
+        except (aiohttp.ClientError, asyncio.TimeoutError) as cause:
+            logging.error(cause, exc_info=True)
+            return FailedDispatchResponse(details=str(cause))
+        logging.error(details)
+        return FailedDispatchResponse(details=details)
+
+    @staticmethod
+    def _get_error(payload: str) -> str:
+        """
+        Formats the error returned by SNS the way ``botocore`` does.
+        """
+        try:
+            root = ElementTree.fromstring(payload)
+        except ElementTree.ParseError:
+            return payload
+        code = message = ""
+        for element in root.iter():
+            if element.tag.endswith("}Code") or element.tag == "Code":
+                code = element.text or ""
+            elif element.tag.endswith("}Message") or element.tag == "Message":
+                message = element.text or ""
+        return (
+            f"An error occurred ({code}) when calling the Publish operation: "
+            f"{message}"
+        )
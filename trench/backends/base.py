@@ -1,21 +1,65 @@
 from django.db.models import Model
+from django.utils.functional import cached_property
 
 from abc import ABC, abstractmethod
+from asgiref.sync import sync_to_async
 from pyotp import TOTP
-from typing import Any, Dict, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Callable, Dict, Hashable, Optional, Tuple
 
+from trench.backends.clients import client_registry, import_aiohttp
 from trench.command.create_otp import create_otp_command
 from trench.exceptions import MissingConfigurationError
 from trench.models import MFAMethod
 from trench.responses import DispatchResponse
-from trench.settings import SOURCE_FIELD, VALIDITY_PERIOD, trench_settings
+from trench.settings import (
+    CONNECT_TIMEOUT,
+    READ_TIMEOUT,
+    SOURCE_FIELD,
+    VALID_WINDOW,
+    VALIDITY_PERIOD,
+    trench_settings,
+)
+from trench.tracing import span
+
+
+if TYPE_CHECKING:
+    from aiohttp import ClientTimeout
 
 
 class AbstractMessageDispatcher(ABC):
+    # Whether the message may be delivered after the response has been sent,
+    # i.e. the response does not carry anything the client needs.
+    SUPPORTS_BACKGROUND_DISPATCH = False
+    # Whether the handler sends messages through an external provider, so
+    # that its dispatches are guarded by the bulkhead and circuit breaker.
+    CALLS_PROVIDER = False
+
     def __init__(self, mfa_method: MFAMethod, config: Dict[str, Any]) -> None:
         self._mfa_method = mfa_method
         self._config = config
-        self._to = self._get_source_field()
+
+    @property
+    def mfa_method(self) -> MFAMethod:
+        return self._mfa_method
+
+    @property
+    def config(self) -> Dict[str, Any]:
+        return self._config
+
+    @cached_property
+    def _to(self) -> Optional[str]:
+        """
+        Recipient of the message. Resolved on first use, so that handlers
+        which only validate codes don't load the user.
+        """
+        return self._get_source_field()
+
+    async def _aget_to(self) -> Optional[str]:
+        """
+        Resolves the recipient in a thread, as related objects on the
+        ``SOURCE_FIELD`` path may not be loaded yet.
+        """
+        return await sync_to_async(lambda: self._to)()
 
     def _get_source_field(self) -> Optional[str]:
         if SOURCE_FIELD in self._config:
@@ -63,6 +107,21 @@ class AbstractMessageDispatcher(ABC):
     def dispatch_message(self) -> DispatchResponse:
         raise NotImplementedError  # pragma: no cover
 
+    async def adispatch_message(self) -> DispatchResponse:
+        """
+        Dispatches the message without blocking the event loop. Backends
+        without a native implementation run ``dispatch_message`` in a thread.
+        """
+        return await sync_to_async(self.dispatch_message, thread_sensitive=False)()
+
+    @staticmethod
+    def _get_client(key: Hashable, factory: Callable[[], Any]) -> Any:
+        """
+        Returns provider API client shared by all dispatches in the process.
+        The key should contain everything the client was configured with.
+        """
+        return client_registry.get(key=key, factory=factory)
+
     def create_code(self) -> str:
         return self._get_otp().now()
 
@@ -73,7 +132,17 @@ class AbstractMessageDispatcher(ABC):
         return self.validate_code(code)
 
     def validate_code(self, code: str) -> bool:
-        return self._get_otp().verify(otp=code)
+        with span("otp.verify", mfa_method=self._mfa_method.name):
+            return self._get_otp().verify(
+                otp=code, valid_window=self._get_drift_window()
+            )
+
+    async def avalidate_code(self, code: str) -> bool:
+        """
+        Validates the code without blocking the event loop. OTPs are
+        computed locally, so the code is validated right away by default.
+        """
+        return self.validate_code(code)
 
     def _get_otp(self) -> TOTP:
         return create_otp_command(
@@ -84,3 +153,26 @@ class AbstractMessageDispatcher(ABC):
         return self._config.get(
             VALIDITY_PERIOD, trench_settings.DEFAULT_VALIDITY_PERIOD
         )
+
+    def _get_drift_window(self) -> int:
+        """
+        Returns the number of time steps before and after the current one
+        whose codes are accepted too, to allow for clock drift.
+        """
+        return self._config.get(VALID_WINDOW, trench_settings.DEFAULT_VALID_WINDOW)
+
+    def _get_timeouts(self) -> Tuple[float, float]:
+        """
+        Returns connect and read timeouts of calls to the provider,
+        in seconds.
+        """
+        return (
+            self._config.get(CONNECT_TIMEOUT, trench_settings.DEFAULT_CONNECT_TIMEOUT),
+            self._config.get(READ_TIMEOUT, trench_settings.DEFAULT_READ_TIMEOUT),
+        )
+
+    def _get_client_timeout(self) -> "ClientTimeout":
+        connect_timeout, read_timeout = self._get_timeouts()
+        return import_aiohttp().ClientTimeout(
+            sock_connect=connect_timeout, sock_read=read_timeout
+        )
@@ -1,5 +1,6 @@
 from django.conf import settings
-from django.core.mail import send_mail
+from django.core.mail import get_connection, send_mail
+from django.core.mail.backends.base import BaseEmailBackend
 from django.template.loader import get_template
 from django.utils.translation import gettext_lazy as _
 
@@ -12,10 +13,18 @@ from trench.responses import (
     FailedDispatchResponse,
     SuccessfulDispatchResponse,
 )
-from trench.settings import EMAIL_HTML_TEMPLATE, EMAIL_PLAIN_TEMPLATE, EMAIL_SUBJECT
+from trench.settings import (
+    CONNECT_TIMEOUT,
+    EMAIL_HTML_TEMPLATE,
+    EMAIL_PLAIN_TEMPLATE,
+    EMAIL_SUBJECT,
+    READ_TIMEOUT,
+)
 
 
 class SendMailMessageDispatcher(AbstractMessageDispatcher):
+    SUPPORTS_BACKGROUND_DISPATCH = True
+    CALLS_PROVIDER = True
     _KEY_MESSAGE = "message"
     _SUCCESS_DETAILS = _("Email message with MFA code has been sent.")
 
@@ -31,11 +40,27 @@ class SendMailMessageDispatcher(AbstractMessageDispatcher):
                 from_email=settings.DEFAULT_FROM_EMAIL,
                 recipient_list=(self._to,),
                 fail_silently=False,
+                connection=self._get_connection(),
             )
             return SuccessfulDispatchResponse(details=self._SUCCESS_DETAILS)
         except SMTPException as cause:  # pragma: nocover
             logging.error(cause, exc_info=True)  # pragma: nocover
             return FailedDispatchResponse(details=str(cause))  # pragma: nocover
-        except ConnectionRefusedError as cause:  # pragma: nocover
+        except (ConnectionRefusedError, TimeoutError) as cause:  # pragma: nocover
             logging.error(cause, exc_info=True)  # pragma: nocover
             return FailedDispatchResponse(details=str(cause))  # pragma: nocover
+
+    def _get_connection(self) -> BaseEmailBackend:
+        """
+        Returns the email backend, with ``EMAIL_TIMEOUT`` unless the method
+        configures its own timeouts. SMTP connections have a single socket
+        timeout, so the longer one is used.
+        """
+        timeouts = [
+            self._config[field]
+            for field in (CONNECT_TIMEOUT, READ_TIMEOUT)
+            if field in self._config
+        ]
+        if not timeouts:
+            return get_connection()
+        return get_connection(timeout=max(timeouts))
@@ -0,0 +1,119 @@
+import asyncio
+import os
+from threading import Lock
+from types import ModuleType
+from typing import TYPE_CHECKING, Any, Callable, Dict, Hashable, Tuple
+
+from trench.exceptions import AsyncDependencyMissingError
+
+
+if TYPE_CHECKING:
+    from aiohttp import ClientSession
+
+
+class ClientRegistry:
+    """
+    Per-process registry of provider API clients.
+
+    Clients are created once per key (e.g. provider name and credentials) and
+    reused by subsequent dispatches, so their HTTP connection pools are kept
+    alive between requests. The registry is emptied in child processes after
+    ``fork`` (gunicorn, uWSGI), as connections must not be shared between
+    processes.
+    """
+
+    def __init__(self) -> None:
+        self._clients: Dict[Hashable, Any] = {}
+        self._lock = Lock()
+        self._pid = os.getpid()
+
+    def get(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        if self._pid != os.getpid():
+            self._reset()
+        try:
+            return self._clients[key]
+        except KeyError:
+            pass
+        with self._lock:
+            if key not in self._clients:
+                self._clients[key] = factory()
+            return self._clients[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clients.clear()
+
+    def _reset(self) -> None:
+        self._clients = {}
+        self._lock = Lock()
+        self._pid = os.getpid()
+
+
+client_registry = ClientRegistry()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=client_registry._reset)
+
+
+def import_aiohttp() -> ModuleType:
+    """
+    Imports ``aiohttp``, which is only required by the async API of backends.
+    """
+    try:
+        import aiohttp
+    except ImportError as cause:
+        raise AsyncDependencyMissingError(package_name="aiohttp") from cause
+    return aiohttp
+
+
+_http_sessions: Dict[
+    asyncio.AbstractEventLoop, Tuple["ClientSession", "asyncio.Task[None]"]
+] = {}
+
+
+def get_http_session() -> "ClientSession":
+    """
+    Returns the HTTP session shared by async dispatches running on the
+    current event loop, so that connections to providers are reused.
+
+    The session is closed together with its event loop: ``asyncio.run``,
+    which is also used by ``async_to_sync``, cancels the remaining tasks
+    before closing the loop, including the one closing the session.
+    """
+    loop = asyncio.get_running_loop()
+    entry = _http_sessions.get(loop)
+    if entry is not None:
+        session, closer = entry
+        if not session.closed:
+            return session
+        closer.cancel()
+    for closed_loop in [key for key in _http_sessions if key.is_closed()]:
+        # The loop was closed without cancelling its tasks, so there are
+        # no connections left to close.
+        _http_sessions.pop(closed_loop)[0].detach()
+    session = import_aiohttp().ClientSession()
+    _http_sessions[loop] = (session, loop.create_task(_close_with_loop(session)))
+    return session
+
+
+async def _close_with_loop(session: "ClientSession") -> None:
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.create_future()
+    finally:
+        entry = _http_sessions.get(loop)
+        if entry is not None and entry[0] is session:
+            del _http_sessions[loop]
+        await session.close()
+
+
+async def aclose_http_session() -> None:
+    """
+    Closes the HTTP session of the current event loop, e.g. on shutdown of
+    an ASGI application.
+    """
+    entry = _http_sessions.pop(asyncio.get_running_loop(), None)
+    if entry is not None:
+        session, closer = entry
+        closer.cancel()
+        await session.close()
@@ -0,0 +1,140 @@
+from django.db import connections
+
+import logging
+import os
+from abc import ABC, abstractmethod
+from asgiref.sync import sync_to_async
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+from time import perf_counter
+from typing import Optional, Tuple
+
+from trench.backends.base import AbstractMessageDispatcher
+from trench.backends.resilience import acall_provider, call_provider
+from trench.instrumentation import record_provider_time
+from trench.responses import DispatchResponse, FailedDispatchResponse
+from trench.settings import trench_settings
+from trench.signals import message_dispatch_failed
+from trench.tracing import span
+
+
+def deliver_message(handler: AbstractMessageDispatcher) -> DispatchResponse:
+    """
+    Dispatches the message and reports a failed delivery through
+    the ``message_dispatch_failed`` signal.
+    """
+    start = perf_counter()
+    try:
+        with span(
+            "provider.dispatch_message",
+            mfa_method=handler.mfa_method.name,
+            handler=handler.__class__.__name__,
+        ):
+            response = call_provider(handler)
+    finally:
+        record_provider_time(perf_counter() - start)
+    if response.status_code >= 400:
+        report_failed_delivery(handler=handler, response=response)
+    return response
+
+
+async def adeliver_message(handler: AbstractMessageDispatcher) -> DispatchResponse:
+    """
+    Awaits ``adispatch_message`` of the handler and reports a failed
+    delivery like ``deliver_message``.
+    """
+    start = perf_counter()
+    try:
+        with span(
+            "provider.dispatch_message",
+            mfa_method=handler.mfa_method.name,
+            handler=handler.__class__.__name__,
+        ):
+            response = await acall_provider(handler)
+    finally:
+        record_provider_time(perf_counter() - start)
+    if response.status_code >= 400:
+        await sync_to_async(report_failed_delivery)(handler=handler, response=response)
+    return response
+
+
+def report_failed_delivery(
+    handler: AbstractMessageDispatcher, response: DispatchResponse
+) -> None:
+    message_dispatch_failed.send(
+        sender=handler.__class__, mfa_method=handler.mfa_method, response=response
+    )
+
+
+class AbstractDispatchQueue(ABC):
+    @abstractmethod
+    def enqueue(self, handler: AbstractMessageDispatcher) -> None:
+        """
+        Schedules delivery of the message. Implementations should call
+        ``deliver_message`` for the given handler.
+        """
+        raise NotImplementedError  # pragma: no cover
+
+
+class ThreadPoolDispatchQueue(AbstractDispatchQueue):
+    """
+    Delivers messages from a bounded pool of threads in the current process.
+
+    When ``max_size`` messages are already pending, the message is delivered
+    in the calling thread instead, so that codes are never dropped.
+    """
+
+    def __init__(
+        self, max_workers: Optional[int] = None, max_size: Optional[int] = None
+    ) -> None:
+        self._max_workers = max_workers or trench_settings.DISPATCH_QUEUE_WORKERS
+        self._max_size = max_size or trench_settings.DISPATCH_QUEUE_SIZE
+        self._lock = Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots = BoundedSemaphore(self._max_size)
+        self._pid = os.getpid()
+
+    def enqueue(self, handler: AbstractMessageDispatcher) -> None:
+        executor, slots = self._get_executor()
+        if not slots.acquire(blocking=False):
+            logging.warning("Dispatch queue is full, delivering message inline.")
+            deliver_message(handler)
+            return
+        try:
+            executor.submit(self._deliver, handler, slots)
+        except RuntimeError:
+            slots.release()
+            raise
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+    def _get_executor(self) -> Tuple[ThreadPoolExecutor, BoundedSemaphore]:
+        with self._lock:
+            if self._pid != os.getpid():
+                # Worker threads do not survive fork.
+                self._executor = None
+                self._slots = BoundedSemaphore(self._max_size)
+                self._pid = os.getpid()
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._max_workers,
+                    thread_name_prefix="trench-dispatch",
+                )
+            return self._executor, self._slots
+
+    @staticmethod
+    def _deliver(handler: AbstractMessageDispatcher, slots: BoundedSemaphore) -> None:
+        try:
+            deliver_message(handler)
+        except Exception as cause:
+            logging.error(cause, exc_info=True)
+            report_failed_delivery(
+                handler=handler, response=FailedDispatchResponse(details=str(cause))
+            )
+        finally:
+            slots.release()
+            connections.close_all()
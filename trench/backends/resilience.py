@@ -0,0 +1,234 @@
+from django.core.cache import BaseCache, caches
+from django.utils.translation import gettext_lazy as _
+
+import logging
+import os
+from asgiref.sync import sync_to_async
+from threading import BoundedSemaphore, Lock
+from typing import Dict, Optional, Tuple
+
+from trench.backends.base import AbstractMessageDispatcher
+from trench.responses import DispatchResponse, FailedDispatchResponse
+from trench.settings import (
+    CIRCUIT_BREAKER_FAILURES,
+    CIRCUIT_BREAKER_RESET_TIMEOUT,
+    MAX_CONCURRENT_CALLS,
+    TrenchAPISettings,
+    trench_settings,
+)
+
+
+def get_provider_name(
+    handler: AbstractMessageDispatcher, provider: Optional[str] = None
+) -> str:
+    """
+    Names the provider after the configuration of the handler, i.e. its
+    method, followed by its name in ``PROVIDERS`` for routed providers.
+    """
+    method_name = handler.mfa_method.name
+    return method_name if provider is None else f"{method_name}.{provider}"
+
+
+class Bulkhead:
+    """
+    Per-process limit of concurrent calls to each provider, set with
+    ``MAX_CONCURRENT_CALLS``. Calls over the limit are rejected rather than
+    queued, so that a hung provider can't hold every worker.
+
+    Slots are kept per provider and limit, so a changed limit never
+    replaces the slots of calls in progress.
+    """
+
+    def __init__(self) -> None:
+        self._slots: Dict[Tuple[str, int], BoundedSemaphore] = {}
+        self._lock = Lock()
+
+    def get_slots(self, provider: str, limit: int) -> BoundedSemaphore:
+        with self._lock:
+            key = (provider, limit)
+            if key not in self._slots:
+                self._slots[key] = BoundedSemaphore(limit)
+            return self._slots[key]
+
+    def _reset(self) -> None:
+        self._slots = {}
+        self._lock = Lock()
+
+
+class CircuitBreaker:
+    """
+    Stops calling a provider for ``CIRCUIT_BREAKER_RESET_TIMEOUT`` seconds
+    after ``CIRCUIT_BREAKER_FAILURES`` consecutive failed calls.
+
+    The state is kept in the Django cache configured with
+    ``CIRCUIT_BREAKER_CACHE``, so it's shared by all processes using that
+    cache. Once the breaker closes again, a single failed call opens it
+    and a successful one resets the count of failures.
+    """
+
+    _KEY_PREFIX = "trench:circuit_breaker:"
+
+    def __init__(self, settings: TrenchAPISettings) -> None:
+        self._settings = settings
+
+    def is_open(self, provider: str) -> bool:
+        return bool(self._get_cache().get(self._make_key(provider, "open")))
+
+    def record(
+        self,
+        provider: str,
+        succeeded: bool,
+        max_failures: Optional[int],
+        reset_timeout: float,
+    ) -> None:
+        cache = self._get_cache()
+        failures_key = self._make_key(provider, "failures")
+        if succeeded:
+            cache.delete(failures_key)
+            return
+        cache.add(failures_key, 0, timeout=None)
+        try:
+            failures = cache.incr(failures_key)
+        except ValueError:
+            # The count was deleted by a concurrent successful call.
+            return
+        if max_failures is not None and failures >= max_failures:
+            logging.warning(
+                "Circuit breaker of %s is open after %s failed calls.",
+                provider,
+                failures,
+            )
+            cache.set(self._make_key(provider, "open"), True, timeout=reset_timeout)
+            # The next failed call opens the breaker again.
+            cache.set(failures_key, max_failures - 1, timeout=None)
+
+    def _get_cache(self) -> BaseCache:
+        return caches[self._settings.CIRCUIT_BREAKER_CACHE]
+
+    def _make_key(self, provider: str, suffix: str) -> str:
+        return f"{self._KEY_PREFIX}{provider}:{suffix}"
+
+
+bulkhead = Bulkhead()
+circuit_breaker = CircuitBreaker(settings=trench_settings)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=bulkhead._reset)
+
+
+_CIRCUIT_OPEN_DETAILS = _("Message provider is unavailable, try again later.")
+_BULKHEAD_FULL_DETAILS = _("Too many messages are being sent, try again later.")
+
+
+class ProviderCall:
+    """
+    Guards a dispatch of a handler calling an external provider. The call
+    is rejected with a ``FailedDispatchResponse`` while the circuit breaker
+    of the provider is open or its bulkhead is full.
+    """
+
+    def __init__(
+        self, handler: AbstractMessageDispatcher, provider: Optional[str] = None
+    ) -> None:
+        config = handler.config
+        self.provider = get_provider_name(handler, provider=provider)
+        limit = config.get(
+            MAX_CONCURRENT_CALLS, trench_settings.DEFAULT_MAX_CONCURRENT_CALLS
+        )
+        self._slots = (
+            None if limit is None else bulkhead.get_slots(self.provider, limit=limit)
+        )
+        self._max_failures = config.get(
+            CIRCUIT_BREAKER_FAILURES, trench_settings.DEFAULT_CIRCUIT_BREAKER_FAILURES
+        )
+        self._reset_timeout = config.get(
+            CIRCUIT_BREAKER_RESET_TIMEOUT,
+            trench_settings.DEFAULT_CIRCUIT_BREAKER_RESET_TIMEOUT,
+        )
+
+    @property
+    def uses_circuit_breaker(self) -> bool:
+        return self._max_failures is not None
+
+    def enter(self) -> Optional[DispatchResponse]:
+        """
+        Returns the response rejecting the call, or ``None`` when the call
+        may be made. ``exit`` must be called after a call that was made.
+        """
+        if self.uses_circuit_breaker and circuit_breaker.is_open(self.provider):
+            return FailedDispatchResponse(details=_CIRCUIT_OPEN_DETAILS)
+        if self._slots is not None and not self._slots.acquire(blocking=False):
+            logging.warning("Bulkhead of %s is full.", self.provider)
+            return FailedDispatchResponse(details=_BULKHEAD_FULL_DETAILS)
+        return None
+
+    def exit(self, succeeded: bool) -> None:
+        if self._slots is not None:
+            self._slots.release()
+        if self.uses_circuit_breaker:
+            circuit_breaker.record(
+                self.provider,
+                succeeded=succeeded,
+                max_failures=self._max_failures,
+                reset_timeout=self._reset_timeout,
+            )
+
+    async def aenter(self) -> Optional[DispatchResponse]:
+        """
+        Like ``enter``, but reads the state of the circuit breaker from
+        the cache in a thread.
+        """
+        if not self.uses_circuit_breaker:
+            return self.enter()
+        return await sync_to_async(self.enter, thread_sensitive=False)()
+
+    async def aexit(self, succeeded: bool) -> None:
+        if not self.uses_circuit_breaker:
+            self.exit(succeeded=succeeded)
+            return
+        await sync_to_async(self.exit, thread_sensitive=False)(succeeded=succeeded)
+
+
+def call_provider(
+    handler: AbstractMessageDispatcher, provider: Optional[str] = None
+) -> DispatchResponse:
+    """
+    Dispatches the message, guarding handlers with ``CALLS_PROVIDER`` set
+    by the bulkhead and the circuit breaker of their provider. ``provider``
+    is the name of a routed provider in ``PROVIDERS`` of the method.
+    """
+    if not handler.CALLS_PROVIDER:
+        return handler.dispatch_message()
+    call = ProviderCall(handler, provider=provider)
+    rejection = call.enter()
+    if rejection is not None:
+        return rejection
+    succeeded = False
+    try:
+        response = handler.dispatch_message()
+        succeeded = response.status_code < 400
+    finally:
+        call.exit(succeeded=succeeded)
+    return response
+
+
+async def acall_provider(
+    handler: AbstractMessageDispatcher, provider: Optional[str] = None
+) -> DispatchResponse:
+    """
+    Awaits ``adispatch_message`` of the handler, guarded like in
+    ``call_provider``.
+    """
+    if not handler.CALLS_PROVIDER:
+        return await handler.adispatch_message()
+    call = ProviderCall(handler, provider=provider)
+    rejection = await call.aenter()
+    if rejection is not None:
+        return rejection
+    succeeded = False
+    try:
+        response = await handler.adispatch_message()
+        succeeded = response.status_code < 400
+    finally:
+        await call.aexit(succeeded=succeeded)
+    return response
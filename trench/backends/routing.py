@@ -0,0 +1,295 @@
+from django.db import connections
+from django.utils.translation import gettext_lazy as _
+
+import asyncio
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from threading import Lock
+from time import perf_counter
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from trench.backends.base import AbstractMessageDispatcher
+from trench.backends.resilience import acall_provider, call_provider
+from trench.responses import DispatchResponse, FailedDispatchResponse
+from trench.settings import HANDLER, HEDGE_DELAY, PROVIDERS
+from trench.tracing import span
+
+
+class ProviderStats(NamedTuple):
+    dispatches: int
+    failures: int
+    hedges: int
+    latency: float
+    error_rate: float
+
+
+_NO_STATS = ProviderStats(
+    dispatches=0, failures=0, hedges=0, latency=0.0, error_rate=0.0
+)
+
+
+class ProviderStatistics:
+    """
+    Per-process statistics of message providers.
+
+    Latency and error rate are exponentially weighted moving averages, so
+    that recent dispatches matter most. Providers are ranked by the expected
+    time to a successful dispatch, i.e. latency divided by success rate.
+    Providers without dispatches are assumed to answer in
+    ``DEFAULT_LATENCY`` seconds.
+    """
+
+    SMOOTHING = 0.2
+    DEFAULT_LATENCY = 1.0
+    MIN_SUCCESS_RATE = 0.01
+
+    def __init__(self) -> None:
+        self._stats: Dict[str, ProviderStats] = {}
+        self._lock = Lock()
+
+    def record(self, provider: str, latency: float, succeeded: bool) -> None:
+        error = float(not succeeded)
+        with self._lock:
+            stats = self._stats.get(provider, _NO_STATS)
+            if stats.dispatches:
+                latency = self._smooth(stats.latency, latency)
+                error = self._smooth(stats.error_rate, error)
+            self._stats[provider] = stats._replace(
+                dispatches=stats.dispatches + 1,
+                failures=stats.failures + int(not succeeded),
+                latency=latency,
+                error_rate=error,
+            )
+
+    def record_hedge(self, provider: str) -> None:
+        """
+        Counts that another provider was tried, because ``provider``
+        hadn't responded within ``HEDGE_DELAY``.
+        """
+        with self._lock:
+            stats = self._stats.get(provider, _NO_STATS)
+            self._stats[provider] = stats._replace(hedges=stats.hedges + 1)
+
+    def rank(self, providers: Iterable[str]) -> List[str]:
+        """
+        Sorts providers from the most to the least preferred. Configured
+        order is kept for equally ranked providers.
+        """
+        stats = self._stats
+        return sorted(providers, key=lambda provider: self._score(stats.get(provider)))
+
+    def snapshot(self) -> Dict[str, ProviderStats]:
+        """
+        Returns current statistics of providers, e.g. to be reported
+        to dashboards.
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+    def _score(self, stats: Optional[ProviderStats]) -> float:
+        if stats is None or not stats.dispatches:
+            return self.DEFAULT_LATENCY
+        return stats.latency / max(1 - stats.error_rate, self.MIN_SUCCESS_RATE)
+
+    def _smooth(self, average: float, value: float) -> float:
+        return average + self.SMOOTHING * (value - average)
+
+    def _reset(self) -> None:
+        self._stats = {}
+        self._lock = Lock()
+
+
+provider_statistics = ProviderStatistics()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=provider_statistics._reset)
+
+
+class RoutingMessageDispatcher(AbstractMessageDispatcher):
+    """
+    Sends messages of a single method through one of several providers,
+    configured in ``PROVIDERS``.
+
+    Providers are tried in the order of ``provider_statistics.rank``, and
+    the next one is tried when a provider fails. With ``HEDGE_DELAY`` set,
+    the next provider is also tried when the previous one hasn't responded
+    within that many seconds, and the first successful response is returned.
+    """
+
+    SUPPORTS_BACKGROUND_DISPATCH = True
+    HEDGING_WORKERS = 8
+    _NO_PROVIDERS_DETAILS = _("No message providers are configured.")
+
+    _executor: Optional[ThreadPoolExecutor] = None
+    _executor_lock = Lock()
+    _executor_pid = os.getpid()
+    _background_tasks: Set["asyncio.Task[Any]"] = set()
+
+    def dispatch_message(self) -> DispatchResponse:
+        # Related objects of the user are loaded once, before providers
+        # resolve the recipient in other threads.
+        self._to
+        providers = self._rank_providers()
+        hedge_delay = self._config.get(HEDGE_DELAY)
+        if hedge_delay is None:
+            response = FailedDispatchResponse(details=self._NO_PROVIDERS_DETAILS)
+            for provider in providers:
+                response = self._dispatch(provider)
+                if response.status_code < 400:
+                    break
+            return response
+        return self._dispatch_hedged(providers, hedge_delay=hedge_delay)
+
+    async def adispatch_message(self) -> DispatchResponse:
+        await self._aget_to()
+        providers = self._rank_providers()
+        hedge_delay = self._config.get(HEDGE_DELAY)
+        response = FailedDispatchResponse(details=self._NO_PROVIDERS_DETAILS)
+        pending: Dict["asyncio.Task[DispatchResponse]", str] = {}
+        while providers or pending:
+            if providers:
+                provider = providers.pop(0)
+                pending[asyncio.ensure_future(self._adispatch(provider))] = provider[0]
+            done, _running = await asyncio.wait(
+                pending,
+                timeout=hedge_delay if providers else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                self._record_hedges(pending.values())
+                continue
+            for task in done:
+                del pending[task]
+                response = task.result()
+                if response.status_code < 400:
+                    self._keep_in_background(pending)
+                    return response
+        return response
+
+    def _dispatch_hedged(
+        self, providers: List[Tuple[str, AbstractMessageDispatcher]], hedge_delay: float
+    ) -> DispatchResponse:
+        executor = self._get_executor()
+        response = FailedDispatchResponse(details=self._NO_PROVIDERS_DETAILS)
+        pending: Dict[Future, str] = {}
+        while providers or pending:
+            if providers:
+                provider = providers.pop(0)
+                pending[
+                    executor.submit(
+                        copy_context().run, self._dispatch_in_thread, provider
+                    )
+                ] = provider[0]
+            done, _running = wait(
+                pending,
+                timeout=hedge_delay if providers else None,
+                return_when=FIRST_COMPLETED,
+            )
+            if not done:
+                self._record_hedges(pending.values())
+                continue
+            for future in done:
+                del pending[future]
+                response = future.result()
+                if response.status_code < 400:
+                    return response
+        return response
+
+    def _rank_providers(self) -> List[Tuple[str, AbstractMessageDispatcher]]:
+        configs = self._config.get(PROVIDERS, {})
+        return [
+            (
+                name,
+                configs[name][HANDLER](
+                    mfa_method=self._mfa_method, config=configs[name]
+                ),
+            )
+            for name in provider_statistics.rank(configs)
+        ]
+
+    def _dispatch(
+        self, provider: Tuple[str, AbstractMessageDispatcher]
+    ) -> DispatchResponse:
+        name, handler = provider
+        start = perf_counter()
+        try:
+            with span(
+                "provider.route",
+                provider=name,
+                handler=handler.__class__.__name__,
+            ):
+                response = call_provider(handler, provider=name)
+        except Exception as cause:
+            logging.error(cause, exc_info=True)
+            response = FailedDispatchResponse(details=str(cause))
+        self._record(name, response=response, start=start)
+        return response
+
+    async def _adispatch(
+        self, provider: Tuple[str, AbstractMessageDispatcher]
+    ) -> DispatchResponse:
+        name, handler = provider
+        start = perf_counter()
+        try:
+            with span(
+                "provider.route",
+                provider=name,
+                handler=handler.__class__.__name__,
+            ):
+                response = await acall_provider(handler, provider=name)
+        except Exception as cause:
+            logging.error(cause, exc_info=True)
+            response = FailedDispatchResponse(details=str(cause))
+        self._record(name, response=response, start=start)
+        return response
+
+    def _dispatch_in_thread(
+        self, provider: Tuple[str, AbstractMessageDispatcher]
+    ) -> DispatchResponse:
+        try:
+            return self._dispatch(provider)
+        finally:
+            connections.close_all()
+
+    @staticmethod
+    def _record(name: str, response: DispatchResponse, start: float) -> None:
+        if response.status_code >= 400:
+            logging.warning(
+                "Message provider %s failed: %s", name, response.data.get("details")
+            )
+        provider_statistics.record(
+            name,
+            latency=perf_counter() - start,
+            succeeded=response.status_code < 400,
+        )
+
+    @staticmethod
+    def _record_hedges(providers: Iterable[str]) -> None:
+        for provider in providers:
+            provider_statistics.record_hedge(provider)
+
+    @classmethod
+    def _keep_in_background(cls, pending: Iterable["asyncio.Task[Any]"]) -> None:
+        """
+        Lets slower providers finish, so that their statistics are recorded.
+        """
+        for task in pending:
+            cls._background_tasks.add(task)
+            task.add_done_callback(cls._background_tasks.discard)
+
+    @classmethod
+    def _get_executor(cls) -> ThreadPoolExecutor:
+        with cls._executor_lock:
+            if cls._executor is None or cls._executor_pid != os.getpid():
+                # Worker threads do not survive fork.
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=cls.HEDGING_WORKERS, thread_name_prefix="trench-hedging"
+                )
+                cls._executor_pid = os.getpid()
+            return cls._executor
@@ -1,10 +1,13 @@
 from django.utils.translation import gettext_lazy as _
 
+import asyncio
 import logging
+from requests import RequestException
 from smsapi.client import SmsApiPlClient
 from smsapi.exception import SmsApiException
 
 from trench.backends.base import AbstractMessageDispatcher
+from trench.backends.clients import get_http_session, import_aiohttp
 from trench.responses import (
     DispatchResponse,
     FailedDispatchResponse,
@@ -14,20 +17,63 @@ from trench.settings import SMSAPI_ACCESS_TOKEN, SMSAPI_FROM_NUMBER
 
 
 class SMSAPIMessageDispatcher(AbstractMessageDispatcher):
+    SUPPORTS_BACKGROUND_DISPATCH = True
+    CALLS_PROVIDER = True
     _SMS_BODY = _("Your verification code is: ")
     _SUCCESS_DETAILS = _("SMS message with MFA code has been sent.")
+    API_URL = "https://api.smsapi.pl/sms.do"
 
     def dispatch_message(self) -> DispatchResponse:
+        to = self._to
         try:
-            client = SmsApiPlClient(access_token=self._config.get(SMSAPI_ACCESS_TOKEN))
+            access_token = self._config.get(SMSAPI_ACCESS_TOKEN)
+            client = self._get_client(
+                key=("smsapi", access_token),
+                factory=lambda: SmsApiPlClient(access_token=access_token),
+            )
             from_number = self._config.get(SMSAPI_FROM_NUMBER)
             kwargs = {"from_": from_number} if from_number else {}
             client.sms.send(
                 message=self._SMS_BODY + self.create_code(),
-                to=self._to,
+                to=to,
+                # Passed to ``requests``, which accepts a pair of connect and
+                # read timeouts.
+                timeout=self._get_timeouts(),
                 **kwargs,
             )
             return SuccessfulDispatchResponse(details=self._SUCCESS_DETAILS)
         except SmsApiException as cause:
             logging.error(cause, exc_info=True)
             return FailedDispatchResponse(details=cause.message)
+        except RequestException as cause:
+            logging.error(cause, exc_info=True)
+            return FailedDispatchResponse(details=str(cause))
+
+    async def adispatch_message(self) -> DispatchResponse:
+        aiohttp = import_aiohttp()
+        to = await self._aget_to()
+        data = {
+            "to": to,
+            "message": self._SMS_BODY + self.create_code(),
+            "format": "json",
+        }
+        from_number = self._config.get(SMSAPI_FROM_NUMBER)
+        if from_number:
+            data["from"] = from_number
+        try:
+            async with get_http_session().post(
+                self.API_URL,
+                headers={
+                    "Authorization": f"Bearer {self._config.get(SMSAPI_ACCESS_TOKEN)}"
+                },
+                data=data,
+                timeout=self._get_client_timeout(),
+            ) as response:
+                payload = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as cause:
+            logging.error(cause, exc_info=True)
+            return FailedDispatchResponse(details=str(cause))
+        if "error" in payload:
+            logging.error("SMSAPI error: %s", payload)
+            return FailedDispatchResponse(details=payload.get("message"))
+        return SuccessfulDispatchResponse(details=self._SUCCESS_DETAILS)
@@ -1,10 +1,17 @@
 from django.utils.translation import gettext_lazy as _
 
+import asyncio
+import base64
 import logging
-from twilio.base.exceptions import TwilioRestException
+import os
+from requests import RequestException
+from twilio.base.exceptions import TwilioException, TwilioRestException
+from twilio.http.http_client import TwilioHttpClient
 from twilio.rest import Client
+from typing import Tuple
 
 from trench.backends.base import AbstractMessageDispatcher
+from trench.backends.clients import get_http_session, import_aiohttp
 from trench.responses import (
     DispatchResponse,
     FailedDispatchResponse,
@@ -14,18 +21,78 @@ from trench.settings import TWILIO_VERIFIED_FROM_NUMBER
 
 
 class TwilioMessageDispatcher(AbstractMessageDispatcher):
+    SUPPORTS_BACKGROUND_DISPATCH = True
+    CALLS_PROVIDER = True
     _SMS_BODY = _("Your verification code is: ")
     _SUCCESS_DETAILS = _("SMS message with MFA code has been sent.")
+    API_URL = "https://api.twilio.com/2010-04-01"
 
     def dispatch_message(self) -> DispatchResponse:
+        to = self._to
+        timeouts = self._get_timeouts()
         try:
-            client = Client()
+            client = self._get_client(
+                key=(
+                    "twilio",
+                    os.environ.get("TWILIO_ACCOUNT_SID"),
+                    os.environ.get("TWILIO_AUTH_TOKEN"),
+                    timeouts,
+                ),
+                factory=lambda: self._create_client(timeouts),
+            )
             client.messages.create(
                 body=self._SMS_BODY + self.create_code(),
-                to=self._to,
+                to=to,
                 from_=self._config.get(TWILIO_VERIFIED_FROM_NUMBER),
             )
             return SuccessfulDispatchResponse(details=self._SUCCESS_DETAILS)
         except TwilioRestException as cause:
             logging.error(cause, exc_info=True)
             return FailedDispatchResponse(details=cause.msg)
+        except RequestException as cause:
+            logging.error(cause, exc_info=True)
+            return FailedDispatchResponse(details=str(cause))
+
+    async def adispatch_message(self) -> DispatchResponse:
+        aiohttp = import_aiohttp()
+        to = await self._aget_to()
+        account_sid = os.environ.get("TWILIO_ACCOUNT_SID")
+        auth_token = os.environ.get("TWILIO_AUTH_TOKEN")
+        if not account_sid or not auth_token:
+            raise TwilioException("Credentials are required to create a TwilioClient")
+        try:
+            async with get_http_session().post(
+                f"{self.API_URL}/Accounts/{account_sid}/Messages.json",
+                headers={
+                    "Authorization": self._get_basic_authorization(
+                        account_sid, auth_token
+                    )
+                },
+                data={
+                    "To": to,
+                    "From": self._config.get(TWILIO_VERIFIED_FROM_NUMBER),
+                    "Body": self._SMS_BODY + self.create_code(),
+                },
+                timeout=self._get_client_timeout(),
+            ) as response:
+                if response.status < 400:
+                    return SuccessfulDispatchResponse(details=self._SUCCESS_DETAILS)
+                payload = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as cause:
+            logging.error(cause, exc_info=True)
+            return FailedDispatchResponse(details=str(cause))
+        logging.error("Twilio API error: %s", payload)
+        return FailedDispatchResponse(details=payload.get("message"))
+
+    @staticmethod
+    def _create_client(timeouts: Tuple[float, float]) -> Client:
+        http_client = TwilioHttpClient()
+        # Set after creation, as the client only accepts a single timeout,
+        # while ``requests`` accepts a pair of connect and read timeouts.
+        http_client.timeout = timeouts
+        return Client(http_client=http_client)
+
+    @staticmethod
+    def _get_basic_authorization(username: str, password: str) -> str:
+        credentials = base64.b64encode(f"{username}:{password}".encode()).decode()
+        return f"Basic {credentials}"
@@ -1,11 +1,16 @@
 from django.utils.translation import gettext_lazy as _
 
+import asyncio
+import base64
 import logging
+import os
+from typing import List
 from yubico_client import Yubico
 from yubico_client.otp import OTP
 from yubico_client.yubico_exceptions import YubicoError
 
 from trench.backends.base import AbstractMessageDispatcher
+from trench.backends.clients import get_http_session, import_aiohttp
 from trench.responses import DispatchResponse, SuccessfulDispatchResponse
 from trench.settings import YUBICLOUD_CLIENT_ID
 
@@ -26,18 +31,68 @@ class YubiKeyMessageDispatcher(AbstractMessageDispatcher):
         return self._validate_yubikey_otp(code)
 
     def validate_code(self, code: str) -> bool:
-        if (
-            not self._mfa_method.secret
-            or self._mfa_method.secret != OTP(code).device_id
-        ):
+        if not self._matches_device(code):
             return False
         return self._validate_yubikey_otp(code)
 
+    async def avalidate_code(self, code: str) -> bool:
+        if not self._matches_device(code):
+            return False
+        return await self._avalidate_yubikey_otp(code)
+
+    def _matches_device(self, code: str) -> bool:
+        return bool(self._mfa_method.secret) and (
+            self._mfa_method.secret == OTP(code).device_id
+        )
+
     def _validate_yubikey_otp(self, code: str) -> bool:
         try:
             return Yubico(self._config[YUBICLOUD_CLIENT_ID]).verify(
-                code, timestamp=True
+                code, timestamp=True, timeout=max(self._get_timeouts())
             )
         except (YubicoError, Exception) as cause:
             logging.error(cause, exc_info=True)
             return False
+
+    async def _avalidate_yubikey_otp(self, code: str) -> bool:
+        """
+        Verifies the OTP the way ``Yubico.verify`` does: all YubiCloud
+        servers are queried at once and the first positive answer is
+        accepted, while unavailable servers are skipped.
+        """
+        aiohttp = import_aiohttp()
+        queries: List["asyncio.Future[str]"] = []
+        try:
+            client = Yubico(self._config[YUBICLOUD_CLIENT_ID])
+            otp = OTP(code, client.translate_otp).otp
+            nonce = base64.b64encode(os.urandom(30), b"xz")[:25].decode("utf-8")
+            query_string = client.generate_query_string(otp, nonce, True, None, None)
+            queries = [
+                asyncio.ensure_future(self._aquery_yubicloud(f"{url}?{query_string}"))
+                for url in client.api_urls
+            ]
+            for query in asyncio.as_completed(queries):
+                try:
+                    payload = await query
+                except (aiohttp.ClientError, asyncio.TimeoutError) as cause:
+                    if len(queries) == 1:
+                        raise
+                    logging.warning("YubiCloud server failed: %s", cause)
+                    continue
+                if client.verify_response(payload, otp, nonce):
+                    return True
+            logging.error("No valid answers from YubiCloud servers.")
+            return False
+        except (YubicoError, Exception) as cause:
+            logging.error(cause, exc_info=True)
+            return False
+        finally:
+            for query in queries:
+                query.cancel()
+
+    async def _aquery_yubicloud(self, url: str) -> str:
+        async with get_http_session().get(
+            url, timeout=self._get_client_timeout()
+        ) as response:
+            response.raise_for_status()
+            return await response.text()
@@ -0,0 +1,81 @@
+from django.core.cache import BaseCache, caches
+from django.db.transaction import on_commit
+
+from threading import Lock
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from trench.settings import TrenchAPISettings, trench_settings
+
+
+class MFAMethodCache:
+    """
+    Cache of users' active MFA methods, kept in the Django cache configured
+    with ``MFA_METHODS_CACHE``.
+
+    A record holds non-secret field values of all active methods of a user,
+    e.g. their names and which one is primary. It is invalidated by commands
+    changing the state of methods and whenever a method is saved or deleted.
+    Hits and misses are counted per process.
+    """
+
+    _KEY_PREFIX = "trench:mfa_methods:"
+
+    def __init__(self, settings: TrenchAPISettings) -> None:
+        self._settings = settings
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def is_enabled(self) -> bool:
+        return self._settings.MFA_METHODS_CACHE is not None
+
+    def get(self, user_id: Any, field_names: Sequence[str]) -> Optional[List[Tuple]]:
+        record = self._get_cache().get(self._make_key(user_id))
+        # Records written for another set of fields (e.g. before a migration)
+        # are treated as missing.
+        is_hit = record is not None and record[0] == tuple(field_names)
+        with self._lock:
+            if is_hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+        return record[1] if is_hit else None
+
+    def set(self, user_id: Any, field_names: Sequence[str], rows: List[Tuple]) -> None:
+        self._get_cache().set(
+            self._make_key(user_id),
+            (tuple(field_names), rows),
+            timeout=self._settings.MFA_METHODS_CACHE_TIMEOUT,
+        )
+
+    def invalidate(self, user_id: Any) -> None:
+        if not self.is_enabled:
+            return
+        cache = self._get_cache()
+        key = self._make_key(user_id)
+        cache.delete(key)
+        # Records read before the change is committed must not outlive it.
+        on_commit(lambda: cache.delete(key))
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self._hits, "misses": self._misses}
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._hits = 0
+            self._misses = 0
+
+    def _get_cache(self) -> BaseCache:
+        return caches[self._settings.MFA_METHODS_CACHE]
+
+    def _make_key(self, user_id: Any) -> str:
+        return f"{self._KEY_PREFIX}{user_id}"
+
+
+mfa_method_cache = MFAMethodCache(settings=trench_settings)
+
+
+def invalidate_mfa_method_cache(sender: Any, instance: Any, **kwargs: Any) -> None:
+    mfa_method_cache.invalidate(user_id=instance.user_id)
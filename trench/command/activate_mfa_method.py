@@ -1,46 +1,88 @@
-from typing import Callable, Set, Type
+from django.db import IntegrityError
+from django.db.transaction import atomic
+
+from typing import Callable, List, Set, Type
 
 from trench.backends.provider import get_mfa_handler
+from trench.cache import MFAMethodCache, mfa_method_cache
 from trench.command.generate_backup_codes import generate_backup_codes_command
-from trench.command.replace_mfa_method_backup_codes import (
-    regenerate_backup_codes_for_mfa_method_command,
-)
+from trench.command.hash_backup_codes import hash_backup_codes_command
 from trench.exceptions import MFAMethodDoesNotExistError
-from trench.models import MFAMethod
+from trench.instrumentation import instrumented
+from trench.models import MFABackupCode, MFAMethod
 from trench.utils import get_mfa_model
 
 
 class ActivateMFAMethodCommand:
     def __init__(
-        self, mfa_model: Type[MFAMethod], backup_codes_generator: Callable
+        self,
+        mfa_model: Type[MFAMethod],
+        backup_code_model: Type[MFABackupCode],
+        backup_codes_generator: Callable,
+        backup_codes_hasher: Callable,
+        mfa_method_cache: MFAMethodCache,
     ) -> None:
         self._mfa_model = mfa_model
+        self._backup_code_model = backup_code_model
         self._backup_codes_generator = backup_codes_generator
+        self._backup_codes_hasher = backup_codes_hasher
+        self._mfa_method_cache = mfa_method_cache
 
+    @instrumented("command.activate_mfa_method")
     def execute(self, user_id: int, name: str, code: str) -> Set[str]:
         mfa = self._mfa_model.objects.get_by_name(user_id=user_id, name=name)
 
         get_mfa_handler(mfa).confirm_activation(code)
 
-        rows_affected = self._mfa_model.objects.filter(
-            user_id=user_id, name=name
-        ).update(
-            is_active=True,
-            is_primary=not self._mfa_model.objects.primary_exists(user_id=user_id),
-        )
+        # Codes are hashed before the transaction, so that hashing doesn't
+        # hold locks on user's methods.
+        backup_codes = self._backup_codes_generator()
+        digests = self._backup_codes_hasher(backup_codes)
+
+        try:
+            self._activate(mfa_method=mfa, digests=digests, can_be_primary=True)
+        except IntegrityError:
+            # A concurrent activation has made another method primary after
+            # it was checked, so this one can't be primary.
+            self._activate(mfa_method=mfa, digests=digests, can_be_primary=False)
+        self._mfa_method_cache.invalidate(user_id=user_id)
+
+        return backup_codes
+
+    @atomic
+    def _activate(
+        self, mfa_method: MFAMethod, digests: List[str], can_be_primary: bool
+    ) -> None:
+        """
+        Activates the method, making it primary unless the user already has
+        another primary method, and stores its backup codes.
 
+        The primary method is looked up with a separate query rather than
+        a subquery of the UPDATE, which MySQL rejects for the updated table.
+        A primary method made in the meantime violates the unique constraint.
+        """
+        is_primary = (
+            can_be_primary
+            and not self._mfa_model.objects.filter(
+                user_id=mfa_method.user_id, is_primary=True
+            )
+            .exclude(pk=mfa_method.pk)
+            .exists()
+        )
+        rows_affected = self._mfa_model.objects.filter(pk=mfa_method.pk).update(
+            is_active=True, is_primary=is_primary
+        )
         if rows_affected < 1:
             raise MFAMethodDoesNotExistError()
-
-        backup_codes = regenerate_backup_codes_for_mfa_method_command(
-            user_id=user_id,
-            name=name,
+        self._backup_code_model.objects.replace(
+            mfa_method_id=mfa_method.pk, digests=digests
         )
 
-        return backup_codes
-
 
 activate_mfa_method_command = ActivateMFAMethodCommand(
     mfa_model=get_mfa_model(),
+    backup_code_model=MFABackupCode,
     backup_codes_generator=generate_backup_codes_command,
+    backup_codes_hasher=hash_backup_codes_command,
+    mfa_method_cache=mfa_method_cache,
 ).execute
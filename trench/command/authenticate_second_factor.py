@@ -1,12 +1,14 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AbstractUser
 
-from typing import Type
+from typing import Type, Union
 
-from trench.backends.provider import get_mfa_handler
-from trench.command.remove_backup_code import remove_backup_code_command
-from trench.command.validate_backup_code import validate_backup_code_command
+from trench.command.validate_mfa_code import (
+    avalidate_mfa_code_command,
+    validate_mfa_code_command,
+)
 from trench.exceptions import InvalidCodeError, InvalidTokenError
+from trench.instrumentation import instrumented
 from trench.models import MFAMethod
 from trench.utils import get_mfa_model, user_token_generator
 
@@ -18,28 +20,47 @@ class AuthenticateSecondFactorCommand:
     def __init__(self, mfa_model: Type[MFAMethod]) -> None:
         self._mfa_model = mfa_model
 
+    @instrumented("command.authenticate_second_factor")
     def execute(self, code: str, ephemeral_token: str) -> User:
-        user = user_token_generator.check_token(user=None, token=ephemeral_token)
+        token = user_token_generator.parse_token(ephemeral_token)
+        if token is None:
+            raise InvalidTokenError()
+        # The fingerprint is checked before the code, so that a backup code
+        # isn't consumed for a token which is rejected.
+        user = user_token_generator.get_user(token)
+        if user is None:
+            raise InvalidTokenError()
+        self.is_authenticated(user_id=user.pk, code=code)
+        return user
+
+    @instrumented("command.authenticate_second_factor")
+    async def aexecute(self, code: str, ephemeral_token: str) -> User:
+        """
+        Awaits database queries and validation of the code.
+        """
+        token = user_token_generator.parse_token(ephemeral_token)
+        if token is None:
+            raise InvalidTokenError()
+        user = await user_token_generator.aget_user(token)
         if user is None:
             raise InvalidTokenError()
-        self.is_authenticated(user_id=user.id, code=code)
+        mfa_methods = await self._mfa_model.objects.alist_active_methods(
+            user_id=user.pk, with_secrets=True
+        )
+        if not await avalidate_mfa_code_command(mfa_methods=mfa_methods, code=code):
+            raise InvalidCodeError()
         return user
 
-    def is_authenticated(self, user_id: int, code: str) -> None:
-        for auth_method in self._mfa_model.objects.list_active(user_id=user_id):
-            validated_backup_code = validate_backup_code_command(
-                value=code, backup_codes=auth_method.backup_codes
-            )
-            if get_mfa_handler(mfa_method=auth_method).validate_code(code=code):
-                return
-            if validated_backup_code:
-                remove_backup_code_command(
-                    user_id=auth_method.user_id, method_name=auth_method.name, code=code
-                )
-                return
-        raise InvalidCodeError()
-
-
-authenticate_second_step_command = AuthenticateSecondFactorCommand(
-    mfa_model=get_mfa_model()
-).execute
+    def is_authenticated(self, user_id: Union[int, str], code: str) -> None:
+        if not validate_mfa_code_command(
+            mfa_methods=self._mfa_model.objects.list_active_methods(
+                user_id=user_id, with_secrets=True
+            ),
+            code=code,
+        ):
+            raise InvalidCodeError()
+
+
+second_factor_authenticator = AuthenticateSecondFactorCommand(mfa_model=get_mfa_model())
+authenticate_second_step_command = second_factor_authenticator.execute
+aauthenticate_second_step_command = second_factor_authenticator.aexecute
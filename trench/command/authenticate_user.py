@@ -4,6 +4,7 @@ from django.contrib.auth.models import AbstractUser
 from rest_framework.request import Request
 
 from trench.exceptions import UnauthenticatedError
+from trench.instrumentation import instrumented, record_hash_call
 
 
 User: AbstractUser = get_user_model()
@@ -11,7 +12,11 @@ User: AbstractUser = get_user_model()
 
 class AuthenticateUserCommand:
     @staticmethod
+    @instrumented("command.authenticate_user")
     def execute(request: Request, username: str, password: str) -> User:
+        # Authentication backends check the password of the user, or hash
+        # it to take the same time when the user does not exist.
+        record_hash_call()
         user = authenticate(
             request=request,
             username=username,
@@ -0,0 +1,126 @@
+from django.db.transaction import atomic
+
+from typing import Any, Callable, Tuple, Type
+
+from trench.command.hash_backup_codes import hash_backup_codes_command
+from trench.command.validate_backup_code import validate_backup_code_command
+from trench.hashers import (
+    BACKUP_CODE_DIGEST_PREFIX,
+    BACKUP_CODE_HASH_SEPARATOR,
+    get_backup_code_digests,
+)
+from trench.instrumentation import instrumented
+from trench.models import MFABackupCode, MFAMethod
+from trench.settings import TrenchAPISettings, trench_settings
+
+
+class ConsumeBackupCodeCommand:
+    def __init__(
+        self,
+        backup_code_model: Type[MFABackupCode],
+        settings: TrenchAPISettings,
+        backup_code_validator: Callable,
+        backup_codes_hasher: Callable,
+    ) -> None:
+        self._backup_code_model = backup_code_model
+        self._settings = settings
+        self._validate_backup_code = backup_code_validator
+        self._hash_backup_codes = backup_codes_hasher
+
+    @instrumented("command.consume_backup_code")
+    def execute(self, mfa_method: MFAMethod, code: str) -> bool:
+        """
+        Verifies the code against the backup codes of the given MFA method
+        and marks the matching one as used.
+
+        Plain and HMAC digests are looked up and consumed with a single
+        conditional UPDATE. Codes stored as salted password hashes are
+        checked one by one first and the matching row is consumed with a
+        conditional UPDATE, so a code can be used only once. Codes stored
+        in plain text before ``ENCRYPT_BACKUP_CODES`` was enabled are
+        checked last.
+
+        :param mfa_method: MFA method the code belongs to
+        :type mfa_method: MFAMethod
+        :param code: Code submitted by the user
+        :type code: str
+
+        :returns: Whether the code was consumed
+        :rtype: bool
+        """
+        lookup_digests = self._get_lookup_digests(code)
+        if lookup_digests and self._backup_code_model.objects.consume(
+            mfa_method_id=mfa_method.pk, digests=lookup_digests
+        ):
+            return True
+        if not self._settings.ENCRYPT_BACKUP_CODES:
+            return False
+        backup_code = self._validate_backup_code(
+            value=code,
+            backup_codes=self._backup_code_model.objects.filter(
+                mfa_method_id=mfa_method.pk,
+                used_at__isnull=True,
+                digest__contains=BACKUP_CODE_HASH_SEPARATOR,
+            )
+            .exclude(digest__startswith=BACKUP_CODE_DIGEST_PREFIX)
+            .values_list("digest", flat=True),
+        )
+        if backup_code is None:
+            return self._consume_plain_backup_code(
+                mfa_method_id=mfa_method.pk, code=code
+            )
+        return self._backup_code_model.objects.consume(
+            mfa_method_id=mfa_method.pk, digests=(backup_code,)
+        )
+
+    def _get_lookup_digests(self, code: str) -> Tuple[str, ...]:
+        if not self._settings.ENCRYPT_BACKUP_CODES:
+            return (code,)
+        if self._settings.HMAC_BACKUP_CODES:
+            return get_backup_code_digests(code)
+        return ()
+
+    def _consume_plain_backup_code(self, mfa_method_id: Any, code: str) -> bool:
+        """
+        Consumes a code stored in plain text and rewrites the remaining plain
+        codes of the method into the current format. Codes stored as hashes
+        can't be rewritten, as their values are unknown.
+
+        Nothing is written unless the code matches, and the remaining codes
+        are hashed before the transaction, so that it doesn't hold locks
+        while hashing.
+        """
+        backup_codes = list(
+            self._backup_code_model.objects.filter(
+                mfa_method_id=mfa_method_id, used_at__isnull=True
+            )
+            .exclude(digest__contains=BACKUP_CODE_HASH_SEPARATOR)
+            .only("pk", "digest")
+        )
+        if code not in {backup_code.digest for backup_code in backup_codes}:
+            return False
+        backup_codes = [
+            backup_code for backup_code in backup_codes if backup_code.digest != code
+        ]
+        digests = self._hash_backup_codes(
+            [backup_code.digest for backup_code in backup_codes]
+        )
+        for backup_code, digest in zip(backup_codes, digests):
+            backup_code.digest = digest
+        with atomic():
+            if not self._backup_code_model.objects.consume(
+                mfa_method_id=mfa_method_id, digests=(code,)
+            ):
+                return False
+            self._backup_code_model.objects.bulk_update(
+                backup_codes, fields=("digest",)
+            )
+        return True
+
+
+consume_backup_code_command = ConsumeBackupCodeCommand(
+    backup_code_model=MFABackupCode,
+    settings=trench_settings,
+    backup_code_validator=validate_backup_code_command,
+    backup_codes_hasher=hash_backup_codes_command,
+).execute
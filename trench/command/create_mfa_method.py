@@ -2,6 +2,7 @@ from typing import Callable, Type
 
 from trench.command.create_secret import create_secret_command
 from trench.exceptions import MFAMethodAlreadyActiveError
+from trench.instrumentation import instrumented
 from trench.models import MFAMethod
 from trench.utils import get_mfa_model
 
@@ -11,6 +12,7 @@ class CreateMFAMethodCommand:
         self._mfa_model = mfa_model
         self._create_secret = secret_generator
 
+    @instrumented("command.create_mfa_method")
     def execute(self, user_id: int, name: str) -> MFAMethod:
         mfa, created = self._mfa_model.objects.get_or_create(
             user_id=user_id,
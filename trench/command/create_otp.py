@@ -1,10 +1,80 @@
+import hmac
+from datetime import datetime
+from functools import lru_cache
 from pyotp import TOTP
+from pyotp.utils import strings_equal
+from struct import unpack_from
+from typing import Callable, Optional, Union
+
+from trench.settings import TrenchAPISettings, trench_settings
+
+
+class PreparedTOTP(TOTP):
+    """
+    TOTP decoding its secret and keying the HMAC only once, so that a single
+    instance can be reused for every code of the secret.
+    """
+
+    def __init__(self, s: str, digits: int = 6, interval: int = 30) -> None:
+        super().__init__(s, digits=digits, interval=interval)
+        self._hmac = hmac.new(self.byte_secret(), digestmod=self.digest)
+
+    def generate_otp(self, input: int) -> str:
+        if input < 0:
+            raise ValueError("input must be positive integer")
+        hasher = self._hmac.copy()
+        hasher.update(self.int_to_bytestring(input))
+        hmac_hash = hasher.digest()
+        offset = hmac_hash[-1] & 0xF
+        code = unpack_from(">I", hmac_hash, offset)[0] & 0x7FFFFFFF
+        return str(code % 10**self.digits).zfill(self.digits)
+
+    def verify(
+        self,
+        otp: Union[str, int],
+        for_time: Optional[Union[int, datetime]] = None,
+        valid_window: int = 0,
+    ) -> bool:
+        """
+        Compares the OTP with codes of all time steps of the window, without
+        stopping at the first match, so that the time taken doesn't tell
+        which step has matched.
+        """
+        if for_time is None:
+            for_time = datetime.now()
+        elif not isinstance(for_time, datetime):
+            for_time = datetime.fromtimestamp(int(for_time))
+        timecode = self.timecode(for_time)
+        otp = str(otp)
+        matched = False
+        for counter in range(
+            max(timecode - valid_window, 0), timecode + valid_window + 1
+        ):
+            matched |= strings_equal(otp, self.generate_otp(counter))
+        return matched
 
 
 class CreateOTPCommand:
-    @staticmethod
-    def execute(secret: str, interval: int) -> TOTP:
-        return TOTP(secret, interval=interval)
+    """
+    Returns TOTP instances from a process-wide LRU cache of
+    ``OTP_CACHE_SIZE`` entries, keyed by secret, interval and digits.
+    """
+
+    def __init__(self, settings: TrenchAPISettings) -> None:
+        self._settings = settings
+        self._cache_size: Optional[int] = None
+        self._create: Callable[..., PreparedTOTP] = PreparedTOTP
+
+    def execute(self, secret: str, interval: int, digits: int = 6) -> TOTP:
+        return self._get_factory()(secret, digits, interval)
+
+    def _get_factory(self) -> Callable[..., PreparedTOTP]:
+        cache_size = self._settings.OTP_CACHE_SIZE
+        if cache_size != self._cache_size:
+            self._create = lru_cache(maxsize=cache_size)(PreparedTOTP)
+            self._cache_size = cache_size
+        return self._create
 
 
-create_otp_command = CreateOTPCommand.execute
+otp_creator = CreateOTPCommand(settings=trench_settings)
+create_otp_command = otp_creator.execute
@@ -1,32 +1,59 @@
-from django.db.transaction import atomic
+from django.db.models import Count, Q
 
-from typing import Type
+from typing import Dict, Type
 
-from trench.exceptions import DeactivationOfPrimaryMFAMethodError, MFANotEnabledError
+from trench.cache import MFAMethodCache, mfa_method_cache
+from trench.exceptions import (
+    DeactivationOfPrimaryMFAMethodError,
+    MFAMethodDoesNotExistError,
+    MFANotEnabledError,
+)
+from trench.instrumentation import instrumented
 from trench.models import MFAMethod
 from trench.utils import get_mfa_model
 
 
 class DeactivateMFAMethodCommand:
-    def __init__(self, mfa_model: Type[MFAMethod]) -> None:
+    def __init__(
+        self, mfa_model: Type[MFAMethod], mfa_method_cache: MFAMethodCache
+    ) -> None:
         self._mfa_model = mfa_model
+        self._mfa_method_cache = mfa_method_cache
 
-    @atomic
+    @instrumented("command.deactivate_mfa_method")
     def execute(self, mfa_method_name: str, user_id: int) -> None:
-        mfa = self._mfa_model.objects.get_by_name(user_id=user_id, name=mfa_method_name)
-        number_of_active_mfa_methods = self._mfa_model.objects.filter(
-            user_id=user_id, is_active=True
-        ).count()
-        if mfa.is_primary and number_of_active_mfa_methods > 1:
+        state = self._get_state(user_id=user_id, name=mfa_method_name)
+        if not state["found"]:
+            raise MFAMethodDoesNotExistError()
+        if state["primary"] and state["active_count"] > 1:
             raise DeactivationOfPrimaryMFAMethodError()
-        if not mfa.is_active:
+        if not state["enabled"]:
             raise MFANotEnabledError()
 
-        self._mfa_model.objects.filter(user_id=user_id, name=mfa_method_name).update(
-            is_active=False, is_primary=False
+        # Guarded by the state read above, in case it changed in the meantime.
+        rows_affected = self._mfa_model.objects.filter(
+            user_id=user_id,
+            name=mfa_method_name,
+            is_active=True,
+            is_primary=bool(state["primary"]),
+        ).update(is_active=False, is_primary=False)
+        if rows_affected < 1:
+            raise MFANotEnabledError()
+        self._mfa_method_cache.invalidate(user_id=user_id)
+
+    def _get_state(self, user_id: int, name: str) -> Dict[str, int]:
+        """
+        Returns flags of the method and the number of user's active methods
+        in a single query.
+        """
+        return self._mfa_model.objects.filter(user_id=user_id).aggregate(
+            found=Count("pk", filter=Q(name=name)),
+            enabled=Count("pk", filter=Q(name=name, is_active=True)),
+            primary=Count("pk", filter=Q(name=name, is_primary=True)),
+            active_count=Count("pk", filter=Q(is_active=True)),
         )
 
 
 deactivate_mfa_method_command = DeactivateMFAMethodCommand(
-    mfa_model=get_mfa_model()
+    mfa_model=get_mfa_model(), mfa_method_cache=mfa_method_cache
 ).execute
@@ -0,0 +1,67 @@
+from django.utils.module_loading import import_string
+from django.utils.translation import gettext_lazy as _
+
+from asgiref.sync import sync_to_async
+from rest_framework.status import HTTP_202_ACCEPTED
+from threading import Lock
+from typing import Dict, Optional
+
+from trench.backends.provider import get_mfa_handler
+from trench.backends.queue import (
+    AbstractDispatchQueue,
+    adeliver_message,
+    deliver_message,
+)
+from trench.instrumentation import instrumented
+from trench.models import MFAMethod
+from trench.responses import DispatchResponse, SuccessfulDispatchResponse
+from trench.settings import TrenchAPISettings, trench_settings
+
+
+class DispatchMessageCommand:
+    _QUEUED_DETAILS = _("Message with MFA code will be sent shortly.")
+
+    def __init__(self, settings: TrenchAPISettings) -> None:
+        self._settings = settings
+        self._queues: Dict[str, AbstractDispatchQueue] = {}
+        self._lock = Lock()
+
+    @instrumented("command.dispatch_message")
+    def execute(self, mfa_method: MFAMethod) -> DispatchResponse:
+        handler = get_mfa_handler(mfa_method=mfa_method)
+        queue = self._get_queue()
+        if queue is None or not handler.SUPPORTS_BACKGROUND_DISPATCH:
+            return deliver_message(handler)
+        queue.enqueue(handler)
+        return SuccessfulDispatchResponse(
+            details=self._QUEUED_DETAILS, status=HTTP_202_ACCEPTED
+        )
+
+    @instrumented("command.dispatch_message")
+    async def aexecute(self, mfa_method: MFAMethod) -> DispatchResponse:
+        """
+        Awaits delivery of the message with the async API of the backend.
+        Queued messages are enqueued like in ``execute``.
+        """
+        handler = get_mfa_handler(mfa_method=mfa_method)
+        queue = self._get_queue()
+        if queue is None or not handler.SUPPORTS_BACKGROUND_DISPATCH:
+            return await adeliver_message(handler)
+        await sync_to_async(queue.enqueue, thread_sensitive=False)(handler)
+        return SuccessfulDispatchResponse(
+            details=self._QUEUED_DETAILS, status=HTTP_202_ACCEPTED
+        )
+
+    def _get_queue(self) -> Optional[AbstractDispatchQueue]:
+        path = self._settings.DISPATCH_QUEUE
+        if path is None:
+            return None
+        with self._lock:
+            if path not in self._queues:
+                self._queues[path] = import_string(path)()
+            return self._queues[path]
+
+
+message_dispatcher = DispatchMessageCommand(settings=trench_settings)
+dispatch_message_command = message_dispatcher.execute
+adispatch_message_command = message_dispatcher.aexecute
@@ -1,33 +1,42 @@
 from django.utils.crypto import get_random_string
 
-from typing import Callable, Set
+from typing import Callable, Optional, Set
 
-from trench.settings import trench_settings
+from trench.settings import TrenchAPISettings, trench_settings
 
 
 class GenerateBackupCodesCommand:
-    def __init__(self, random_string_generator: Callable) -> None:
+    def __init__(
+        self, random_string_generator: Callable, settings: TrenchAPISettings
+    ) -> None:
         self._random_string_generator = random_string_generator
+        self._settings = settings
 
     def execute(
         self,
-        quantity: int = trench_settings.BACKUP_CODES_QUANTITY,
-        length: int = trench_settings.BACKUP_CODES_LENGTH,
-        allowed_chars: str = trench_settings.BACKUP_CODES_CHARACTERS,
+        quantity: Optional[int] = None,
+        length: Optional[int] = None,
+        allowed_chars: Optional[str] = None,
     ) -> Set[str]:
         """
         Generates random encrypted backup codes.
 
         :param quantity: How many codes should be generated
-        :type quantity: int
+        :type quantity: int | None
         :param length: How long codes should be
-        :type length: int
+        :type length: int | None
         :param allowed_chars: Characters to create backup codes from
-        :type allowed_chars: str
+        :type allowed_chars: str | None
 
         :returns: Encrypted backup codes
         :rtype: set[str]
         """
+        if quantity is None:
+            quantity = self._settings.BACKUP_CODES_QUANTITY
+        if length is None:
+            length = self._settings.BACKUP_CODES_LENGTH
+        if allowed_chars is None:
+            allowed_chars = self._settings.BACKUP_CODES_CHARACTERS
         return {
             self._random_string_generator(length, allowed_chars)
             for _ in range(quantity)
@@ -36,4 +45,5 @@ class GenerateBackupCodesCommand:
 
 generate_backup_codes_command = GenerateBackupCodesCommand(
     random_string_generator=get_random_string,
+    settings=trench_settings,
 ).execute
@@ -0,0 +1,144 @@
+from django.db import connections
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from threading import Lock
+from typing import Callable, Iterable, List, Optional
+
+from trench.hashers import make_backup_code_digest, make_backup_code_hash
+from trench.instrumentation import record_hash_call
+from trench.settings import TrenchAPISettings, trench_settings
+from trench.tracing import span
+
+
+logger = logging.getLogger(__name__)
+
+
+class HashBackupCodesCommand:
+    """
+    Hashes backup codes with ``BACKUP_CODES_HASHER`` on a bounded pool of
+    ``BACKUP_CODES_HASHING_WORKERS`` threads shared by the process. Hashers
+    of ``hashlib`` release the GIL, so codes are hashed in parallel.
+    """
+
+    def __init__(self, settings: TrenchAPISettings) -> None:
+        self._settings = settings
+        self._lock = Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._max_workers = 0
+        self._pid = os.getpid()
+
+    def execute(self, backup_codes: Iterable[str]) -> List[str]:
+        """
+        Returns values of backup codes to be stored, according to
+        ``ENCRYPT_BACKUP_CODES`` and ``HMAC_BACKUP_CODES`` settings.
+        """
+        backup_codes = list(backup_codes)
+        executor = self._get_executor() if self._uses_password_hasher() else None
+        if executor is None or len(backup_codes) < 2:
+            return self._hash(backup_codes)
+        futures = [
+            executor.submit(copy_context().run, self._make_hash, backup_code)
+            for backup_code in backup_codes
+        ]
+        return [future.result() for future in futures]
+
+    def execute_in_background(
+        self,
+        backup_codes: Iterable[str],
+        callback: Callable[[List[str]], None],
+        errback: Optional[Callable[[Exception], None]] = None,
+    ) -> None:
+        """
+        Hashes backup codes on the pool and passes values to be stored
+        to ``callback`` once all of them are hashed. Exceptions raised by
+        hashing or by ``callback`` are passed to ``errback``.
+        """
+        backup_codes = list(backup_codes)
+        executor = self._get_executor()
+        if executor is None:
+            self._hash_and_store(backup_codes, callback=callback, errback=errback)
+            return
+        executor.submit(
+            self._hash_and_store_on_pool,
+            backup_codes,
+            callback=callback,
+            errback=errback,
+        )
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+    def _hash_and_store_on_pool(
+        self,
+        backup_codes: List[str],
+        callback: Callable[[List[str]], None],
+        errback: Optional[Callable[[Exception], None]],
+    ) -> None:
+        try:
+            # Already running on the pool, so codes are hashed one by one.
+            self._hash_and_store(backup_codes, callback=callback, errback=errback)
+        finally:
+            connections.close_all()
+
+    def _hash_and_store(
+        self,
+        backup_codes: List[str],
+        callback: Callable[[List[str]], None],
+        errback: Optional[Callable[[Exception], None]],
+    ) -> None:
+        try:
+            callback(self._hash(backup_codes))
+        except Exception as cause:
+            logger.exception("Backup codes could not be hashed and stored.")
+            if errback is None:
+                raise
+            errback(cause)
+
+    def _hash(self, backup_codes: List[str]) -> List[str]:
+        if not self._settings.ENCRYPT_BACKUP_CODES:
+            return backup_codes
+        if self._settings.HMAC_BACKUP_CODES:
+            return [
+                make_backup_code_digest(backup_code) for backup_code in backup_codes
+            ]
+        return [self._make_hash(backup_code) for backup_code in backup_codes]
+
+    def _uses_password_hasher(self) -> bool:
+        return (
+            self._settings.ENCRYPT_BACKUP_CODES and not self._settings.HMAC_BACKUP_CODES
+        )
+
+    def _get_executor(self) -> Optional[ThreadPoolExecutor]:
+        max_workers = self._settings.BACKUP_CODES_HASHING_WORKERS
+        with self._lock:
+            if self._pid != os.getpid():
+                # Worker threads do not survive fork.
+                self._executor = None
+                self._pid = os.getpid()
+            if self._executor is not None and self._max_workers != max_workers:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+            if self._executor is None and max_workers > 1:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=max_workers, thread_name_prefix="trench-hashing"
+                )
+                self._max_workers = max_workers
+            return self._executor
+
+    def _make_hash(self, backup_code: str) -> str:
+        record_hash_call()
+        with span("hasher.make_password"):
+            return make_backup_code_hash(
+                backup_code, hasher_path=self._settings.BACKUP_CODES_HASHER
+            )
+
+
+backup_codes_hasher = HashBackupCodesCommand(settings=trench_settings)
+hash_backup_codes_command = backup_codes_hasher.execute
+hash_backup_codes_in_background_command = backup_codes_hasher.execute_in_background
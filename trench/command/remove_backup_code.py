@@ -1,50 +1,29 @@
-from django.contrib.auth.hashers import check_password
+from typing import Any, Callable, Type
 
-from typing import Any, Set, Type
-
-from trench.exceptions import InvalidCodeError, MFAMethodDoesNotExistError
+from trench.command.consume_backup_code import consume_backup_code_command
+from trench.exceptions import InvalidCodeError
+from trench.instrumentation import instrumented
 from trench.models import MFAMethod
-from trench.settings import TrenchAPISettings, trench_settings
 from trench.utils import get_mfa_model
 
 
 class RemoveBackupCodeCommand:
-    def __init__(self, mfa_model: Type[MFAMethod], settings: TrenchAPISettings) -> None:
+    def __init__(
+        self, mfa_model: Type[MFAMethod], backup_code_consumer: Callable
+    ) -> None:
         self._mfa_model = mfa_model
-        self._settings = settings
+        self._consume_backup_code = backup_code_consumer
 
+    @instrumented("command.remove_backup_code")
     def execute(self, user_id: Any, method_name: str, code: str) -> None:
-        serialized_codes = (
-            self._mfa_model.objects.filter(user_id=user_id, name=method_name)
-            .values_list("_backup_codes", flat=True)
-            .first()
-        )
-        if serialized_codes is None:
-            raise MFAMethodDoesNotExistError()
-        codes = MFAMethod._BACKUP_CODES_DELIMITER.join(
-            self._remove_code_from_set(
-                backup_codes=set(
-                    serialized_codes.split(MFAMethod._BACKUP_CODES_DELIMITER)
-                ),
-                code=code,
-            )
+        mfa_method = self._mfa_model.objects.get_by_name(
+            user_id=user_id, name=method_name
         )
-        self._mfa_model.objects.filter(user_id=user_id, name=method_name).update(
-            _backup_codes=codes
-        )
-
-    def _remove_code_from_set(self, backup_codes: Set[str], code: str) -> Set[str]:
-        if not self._settings.ENCRYPT_BACKUP_CODES:
-            backup_codes.remove(code)
-            return backup_codes
-        for backup_code in backup_codes:
-            if check_password(code, backup_code):
-                backup_codes.remove(backup_code)
-                return backup_codes
-        raise InvalidCodeError()
+        if not self._consume_backup_code(mfa_method=mfa_method, code=code):
+            raise InvalidCodeError()
 
 
 remove_backup_code_command = RemoveBackupCodeCommand(
     mfa_model=get_mfa_model(),
-    settings=trench_settings,
+    backup_code_consumer=consume_backup_code_command,
 ).execute
@@ -1,50 +1,118 @@
-from django.contrib.auth.hashers import make_password
+from django.db.transaction import atomic, on_commit
 
-from typing import Callable, Set, Type
+from functools import partial
+from itertools import count
+from threading import Lock
+from typing import Any, Callable, Dict, List, Set, Type
 
 from trench.command.generate_backup_codes import generate_backup_codes_command
+from trench.command.hash_backup_codes import (
+    hash_backup_codes_command,
+    hash_backup_codes_in_background_command,
+)
 from trench.exceptions import MFAMethodDoesNotExistError
-from trench.models import MFAMethod
-from trench.settings import trench_settings
+from trench.instrumentation import instrumented
+from trench.models import MFABackupCode, MFAMethod
+from trench.settings import TrenchAPISettings, trench_settings
+from trench.signals import backup_codes_hashing_failed
 from trench.utils import get_mfa_model
 
 
 class RegenerateBackupCodesForMFAMethodCommand:
+    """
+    Replaces backup codes of the method with new ones.
+
+    With ``BACKUP_CODES_BACKGROUND_HASHING``, codes of a method regenerated
+    again are hashed concurrently, so each regeneration is given the next
+    generation number once committed. Only codes of the latest generation
+    of the method are stored, and codes of earlier ones finishing later are
+    dropped. Generations are counted per process, like the hashing pool.
+    """
+
     def __init__(
         self,
-        requires_encryption: bool,
+        settings: TrenchAPISettings,
         mfa_model: Type[MFAMethod],
-        code_hasher: Callable,
+        backup_code_model: Type[MFABackupCode],
         codes_generator: Callable,
+        codes_hasher: Callable,
+        background_codes_hasher: Callable,
     ) -> None:
-        self._requires_encryption = requires_encryption
+        self._settings = settings
         self._mfa_model = mfa_model
-        self._code_hasher = code_hasher
+        self._backup_code_model = backup_code_model
         self._codes_generator = codes_generator
+        self._codes_hasher = codes_hasher
+        self._background_codes_hasher = background_codes_hasher
+        self._generation_counter = count()
+        self._generations: Dict[Any, int] = {}
+        self._lock = Lock()
 
+    @instrumented("command.regenerate_backup_codes")
     def execute(self, user_id: int, name: str) -> Set[str]:
-        backup_codes = self._codes_generator()
-        rows_affected = self._mfa_model.objects.filter(
-            user_id=user_id, name=name
-        ).update(
-            _backup_codes=MFAMethod._BACKUP_CODES_DELIMITER.join(
-                [self._code_hasher(backup_code) for backup_code in backup_codes]
-                if self._requires_encryption
-                else backup_codes
-            ),
+        mfa_method_id = (
+            self._mfa_model.objects.filter(user_id=user_id, name=name)
+            .values_list("pk", flat=True)
+            .first()
         )
-
-        if rows_affected < 1:
+        if mfa_method_id is None:
             raise MFAMethodDoesNotExistError()
 
+        backup_codes = self._codes_generator()
+        if self._settings.BACKUP_CODES_BACKGROUND_HASHING:
+            # Previous codes remain valid until the new ones are stored.
+            on_commit(partial(self._hash_in_background, mfa_method_id, backup_codes))
+        else:
+            self._store(mfa_method_id, self._codes_hasher(backup_codes))
+
         return backup_codes
 
+    def _hash_in_background(self, mfa_method_id: Any, backup_codes: Set[str]) -> None:
+        with self._lock:
+            generation = self._generations[mfa_method_id] = next(
+                self._generation_counter
+            )
+        self._background_codes_hasher(
+            backup_codes=backup_codes,
+            callback=partial(self._store_generation, mfa_method_id, generation),
+            errback=partial(self._report_failure, mfa_method_id, generation),
+        )
+
+    def _store_generation(
+        self, mfa_method_id: Any, generation: int, digests: List[str]
+    ) -> None:
+        # Held while storing, so that a later generation can't be stored
+        # in the meantime and then overwritten.
+        with self._lock:
+            if self._generations.get(mfa_method_id) != generation:
+                return
+            self._store(mfa_method_id, digests)
+            del self._generations[mfa_method_id]
+
+    def _report_failure(
+        self, mfa_method_id: Any, generation: int, exception: Exception
+    ) -> None:
+        with self._lock:
+            if self._generations.get(mfa_method_id) == generation:
+                del self._generations[mfa_method_id]
+        backup_codes_hashing_failed.send(
+            sender=self.__class__, mfa_method_id=mfa_method_id, exception=exception
+        )
+
+    def _store(self, mfa_method_id: Any, digests: List[str]) -> None:
+        with atomic():
+            self._backup_code_model.objects.replace(
+                mfa_method_id=mfa_method_id, digests=digests
+            )
+
 
 regenerate_backup_codes_for_mfa_method_command = (
     RegenerateBackupCodesForMFAMethodCommand(
-        requires_encryption=trench_settings.ENCRYPT_BACKUP_CODES,
+        settings=trench_settings,
         mfa_model=get_mfa_model(),
-        code_hasher=make_password,
+        backup_code_model=MFABackupCode,
         codes_generator=generate_backup_codes_command,
+        codes_hasher=hash_backup_codes_command,
+        background_codes_hasher=hash_backup_codes_in_background_command,
     ).execute
 )
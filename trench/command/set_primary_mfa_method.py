@@ -2,29 +2,41 @@ from django.db.transaction import atomic
 
 from typing import Type
 
-from trench.exceptions import MFAMethodDoesNotExistError, MFAPrimaryMethodInactiveError
+from trench.cache import MFAMethodCache, mfa_method_cache
+from trench.exceptions import MFAPrimaryMethodInactiveError
+from trench.instrumentation import instrumented
 from trench.models import MFAMethod
 from trench.utils import get_mfa_model
 
 
 class SetPrimaryMFAMethodCommand:
-    def __init__(self, mfa_model: Type[MFAMethod]) -> None:
+    def __init__(
+        self, mfa_model: Type[MFAMethod], mfa_method_cache: MFAMethodCache
+    ) -> None:
         self._mfa_model = mfa_model
+        self._mfa_method_cache = mfa_method_cache
 
+    @instrumented("command.set_primary_mfa_method")
     @atomic
     def execute(self, user_id: int, name: str) -> None:
-        self._mfa_model.objects.filter(user_id=user_id, is_primary=True).update(
-            is_primary=False
-        )
-        if not self._mfa_model.objects.is_active_by_name(user_id=user_id, name=name):
-            raise MFAPrimaryMethodInactiveError()
+        # unique_user_is_primary is a partial unique index, which can't be
+        # deferred, so the current primary method is cleared first.
+        self._mfa_model.objects.filter(user_id=user_id, is_primary=True).exclude(
+            name=name
+        ).update(is_primary=False)
         rows_affected = self._mfa_model.objects.filter(
-            user_id=user_id, name=name
+            user_id=user_id, name=name, is_active=True
         ).update(is_primary=True)
         if rows_affected < 1:
-            raise MFAMethodDoesNotExistError()
+            self._raise_not_activated(user_id=user_id, name=name)
+        self._mfa_method_cache.invalidate(user_id=user_id)
+
+    def _raise_not_activated(self, user_id: int, name: str) -> None:
+        # Raises MFAMethodDoesNotExistError if the method doesn't exist.
+        self._mfa_model.objects.is_active_by_name(user_id=user_id, name=name)
+        raise MFAPrimaryMethodInactiveError()
 
 
 set_primary_mfa_method_command = SetPrimaryMFAMethodCommand(
-    mfa_model=get_mfa_model()
+    mfa_model=get_mfa_model(), mfa_method_cache=mfa_method_cache
 ).execute
@@ -1,22 +1,49 @@
-from django.contrib.auth.hashers import check_password
-
-from typing import Iterable, Optional
+from typing import Iterable, Optional, Set
 
+from trench.hashers import (
+    check_backup_code_hash,
+    get_backup_code_digests,
+    is_backup_code_digest,
+)
+from trench.instrumentation import instrumented, record_hash_call
 from trench.settings import TrenchAPISettings, trench_settings
+from trench.tracing import span
 
 
 class ValidateBackupCodeCommand:
     def __init__(self, settings: TrenchAPISettings) -> None:
         self._settings = settings
 
+    @instrumented("command.validate_backup_code")
     def execute(self, value: str, backup_codes: Iterable) -> Optional[str]:
         if not self._settings.ENCRYPT_BACKUP_CODES:
             return value if value in backup_codes else None
+        if self._settings.HMAC_BACKUP_CODES:
+            return self._find_digest(value=value, backup_codes=set(backup_codes))
+        for backup_code in backup_codes:
+            if self._check_password(value=value, backup_code=backup_code):
+                return backup_code
+        return None
+
+    def _find_digest(self, value: str, backup_codes: Set[str]) -> Optional[str]:
+        for digest in get_backup_code_digests(value):
+            if digest in backup_codes:
+                return digest
+        # Codes hashed before HMAC_BACKUP_CODES was enabled.
         for backup_code in backup_codes:
-            if check_password(value, backup_code):
+            if is_backup_code_digest(backup_code):
+                continue
+            if self._check_password(value=value, backup_code=backup_code):
                 return backup_code
         return None
 
+    def _check_password(self, value: str, backup_code: str) -> bool:
+        record_hash_call()
+        with span("hasher.check_password"):
+            return check_backup_code_hash(
+                value, backup_code, hasher_path=self._settings.BACKUP_CODES_HASHER
+            )
+
 
 validate_backup_code_command = ValidateBackupCodeCommand(
     settings=trench_settings
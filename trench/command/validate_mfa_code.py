@@ -0,0 +1,79 @@
+from typing import Callable, Iterable, List
+
+from trench.backends.provider import get_mfa_handler
+from trench.command.consume_backup_code import consume_backup_code_command
+from trench.instrumentation import instrumented
+from trench.models import MFAMethod
+from trench.settings import TrenchAPISettings, trench_settings
+from trench.utils import run_in_executor
+
+
+class ValidateMFACodeCommand:
+    """
+    Checks a code submitted by the user against the given MFA methods.
+
+    Cheap checks go first: the OTP of the primary method, then OTPs of the
+    remaining methods. Backup codes, which may require a full password hash
+    per stored code, are only checked when the submitted value has the shape
+    of a backup code. A matching backup code is consumed.
+    """
+
+    def __init__(
+        self, settings: TrenchAPISettings, backup_code_consumer: Callable
+    ) -> None:
+        self._settings = settings
+        self._consume_backup_code = backup_code_consumer
+
+    @instrumented("command.validate_mfa_code")
+    def execute(
+        self,
+        mfa_methods: Iterable[MFAMethod],
+        code: str,
+        validation_method_name: str = "validate_code",
+    ) -> bool:
+        candidates = self._sort_candidates(mfa_methods)
+        for mfa_method in candidates:
+            handler = get_mfa_handler(mfa_method=mfa_method)
+            if getattr(handler, validation_method_name)(code):
+                return True
+        if not self.is_backup_code_candidate(code):
+            return False
+        for mfa_method in candidates:
+            if self._consume_backup_code(mfa_method=mfa_method, code=code):
+                return True
+        return False
+
+    @instrumented("command.validate_mfa_code")
+    async def aexecute(self, mfa_methods: Iterable[MFAMethod], code: str) -> bool:
+        """
+        Awaits ``avalidate_code`` of handlers. Backup codes are consumed
+        in an executor, as they may require hashing.
+        """
+        candidates = self._sort_candidates(mfa_methods)
+        for mfa_method in candidates:
+            if await get_mfa_handler(mfa_method=mfa_method).avalidate_code(code):
+                return True
+        if not self.is_backup_code_candidate(code):
+            return False
+        consume_backup_code = run_in_executor(self._consume_backup_code)
+        for mfa_method in candidates:
+            if await consume_backup_code(mfa_method=mfa_method, code=code):
+                return True
+        return False
+
+    def is_backup_code_candidate(self, code: str) -> bool:
+        return len(code) == self._settings.BACKUP_CODES_LENGTH and set(code) <= set(
+            self._settings.BACKUP_CODES_CHARACTERS
+        )
+
+    @staticmethod
+    def _sort_candidates(mfa_methods: Iterable[MFAMethod]) -> List[MFAMethod]:
+        return sorted(mfa_methods, key=lambda mfa_method: not mfa_method.is_primary)
+
+
+mfa_code_validator = ValidateMFACodeCommand(
+    settings=trench_settings,
+    backup_code_consumer=consume_backup_code_command,
+)
+validate_mfa_code_command = mfa_code_validator.execute
+avalidate_mfa_code_command = mfa_code_validator.aexecute
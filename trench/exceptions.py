@@ -14,6 +14,30 @@ class MethodHandlerMissingError(ImproperlyConfigured):
         super().__init__(f"Missing handler in {method_name} configuration.")
 
 
+class BackupCodesCharactersError(ImproperlyConfigured):
+    def __init__(self, separator: str) -> None:
+        super().__init__(
+            f"BACKUP_CODES_CHARACTERS must not contain '{separator}', "
+            "which separates fields of hashed backup codes."
+        )
+
+
+class AsyncDependencyMissingError(ImproperlyConfigured):
+    def __init__(self, package_name: str) -> None:
+        super().__init__(
+            f"Async dispatch requires '{package_name}', "
+            "install it with 'pip install django-trench[async]'."
+        )
+
+
+class AsyncViewsUnsupportedError(ImproperlyConfigured):
+    def __init__(self, view_name: str, django_version: str) -> None:
+        super().__init__(
+            f"{view_name} requires Django {django_version} or later, "
+            "use its synchronous counterpart instead."
+        )
+
+
 class MFAValidationError(ValidationError):
     def __str__(self) -> str:
         return ", ".join(detail for detail in self.detail)
@@ -0,0 +1,94 @@
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    BasePasswordHasher,
+    PBKDF2PasswordHasher,
+    check_password,
+    get_hasher,
+    make_password,
+)
+from django.utils.crypto import salted_hmac
+from django.utils.module_loading import import_string
+
+from functools import lru_cache
+from typing import Optional, Tuple
+
+
+BACKUP_CODE_DIGEST_PREFIX = "hmac_sha256$"
+BACKUP_CODE_HASH_SEPARATOR = "$"
+_BACKUP_CODE_DIGEST_KEY_SALT = "trench.hashers.make_backup_code_digest"
+
+
+def make_backup_code_digest(code: str, secret: Optional[str] = None) -> str:
+    """
+    Creates a keyed, deterministic digest of a backup code.
+
+    Backup codes are random, so a keyed digest is enough to protect them and,
+    unlike a salted password hash, it can be looked up directly.
+    """
+    digest = salted_hmac(
+        _BACKUP_CODE_DIGEST_KEY_SALT, code, secret=secret, algorithm="sha256"
+    ).hexdigest()
+    return f"{BACKUP_CODE_DIGEST_PREFIX}{digest}"
+
+
+def get_backup_code_digests(code: str) -> Tuple[str, ...]:
+    """
+    Returns every digest the code could have been stored as, i.e. one for
+    ``SECRET_KEY`` and one for each of the ``SECRET_KEY_FALLBACKS``.
+    """
+    secrets = (settings.SECRET_KEY, *getattr(settings, "SECRET_KEY_FALLBACKS", ()))
+    return tuple(make_backup_code_digest(code, secret=secret) for secret in secrets)
+
+
+def is_backup_code_digest(encoded: str) -> bool:
+    return encoded.startswith(BACKUP_CODE_DIGEST_PREFIX)
+
+
+class BackupCodePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2 with a number of iterations suited to random backup codes rather
+    than to passwords chosen by users.
+    """
+
+    algorithm = "trench_backup_code_pbkdf2_sha256"
+    iterations = 10000
+
+
+@lru_cache(maxsize=None)
+def get_backup_code_hasher(path: str) -> BasePasswordHasher:
+    return import_string(path)()
+
+
+def get_backup_code_hash_prefix(hasher_path: Optional[str] = None) -> str:
+    """
+    Returns the prefix of hashes made by the hasher at ``hasher_path``, or by
+    the default hasher of ``PASSWORD_HASHERS`` when it's ``None``.
+    """
+    if hasher_path is None:
+        hasher = get_hasher()
+    else:
+        hasher = get_backup_code_hasher(hasher_path)
+    return f"{hasher.algorithm}{BACKUP_CODE_HASH_SEPARATOR}"
+
+
+def make_backup_code_hash(code: str, hasher_path: Optional[str] = None) -> str:
+    """
+    Hashes the code with the hasher at ``hasher_path``, or with the default
+    hasher of ``PASSWORD_HASHERS`` when it's ``None``.
+    """
+    if hasher_path is None:
+        return make_password(code)
+    return make_password(code, hasher=get_backup_code_hasher(hasher_path))
+
+
+def check_backup_code_hash(
+    code: str, encoded: str, hasher_path: Optional[str] = None
+) -> bool:
+    """
+    Checks the code against a hash made by the hasher at ``hasher_path`` or
+    by any of ``PASSWORD_HASHERS``.
+    """
+    if hasher_path is not None:
+        if encoded.startswith(get_backup_code_hash_prefix(hasher_path)):
+            return get_backup_code_hasher(hasher_path).verify(code, encoded)
+    return check_password(code, encoded)
@@ -0,0 +1,217 @@
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.module_loading import import_string
+
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache, wraps
+from inspect import iscoroutinefunction
+from threading import Lock
+from time import perf_counter
+from typing import Any, Callable, Iterator, List, Optional, Tuple, TypeVar, cast
+
+from trench.settings import trench_settings
+from trench.tracing import span
+
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class Measurement:
+    """
+    Resources used by a single call of a trench view or command, including
+    calls of commands nested in it.
+    """
+
+    _lock = Lock()
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.duration = 0.0
+        self.queries = 0
+        self.query_time = 0.0
+        self.hash_calls = 0
+        self.provider_time = 0.0
+
+    def __repr__(self) -> str:
+        return (
+            f"<Measurement {self.name}: {self.duration * 1000:.2f} ms, "
+            f"{self.queries} queries ({self.query_time * 1000:.2f} ms), "
+            f"{self.hash_calls} hash calls, "
+            f"provider {self.provider_time * 1000:.2f} ms>"
+        )
+
+    def _record_query(self, seconds: float) -> None:
+        # Queries of a measurement may run in several threads at once.
+        with self._lock:
+            self.queries += 1
+            self.query_time += seconds
+
+    def _record_hash_call(self) -> None:
+        with self._lock:
+            self.hash_calls += 1
+
+    def _record_provider_time(self, seconds: float) -> None:
+        with self._lock:
+            self.provider_time += seconds
+
+
+_active_measurements: ContextVar[Tuple[Measurement, ...]] = ContextVar(
+    "trench_active_measurements", default=()
+)
+
+
+def _execute_query(
+    execute: Callable, sql: str, params: Any, many: bool, context: Any
+) -> Any:
+    measurements = _active_measurements.get()
+    if not measurements:
+        return execute(sql, params, many, context)
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        seconds = perf_counter() - start
+        for measurement in measurements:
+            measurement._record_query(seconds)
+
+
+def _install_query_wrapper(connection: Any, **kwargs: Any) -> None:
+    # connection.execute_wrapper() removes the last wrapper on exit, so the
+    # wrapper is inserted first, where it's never removed by others.
+    if _execute_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _execute_query)
+
+
+# Connections are local to threads and async contexts, while measurements
+# follow the context into threads of sync_to_async and executors. Queries
+# are therefore counted by a wrapper installed on every connection, which
+# adds them to the measurements active in the context of the query.
+connection_created.connect(
+    _install_query_wrapper, dispatch_uid="trench_instrumentation_queries"
+)
+# Connections opened before the wrapper was connected to connection_created.
+for _connection in connections.all():
+    _install_query_wrapper(_connection)
+
+
+_collectors: ContextVar[Tuple[List[Measurement], ...]] = ContextVar(
+    "trench_measurement_collectors", default=()
+)
+
+
+@lru_cache(maxsize=None)
+def _load_sinks(sinks: Tuple[Any, ...]) -> Tuple[Callable, ...]:
+    return tuple(
+        import_string(sink) if isinstance(sink, str) else sink for sink in sinks
+    )
+
+
+def get_sinks() -> Tuple[Callable, ...]:
+    return _load_sinks(tuple(trench_settings.INSTRUMENTATION_SINKS))
+
+
+@contextmanager
+def measure(name: str) -> Iterator[Optional[Measurement]]:
+    """
+    Traces the enclosed block and measures it when a sink is configured
+    or measurements are being captured.
+    """
+    with span(name):
+        sinks = get_sinks()
+        collectors = _collectors.get()
+        if not sinks and not collectors:
+            yield None
+            return
+        yield from _measure(name=name, sinks=sinks, collectors=collectors)
+
+
+def _measure(
+    name: str, sinks: Tuple[Callable, ...], collectors: Tuple[List[Measurement], ...]
+) -> Iterator[Measurement]:
+    measurement = Measurement(name=name)
+    token = _active_measurements.set(_active_measurements.get() + (measurement,))
+    start = perf_counter()
+    try:
+        yield measurement
+    finally:
+        measurement.duration = perf_counter() - start
+        _active_measurements.reset(token)
+        for collector in collectors:
+            collector.append(measurement)
+        for sink in sinks:
+            try:
+                sink(measurement)
+            except Exception as cause:  # pragma: no cover
+                logger.error(cause, exc_info=True)  # pragma: no cover
+
+
+def instrumented(name: str) -> Callable[[F], F]:
+    def decorator(func: F) -> F:
+        if iscoroutinefunction(func):
+
+            @wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with measure(name):
+                    return await func(*args, **kwargs)
+
+            return cast(F, async_wrapper)
+
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with measure(name):
+                return func(*args, **kwargs)
+
+        return cast(F, wrapper)
+
+    return decorator
+
+
+def record_hash_call() -> None:
+    for measurement in _active_measurements.get():
+        measurement._record_hash_call()
+
+
+def record_provider_time(seconds: float) -> None:
+    for measurement in _active_measurements.get():
+        measurement._record_provider_time(seconds)
+
+
+@contextmanager
+def capture_measurements() -> Iterator[List[Measurement]]:
+    """
+    Collects measurements finished in the enclosed block, regardless of
+    configured sinks.
+    """
+    measurements: List[Measurement] = []
+    token = _collectors.set(_collectors.get() + (measurements,))
+    try:
+        yield measurements
+    finally:
+        _collectors.reset(token)
+
+
+def log_measurement(measurement: Measurement) -> None:
+    logger.info("%r", measurement)
+
+
+class StatsdSink:
+    """
+    Sends measurements to a statsd-style client providing ``timing(stat, ms)``
+    and ``incr(stat, count)``.
+    """
+
+    def __init__(self, client: Any, prefix: str = "trench") -> None:
+        self._client = client
+        self._prefix = prefix
+
+    def __call__(self, measurement: Measurement) -> None:
+        stat = f"{self._prefix}.{measurement.name}"
+        self._client.timing(f"{stat}.duration", measurement.duration * 1000)
+        self._client.timing(f"{stat}.query_time", measurement.query_time * 1000)
+        self._client.timing(f"{stat}.provider_time", measurement.provider_time * 1000)
+        self._client.incr(f"{stat}.queries", measurement.queries)
+        self._client.incr(f"{stat}.hash_calls", measurement.hash_calls)
@@ -0,0 +1,364 @@
+import django
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db.transaction import atomic
+
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from itertools import islice
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    TextIO,
+    Tuple,
+)
+
+from trench.backends.application import ApplicationMessageDispatcher
+from trench.backends.base import AbstractMessageDispatcher
+from trench.cache import mfa_method_cache
+from trench.command.create_secret import create_secret_command
+from trench.command.generate_backup_codes import generate_backup_codes_command
+from trench.command.hash_backup_codes import hash_backup_codes_command
+from trench.models import MFABackupCode
+from trench.settings import HANDLER, trench_settings
+from trench.utils import get_mfa_model
+
+
+FORMAT_CSV = "csv"
+FORMAT_JSONL = "jsonl"
+STANDARD_STREAM = "-"
+
+
+class Enrollment(NamedTuple):
+    username: str
+    user_id: Any
+    name: str
+    pk: Optional[Any]
+    secret: str
+    is_primary: bool
+
+
+def hash_backup_codes(backup_codes: List[str]) -> List[str]:
+    # Defined at module level, so that it can be sent to worker processes.
+    return hash_backup_codes_command(backup_codes)
+
+
+class Command(BaseCommand):
+    help = (
+        "Enrolls users in MFA methods and writes their backup codes, as well "
+        "as provisioning URIs of authenticator app methods. Reads "
+        '"user" and "method" columns of CSV or keys of JSON Lines, where '
+        '"user" is the value of USERNAME_FIELD of the user model.'
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "input",
+            nargs="?",
+            default=STANDARD_STREAM,
+            help="Path to the input file. Standard input is read by default.",
+        )
+        parser.add_argument(
+            "--output",
+            default=STANDARD_STREAM,
+            help="Path to the file backup codes and provisioning URIs are "
+            "written to, in the format of the input. It's created readable "
+            "only by its owner. Standard output is used by default.",
+        )
+        parser.add_argument(
+            "--format",
+            choices=(FORMAT_CSV, FORMAT_JSONL),
+            help="Format of the input. Guessed from the extension of the input "
+            "file by default.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Number of enrollments read, hashed and saved at once.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of processes hashing backup codes. With 0 codes are "
+            "hashed in the current process.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be a positive number.")
+        file_format = options["format"] or self._guess_format(options["input"])
+        enrolled = skipped = 0
+        with ExitStack() as stack:
+            input_stream = self._open_input(options["input"], stack=stack)
+            output_stream = self._open_output(options["output"], stack=stack)
+            hash_map = self._get_hash_map(options["workers"], stack=stack)
+            write = self._get_writer(output_stream, file_format=file_format)
+            rows = self._read(input_stream, file_format=file_format)
+            for chunk in self._split(rows, size=options["chunk_size"]):
+                enrollments = self._plan(chunk)
+                skipped += len(chunk) - len(enrollments)
+                for enrollment, backup_codes, provisioning_uri in self._enroll(
+                    enrollments, hash_map=hash_map
+                ):
+                    write(enrollment, backup_codes, provisioning_uri)
+                enrolled += len(enrollments)
+        self.stderr.write(f"Enrolled {enrolled} MFA methods, skipped {skipped}.")
+
+    @staticmethod
+    def _guess_format(path: str) -> str:
+        if path.endswith((".jsonl", ".ndjson")):
+            return FORMAT_JSONL
+        return FORMAT_CSV
+
+    @staticmethod
+    def _open_input(path: str, stack: ExitStack) -> TextIO:
+        if path == STANDARD_STREAM:
+            return sys.stdin
+        return stack.enter_context(open(path, newline=""))
+
+    def _open_output(self, path: str, stack: ExitStack) -> Any:
+        if path == STANDARD_STREAM:
+            return self.stdout
+        # The output holds secrets of users, so it must not be readable by
+        # others, not even for a moment.
+        descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.chmod(path, 0o600)
+        return stack.enter_context(open(descriptor, "w", newline=""))
+
+    @staticmethod
+    def _get_hash_map(workers: int, stack: ExitStack) -> Callable:
+        if workers < 1:
+            return map
+        executor = stack.enter_context(
+            ProcessPoolExecutor(max_workers=workers, initializer=django.setup)
+        )
+        return executor.map
+
+    @staticmethod
+    def _read(stream: TextIO, file_format: str) -> Iterator[Tuple[str, str]]:
+        if file_format == FORMAT_CSV:
+            reader = csv.DictReader(stream)
+            if not {"user", "method"} <= set(reader.fieldnames or ()):
+                raise CommandError('CSV input requires "user" and "method" columns.')
+            for row in reader:
+                yield row["user"], row["method"]
+            return
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+                yield str(row["user"]), row["method"]
+            except (ValueError, TypeError, KeyError) as cause:
+                raise CommandError(
+                    f'Line {line_number} must be an object with "user" and '
+                    f'"method" keys.'
+                ) from cause
+
+    @staticmethod
+    def _split(
+        rows: Iterable[Tuple[str, str]], size: int
+    ) -> Iterator[List[Tuple[str, str]]]:
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, size))
+            if not chunk:
+                return
+            yield chunk
+
+    def _plan(self, chunk: List[Tuple[str, str]]) -> List[Enrollment]:
+        """
+        Resolves users and existing methods of the chunk. The first enrolled
+        method of a user without a primary method becomes primary.
+        """
+        user_model = get_user_model()
+        user_ids = dict(
+            user_model._default_manager.filter(
+                **{f"{user_model.USERNAME_FIELD}__in": {user for user, _ in chunk}}
+            ).values_list(user_model.USERNAME_FIELD, "pk")
+        )
+        existing: Dict[Tuple[Any, str], Tuple[Any, str]] = {}
+        active: Set[Tuple[Any, str]] = set()
+        with_primary: Set[Any] = set()
+        for user_id, name, pk, secret, is_active, is_primary in (
+            get_mfa_model()
+            .objects.filter(user_id__in=user_ids.values())
+            .values_list("user_id", "name", "pk", "secret", "is_active", "is_primary")
+        ):
+            existing[user_id, name] = pk, secret
+            if is_active:
+                active.add((user_id, name))
+            if is_primary:
+                with_primary.add(user_id)
+
+        enrollments = []
+        for username, name in chunk:
+            user_id = user_ids.get(username)
+            if user_id is None:
+                self._skip(username, name, reason="user does not exist")
+            elif name not in trench_settings.MFA_METHODS:
+                self._skip(username, name, reason="method does not exist")
+            elif self._requires_confirmation(name):
+                self._skip(username, name, reason="method requires confirmation")
+            elif (user_id, name) in active:
+                self._skip(username, name, reason="method is already active")
+            else:
+                active.add((user_id, name))
+                pk, secret = existing.get((user_id, name), (None, ""))
+                enrollments.append(
+                    Enrollment(
+                        username=username,
+                        user_id=user_id,
+                        name=name,
+                        pk=pk,
+                        secret=secret or create_secret_command(),
+                        is_primary=user_id not in with_primary,
+                    )
+                )
+                with_primary.add(user_id)
+        return enrollments
+
+    @staticmethod
+    def _requires_confirmation(name: str) -> bool:
+        """
+        Only methods validating TOTP codes of their secret can be enrolled.
+        Others, e.g. YubiKey, learn their secret from the user on
+        confirmation, so they would be activated without a usable secret.
+        """
+        handler = trench_settings.MFA_METHODS[name][HANDLER]
+        return (
+            handler.confirm_activation
+            is not AbstractMessageDispatcher.confirm_activation
+            or handler.validate_code is not AbstractMessageDispatcher.validate_code
+        )
+
+    def _skip(self, username: str, name: str, reason: str) -> None:
+        self.stderr.write(f"Skipping {name} of {username}: {reason}.")
+
+    def _enroll(
+        self, enrollments: List[Enrollment], hash_map: Callable
+    ) -> List[Tuple[Enrollment, List[str], str]]:
+        backup_codes = [sorted(generate_backup_codes_command()) for _ in enrollments]
+        digests = list(hash_map(hash_backup_codes, backup_codes))
+        with atomic():
+            method_ids = self._save_methods(enrollments)
+            MFABackupCode.objects.filter(mfa_method_id__in=method_ids).delete()
+            MFABackupCode.objects.bulk_create(
+                MFABackupCode(mfa_method_id=method_id, digest=digest)
+                for method_id, method_digests in zip(method_ids, digests)
+                for digest in method_digests
+            )
+        for user_id in {enrollment.user_id for enrollment in enrollments}:
+            mfa_method_cache.invalidate(user_id=user_id)
+        provisioning_uris = [
+            self._get_provisioning_uri(enrollment) for enrollment in enrollments
+        ]
+        return list(zip(enrollments, backup_codes, provisioning_uris))
+
+    @staticmethod
+    def _save_methods(enrollments: List[Enrollment]) -> List[Any]:
+        """
+        Creates or activates methods of the enrollments and returns their ids.
+        """
+        mfa_model = get_mfa_model()
+        mfa_methods = [
+            mfa_model(
+                pk=enrollment.pk,
+                user_id=enrollment.user_id,
+                name=enrollment.name,
+                secret=enrollment.secret,
+                is_active=True,
+                is_primary=enrollment.is_primary,
+            )
+            for enrollment in enrollments
+        ]
+        mfa_model.objects.bulk_create(
+            [mfa_method for mfa_method in mfa_methods if mfa_method.pk is None]
+        )
+        mfa_model.objects.bulk_update(
+            [
+                mfa_method
+                for mfa_method, enrollment in zip(mfa_methods, enrollments)
+                if enrollment.pk is not None
+            ],
+            fields=("secret", "is_active", "is_primary"),
+        )
+        if all(mfa_method.pk is not None for mfa_method in mfa_methods):
+            return [mfa_method.pk for mfa_method in mfa_methods]
+        # The database backend doesn't return ids of created rows.
+        method_ids = {
+            (user_id, name): pk
+            for user_id, name, pk in mfa_model.objects.filter(
+                user_id__in={enrollment.user_id for enrollment in enrollments},
+                name__in={enrollment.name for enrollment in enrollments},
+            ).values_list("user_id", "name", "pk")
+        }
+        return [
+            method_ids[enrollment.user_id, enrollment.name]
+            for enrollment in enrollments
+        ]
+
+    @staticmethod
+    def _get_provisioning_uri(enrollment: Enrollment) -> str:
+        """
+        Returns the URI of the secret of an authenticator app method, which
+        the user has to add to the app. Other methods send codes themselves,
+        so their secrets are never written.
+        """
+        config = trench_settings.MFA_METHODS[enrollment.name]
+        if not issubclass(config[HANDLER], ApplicationMessageDispatcher):
+            return ""
+        handler = config[HANDLER](
+            mfa_method=get_mfa_model()(name=enrollment.name, secret=enrollment.secret),
+            config=config,
+        )
+        return handler.create_provisioning_uri(enrollment.username)
+
+    @staticmethod
+    def _get_writer(
+        stream: Any, file_format: str
+    ) -> Callable[[Enrollment, List[str], str], None]:
+        if file_format == FORMAT_CSV:
+            writer = csv.writer(stream)
+            writer.writerow(("user", "method", "backup_codes", "provisioning_uri"))
+
+            def write_csv(
+                enrollment: Enrollment, backup_codes: List[str], provisioning_uri: str
+            ) -> None:
+                writer.writerow(
+                    (
+                        enrollment.username,
+                        enrollment.name,
+                        " ".join(backup_codes),
+                        provisioning_uri,
+                    )
+                )
+
+            return write_csv
+
+        def write_jsonl(
+            enrollment: Enrollment, backup_codes: List[str], provisioning_uri: str
+        ) -> None:
+            row: Dict[str, Any] = {
+                "user": enrollment.username,
+                "method": enrollment.name,
+                "backup_codes": backup_codes,
+            }
+            if provisioning_uri:
+                row["provisioning_uri"] = provisioning_uri
+            stream.write(json.dumps(row) + "\n")
+
+        return write_jsonl
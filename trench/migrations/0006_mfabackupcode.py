@@ -0,0 +1,53 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+from trench.settings import trench_settings
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(trench_settings.USER_MFA_MODEL),
+        ("trench", "0005_remove_mfamethod_primary_is_active_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MFABackupCode",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("digest", models.CharField(max_length=255, verbose_name="digest")),
+                (
+                    "used_at",
+                    models.DateTimeField(blank=True, null=True, verbose_name="used at"),
+                ),
+                (
+                    "mfa_method",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="backup_code_set",
+                        to=trench_settings.USER_MFA_MODEL,
+                        verbose_name="MFA method",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "MFA backup code",
+                "verbose_name_plural": "MFA backup codes",
+                "indexes": [
+                    models.Index(
+                        fields=["mfa_method", "digest"],
+                        name="trench_backup_code_digest_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,75 @@
+from django.db import migrations, transaction
+
+
+BATCH_SIZE = 1000
+BACKUP_CODES_DELIMITER = "|"
+
+
+def _iterate_in_batches(queryset):
+    last_pk = None
+    while True:
+        batch = queryset.order_by("pk")
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        batch = list(batch[:BATCH_SIZE])
+        if not batch:
+            return
+        yield batch
+        last_pk = batch[-1][0]
+
+
+def move_backup_codes_to_table(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    MFAMethod = apps.get_model("trench", "MFAMethod")
+    MFABackupCode = apps.get_model("trench", "MFABackupCode")
+    methods = (
+        MFAMethod.objects.using(db_alias)
+        .exclude(_backup_codes="")
+        .values_list("pk", "_backup_codes")
+    )
+    for batch in _iterate_in_batches(methods):
+        with transaction.atomic(using=db_alias):
+            # Makes the migration safe to re-run after a partial failure.
+            MFABackupCode.objects.using(db_alias).filter(
+                mfa_method_id__in=[pk for pk, _ in batch]
+            ).delete()
+            MFABackupCode.objects.using(db_alias).bulk_create(
+                MFABackupCode(mfa_method_id=pk, digest=digest)
+                for pk, serialized_codes in batch
+                for digest in serialized_codes.split(BACKUP_CODES_DELIMITER)
+                if digest
+            )
+
+
+def move_backup_codes_to_column(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    MFAMethod = apps.get_model("trench", "MFAMethod")
+    MFABackupCode = apps.get_model("trench", "MFABackupCode")
+    methods = MFAMethod.objects.using(db_alias).values_list("pk")
+    for batch in _iterate_in_batches(methods):
+        serialized_codes = {pk: [] for pk, in batch}
+        for mfa_method_id, digest in (
+            MFABackupCode.objects.using(db_alias)
+            .filter(mfa_method_id__in=serialized_codes, used_at__isnull=True)
+            .values_list("mfa_method_id", "digest")
+        ):
+            serialized_codes[mfa_method_id].append(digest)
+        with transaction.atomic(using=db_alias):
+            for pk, digests in serialized_codes.items():
+                MFAMethod.objects.using(db_alias).filter(pk=pk).update(
+                    _backup_codes=BACKUP_CODES_DELIMITER.join(digests)
+                )
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("trench", "0006_mfabackupcode"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            move_backup_codes_to_table, reverse_code=move_backup_codes_to_column
+        ),
+    ]
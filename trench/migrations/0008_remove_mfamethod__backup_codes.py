@@ -0,0 +1,14 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("trench", "0007_move_backup_codes_to_mfabackupcode"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="mfamethod",
+            name="_backup_codes",
+        ),
+    ]
@@ -1,46 +1,95 @@
 from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
 from django.db.models import (
     CASCADE,
     BooleanField,
     CharField,
     CheckConstraint,
+    DateTimeField,
     ForeignKey,
+    Index,
     Manager,
     Model,
     Q,
     QuerySet,
-    TextField,
     UniqueConstraint,
 )
+from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 
-from typing import Any, Iterable
+from asgiref.sync import sync_to_async
+from typing import Any, Dict, Iterable, List, Set, Tuple
 
+from trench.cache import mfa_method_cache
 from trench.exceptions import MFAMethodDoesNotExistError
+from trench.settings import SOURCE_FIELD, trench_settings
 
 
 class MFAUserMethodManager(Manager):
-    def get_by_name(self, user_id: Any, name: str) -> "MFAMethod":
+    # Fields of active methods kept in the cache, besides the primary key.
+    # Secrets are always read from the database.
+    _CACHED_FIELDS = ("user", "name", "is_primary", "is_active")
+
+    def get_by_name(
+        self, user_id: Any, name: str, select_recipient: bool = False
+    ) -> "MFAMethod":
+        queryset = self.with_recipient(name=name) if select_recipient else self
         try:
-            return self.get(user_id=user_id, name=name)
+            return queryset.get(user_id=user_id, name=name)
         except self.model.DoesNotExist:
             raise MFAMethodDoesNotExistError()
 
-    def get_primary_active(self, user_id: Any) -> "MFAMethod":
+    async def aget_by_name(
+        self, user_id: Any, name: str, select_recipient: bool = False
+    ) -> "MFAMethod":
+        queryset = self.with_recipient(name=name) if select_recipient else self
         try:
-            return self.get(user_id=user_id, is_primary=True, is_active=True)
+            return await queryset.aget(user_id=user_id, name=name)
         except self.model.DoesNotExist:
             raise MFAMethodDoesNotExistError()
 
+    def with_recipient(self, name: str) -> QuerySet:
+        """
+        Selects the user and the objects on the ``SOURCE_FIELD`` path of
+        the method, so that a message can be dispatched without further
+        queries.
+        """
+        relation = ["user"]
+        related_model = self.model._meta.get_field("user").related_model
+        source_field = trench_settings.MFA_METHODS.get(name, {}).get(SOURCE_FIELD)
+        for attr in (source_field or "").split(".")[:-1]:
+            try:
+                field = related_model._meta.get_field(attr)
+            except FieldDoesNotExist:
+                break
+            if not (field.many_to_one or field.one_to_one):
+                break
+            relation.append(attr)
+            related_model = field.related_model
+        return self.select_related("__".join(relation))
+
+    def get_primary_active(self, user_id: Any) -> "MFAMethod":
+        for mfa_method in self.list_active_methods(user_id=user_id):
+            if mfa_method.is_primary:
+                return mfa_method
+        raise MFAMethodDoesNotExistError()
+
     def get_primary_active_name(self, user_id: Any) -> str:
-        method_name = (
-            self.filter(user_id=user_id, is_primary=True, is_active=True)
-            .values_list("name", flat=True)
-            .first()
-        )
-        if method_name is None:
-            raise MFAMethodDoesNotExistError()
-        return method_name
+        return self.get_primary_active(user_id=user_id).name
+
+    async def aget_primary_active(self, user_id: Any) -> "MFAMethod":
+        """
+        Returns the primary method with its secret, as deferred fields
+        can't be loaded on access in async code.
+        """
+        for mfa_method in await self.alist_active_methods(user_id=user_id):
+            if mfa_method.is_primary:
+                await self.aload_deferred_fields([mfa_method])
+                return mfa_method
+        raise MFAMethodDoesNotExistError()
+
+    async def aget_primary_active_name(self, user_id: Any) -> str:
+        return (await self.aget_primary_active(user_id=user_id)).name
 
     def is_active_by_name(self, user_id: Any, name: str) -> bool:
         is_active = (
@@ -55,13 +104,92 @@ class MFAUserMethodManager(Manager):
     def list_active(self, user_id: Any) -> QuerySet:
         return self.filter(user_id=user_id, is_active=True)
 
+    def list_active_methods(
+        self, user_id: Any, with_secrets: bool = False
+    ) -> List["MFAMethod"]:
+        """
+        Returns active methods of the user, from the cache if enabled.
+
+        Methods served from the cache have their secrets deferred, unless
+        ``with_secrets`` is set to load them with a single query.
+        """
+        if not mfa_method_cache.is_enabled:
+            return list(self.list_active(user_id=user_id))
+        field_names = [self.model._meta.pk.attname] + [
+            self.model._meta.get_field(name).attname for name in self._CACHED_FIELDS
+        ]
+        rows = mfa_method_cache.get(user_id=user_id, field_names=field_names)
+        if rows is None:
+            mfa_methods = list(self.list_active(user_id=user_id))
+            mfa_method_cache.set(
+                user_id=user_id,
+                field_names=field_names,
+                rows=[
+                    tuple(getattr(mfa_method, name) for name in field_names)
+                    for mfa_method in mfa_methods
+                ],
+            )
+            return mfa_methods
+        mfa_methods = [self.model.from_db(self.db, field_names, row) for row in rows]
+        if with_secrets:
+            self.load_deferred_fields(mfa_methods)
+        return mfa_methods
+
+    async def alist_active_methods(
+        self, user_id: Any, with_secrets: bool = False
+    ) -> List["MFAMethod"]:
+        if not mfa_method_cache.is_enabled:
+            return [
+                mfa_method async for mfa_method in self.list_active(user_id=user_id)
+            ]
+        return await sync_to_async(self.list_active_methods)(
+            user_id=user_id, with_secrets=with_secrets
+        )
+
+    def load_deferred_fields(self, mfa_methods: Iterable["MFAMethod"]) -> None:
+        """
+        Loads fields deferred by the cache, e.g. secrets, of all given
+        methods with a single query.
+        """
+        deferred, field_names = self._collect_deferred(mfa_methods)
+        if deferred:
+            rows = self.filter(pk__in=deferred).values_list("pk", *field_names)
+            self._fill_deferred(deferred, field_names=field_names, rows=rows)
+
+    async def aload_deferred_fields(self, mfa_methods: Iterable["MFAMethod"]) -> None:
+        deferred, field_names = self._collect_deferred(mfa_methods)
+        if deferred:
+            rows = self.filter(pk__in=deferred).values_list("pk", *field_names)
+            self._fill_deferred(
+                deferred, field_names=field_names, rows=[row async for row in rows]
+            )
+
+    @staticmethod
+    def _collect_deferred(
+        mfa_methods: Iterable["MFAMethod"],
+    ) -> Tuple[Dict[Any, "MFAMethod"], List[str]]:
+        deferred = {}
+        field_names: Set[str] = set()
+        for mfa_method in mfa_methods:
+            deferred_fields = mfa_method.get_deferred_fields()
+            if deferred_fields:
+                deferred[mfa_method.pk] = mfa_method
+                field_names |= deferred_fields
+        return deferred, sorted(field_names)
+
+    @staticmethod
+    def _fill_deferred(
+        deferred: Dict[Any, "MFAMethod"], field_names: List[str], rows: Iterable[Tuple]
+    ) -> None:
+        for pk, *values in rows:
+            for name, value in zip(field_names, values):
+                setattr(deferred[pk], name, value)
+
     def primary_exists(self, user_id: Any) -> bool:
         return self.filter(user_id=user_id, is_primary=True).exists()
 
 
 class MFAMethod(Model):
-    _BACKUP_CODES_DELIMITER = "|"
-
     user = ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=CASCADE,
@@ -72,7 +200,6 @@ class MFAMethod(Model):
     secret = CharField(_("secret"), max_length=255)
     is_primary = BooleanField(_("is primary"), default=False)
     is_active = BooleanField(_("is active"), default=False)
-    _backup_codes = TextField(_("backup codes"), blank=True)
 
     class Meta:
         verbose_name = _("MFA Method")
@@ -99,9 +226,62 @@ class MFAMethod(Model):
         return f"{self.name} (User id: {self.user_id})"
 
     @property
-    def backup_codes(self) -> Iterable[str]:
-        return self._backup_codes.split(self._BACKUP_CODES_DELIMITER)
+    def backup_codes(self) -> List[str]:
+        return MFABackupCode.objects.list_unused_digests(mfa_method_id=self.pk)
 
     @backup_codes.setter
-    def backup_codes(self, codes: Iterable) -> None:
-        self._backup_codes = self._BACKUP_CODES_DELIMITER.join(codes)
+    def backup_codes(self, codes: Iterable[str]) -> None:
+        """
+        Replaces stored backup codes of the method with the given digests.
+        Backup codes are stored in their own table, so they're saved right
+        away rather than with the method.
+        """
+        MFABackupCode.objects.replace(mfa_method_id=self.pk, digests=codes)
+
+
+class MFABackupCodeManager(Manager):
+    def list_unused_digests(self, mfa_method_id: Any) -> List[str]:
+        return list(
+            self.filter(mfa_method_id=mfa_method_id, used_at__isnull=True).values_list(
+                "digest", flat=True
+            )
+        )
+
+    def consume(self, mfa_method_id: Any, digests: Iterable[str]) -> bool:
+        rows_affected = self.filter(
+            mfa_method_id=mfa_method_id, digest__in=digests, used_at__isnull=True
+        ).update(used_at=now())
+        return rows_affected > 0
+
+    def replace(self, mfa_method_id: Any, digests: Iterable[str]) -> None:
+        self.filter(mfa_method_id=mfa_method_id).delete()
+        self.bulk_create(
+            self.model(mfa_method_id=mfa_method_id, digest=digest) for digest in digests
+        )
+
+
+class MFABackupCode(Model):
+    mfa_method = ForeignKey(
+        trench_settings.USER_MFA_MODEL,
+        on_delete=CASCADE,
+        verbose_name=_("MFA method"),
+        related_name="backup_code_set",
+        db_index=False,
+    )
+    digest = CharField(_("digest"), max_length=255)
+    used_at = DateTimeField(_("used at"), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _("MFA backup code")
+        verbose_name_plural = _("MFA backup codes")
+        indexes = (
+            Index(
+                fields=("mfa_method", "digest"),
+                name="trench_backup_code_digest_idx",
+            ),
+        )
+
+    objects = MFABackupCodeManager()
+
+    def __str__(self) -> str:
+        return f"Backup code (MFA method id: {self.mfa_method_id})"
@@ -0,0 +1,41 @@
+from typing import Type
+
+from trench.hashers import (
+    BACKUP_CODE_DIGEST_PREFIX,
+    BACKUP_CODE_HASH_SEPARATOR,
+    get_backup_code_hash_prefix,
+)
+from trench.models import MFABackupCode
+from trench.settings import TrenchAPISettings, trench_settings
+
+
+class CountLegacyBackupCodesQuery:
+    """
+    Counts unused backup codes stored in another format than the one
+    codes are currently stored in, according to ``ENCRYPT_BACKUP_CODES``,
+    ``HMAC_BACKUP_CODES`` and ``BACKUP_CODES_HASHER`` settings.
+    """
+
+    def __init__(
+        self, settings: TrenchAPISettings, backup_code_model: Type[MFABackupCode]
+    ) -> None:
+        self._settings = settings
+        self._backup_code_model = backup_code_model
+
+    def execute(self) -> int:
+        backup_codes = self._backup_code_model.objects.filter(used_at__isnull=True)
+        if not self._settings.ENCRYPT_BACKUP_CODES:
+            return backup_codes.filter(
+                digest__contains=BACKUP_CODE_HASH_SEPARATOR
+            ).count()
+        return backup_codes.exclude(digest__startswith=self._get_prefix()).count()
+
+    def _get_prefix(self) -> str:
+        if self._settings.HMAC_BACKUP_CODES:
+            return BACKUP_CODE_DIGEST_PREFIX
+        return get_backup_code_hash_prefix(self._settings.BACKUP_CODES_HASHER)
+
+
+count_legacy_backup_codes_query = CountLegacyBackupCodesQuery(
+    settings=trench_settings, backup_code_model=MFABackupCode
+).execute
@@ -8,9 +8,7 @@ from rest_framework.fields import CharField, ChoiceField
 from rest_framework.serializers import ModelSerializer, Serializer
 from typing import Any, OrderedDict
 
-from trench.backends.provider import get_mfa_handler
-from trench.command.remove_backup_code import remove_backup_code_command
-from trench.command.validate_backup_code import validate_backup_code_command
+from trench.command.validate_mfa_code import validate_mfa_code_command
 from trench.exceptions import (
     CodeInvalidOrExpiredError,
     MFAMethodAlreadyActiveError,
@@ -60,19 +58,11 @@ class ProtectedActionValidator(RequestBodyValidator):
         )
         self._validate_mfa_method(mfa)
 
-        validated_backup_code = validate_backup_code_command(
-            value=value, backup_codes=mfa.backup_codes
-        )
-
-        handler = get_mfa_handler(mfa)
-        validation_method = getattr(handler, self._get_validation_method_name())
-        if validation_method(value):
-            return value
-
-        if validated_backup_code:
-            remove_backup_code_command(
-                user_id=mfa.user_id, method_name=mfa.name, code=value
-            )
+        if validate_mfa_code_command(
+            mfa_methods=(mfa,),
+            code=value,
+            validation_method_name=self._get_validation_method_name(),
+        ):
             return value
 
         raise CodeInvalidOrExpiredError()
@@ -1,19 +1,34 @@
 from django.conf import settings
+from django.core.signals import setting_changed
 from django.utils.translation import gettext_lazy as _
 
 import string
 from rest_framework.settings import APISettings, perform_import
-from typing import Any, Dict
+from types import MappingProxyType
+from typing import Any, Dict, Mapping
 
-from trench.exceptions import MethodHandlerMissingError
+from trench.exceptions import BackupCodesCharactersError, MethodHandlerMissingError
+from trench.hashers import BACKUP_CODE_HASH_SEPARATOR
 
 
 class TrenchAPISettings(APISettings):
+    """
+    Settings compiled once per ``TRENCH_AUTH`` value.
+
+    ``MFA_METHODS`` is compiled into read-only mappings with defaults merged
+    and handler classes imported, so the user's settings are never modified
+    and later lookups are plain attribute and dictionary reads.
+    """
+
     _FIELD_USER_SETTINGS = "_user_settings"
     _FIELD_TRENCH_AUTH = "TRENCH_AUTH"
     _FIELD_BACKUP_CODES_CHARACTERS = "BACKUP_CODES_CHARACTERS"
     _FIELD_MFA_METHODS = "MFA_METHODS"
     _FIELD_HANDLER = "HANDLER"
+    _FIELD_PROVIDERS = "PROVIDERS"
+    # Keys of the method shared by its providers, so that codes they send
+    # are validated by the method.
+    _PROVIDER_SHARED_FIELDS = ("SOURCE_FIELD", "VALIDITY_PERIOD", "VALID_WINDOW")
 
     @property
     def user_settings(self) -> Dict[str, Any]:
@@ -22,28 +37,69 @@ class TrenchAPISettings(APISettings):
         return self._user_settings
 
     def __getattr__(self, attr: str) -> Any:
-        val = super().__getattr__(attr)
-        self._validate(attribute=attr, value=val)
+        if attr not in self.defaults:
+            raise AttributeError(f"Invalid Trench setting: '{attr}'")
+        val = self.user_settings.get(attr, self.defaults[attr])
+        if attr == self._FIELD_MFA_METHODS:
+            val = self._compile_mfa_methods(methods=val)
+        elif attr == self._FIELD_BACKUP_CODES_CHARACTERS:
+            # Plain codes are told apart from hashed ones by the separator.
+            if BACKUP_CODE_HASH_SEPARATOR in val:
+                raise BackupCodesCharactersError(separator=BACKUP_CODE_HASH_SEPARATOR)
+        self._cached_attrs.add(attr)
+        setattr(self, attr, val)
         return val
 
-    def _validate(self, attribute: str, value: Any) -> None:
-        if attribute == self._FIELD_MFA_METHODS:
-            for method_name, method_config in value.items():
-                if self._FIELD_HANDLER not in method_config:
-                    raise MethodHandlerMissingError(method_name=method_name)
-                for k, v in self.defaults[self._FIELD_MFA_METHODS][method_name].items():
-                    method_config[k] = method_config.get(k, v)
-                method_config[self._FIELD_HANDLER] = perform_import(
-                    method_config[self._FIELD_HANDLER], self._FIELD_HANDLER
+    def _compile_mfa_methods(
+        self, methods: Mapping[str, Mapping[str, Any]]
+    ) -> Mapping[str, Mapping[str, Any]]:
+        default_methods = self.defaults[self._FIELD_MFA_METHODS]
+        compiled = {}
+        for method_name, method_config in methods.items():
+            if self._FIELD_HANDLER not in method_config:
+                raise MethodHandlerMissingError(method_name=method_name)
+            config = {**default_methods.get(method_name, {}), **method_config}
+            config[self._FIELD_HANDLER] = perform_import(
+                method_config[self._FIELD_HANDLER], self._FIELD_HANDLER
+            )
+            if self._FIELD_PROVIDERS in config:
+                config[self._FIELD_PROVIDERS] = self._compile_providers(
+                    method_name=method_name, method_config=config
+                )
+            compiled[method_name] = MappingProxyType(config)
+        return MappingProxyType(compiled)
+
+    def _compile_providers(
+        self, method_name: str, method_config: Mapping[str, Any]
+    ) -> Mapping[str, Mapping[str, Any]]:
+        shared = {
+            field: method_config[field]
+            for field in self._PROVIDER_SHARED_FIELDS
+            if field in method_config
+        }
+        compiled = {}
+        for provider_name, provider_config in method_config[
+            self._FIELD_PROVIDERS
+        ].items():
+            if self._FIELD_HANDLER not in provider_config:
+                raise MethodHandlerMissingError(
+                    method_name=f"{method_name}.{provider_name}"
                 )
+            config = {**provider_config, **shared}
+            config[self._FIELD_HANDLER] = perform_import(
+                provider_config[self._FIELD_HANDLER], self._FIELD_HANDLER
+            )
+            compiled[provider_name] = MappingProxyType(config)
+        return MappingProxyType(compiled)
 
     def __getitem__(self, attr: str) -> Any:
-        return self.__getattr__(attr)
+        return getattr(self, attr)
 
 
 SOURCE_FIELD = "SOURCE_FIELD"
 HANDLER = "HANDLER"
 VALIDITY_PERIOD = "VALIDITY_PERIOD"
+VALID_WINDOW = "VALID_WINDOW"
 VERBOSE_NAME = "VERBOSE_NAME"
 EMAIL_SUBJECT = "EMAIL_SUBJECT"
 EMAIL_PLAIN_TEMPLATE = "EMAIL_PLAIN_TEMPLATE"
@@ -55,6 +111,13 @@ YUBICLOUD_CLIENT_ID = "YUBICLOUD_CLIENT_ID"
 AWS_ACCESS_KEY = "AWS_ACCESS_KEY"
 AWS_SECRET_KEY = "AWS_SECRET_KEY"
 AWS_REGION = "AWS_REGION"
+PROVIDERS = "PROVIDERS"
+HEDGE_DELAY = "HEDGE_DELAY"
+CONNECT_TIMEOUT = "CONNECT_TIMEOUT"
+READ_TIMEOUT = "READ_TIMEOUT"
+MAX_CONCURRENT_CALLS = "MAX_CONCURRENT_CALLS"
+CIRCUIT_BREAKER_FAILURES = "CIRCUIT_BREAKER_FAILURES"
+CIRCUIT_BREAKER_RESET_TIMEOUT = "CIRCUIT_BREAKER_RESET_TIMEOUT"
 
 DEFAULTS = {
     "USER_MFA_MODEL": "trench.MFAMethod",
@@ -62,13 +125,32 @@ DEFAULTS = {
     "BACKUP_CODES_QUANTITY": 5,
     "BACKUP_CODES_LENGTH": 12,  # keep (quantity * length) under 200
     "BACKUP_CODES_CHARACTERS": (string.ascii_letters + string.digits),
+    "BACKUP_CODES_HASHING_WORKERS": 4,
+    "BACKUP_CODES_BACKGROUND_HASHING": False,
+    "BACKUP_CODES_HASHER": None,
     "SECRET_KEY_LENGTH": 32,
     "DEFAULT_VALIDITY_PERIOD": 30,
+    "DEFAULT_VALID_WINDOW": 0,
+    "OTP_CACHE_SIZE": 1024,
     "CONFIRM_DISABLE_WITH_CODE": False,
     "CONFIRM_BACKUP_CODES_REGENERATION_WITH_CODE": True,
     "ALLOW_BACKUP_CODES_REGENERATION": True,
     "ENCRYPT_BACKUP_CODES": True,
+    "HMAC_BACKUP_CODES": False,
     "APPLICATION_ISSUER_NAME": "MyApplication",
+    "DISPATCH_QUEUE": None,
+    "DISPATCH_QUEUE_WORKERS": 4,
+    "DISPATCH_QUEUE_SIZE": 100,
+    "DEFAULT_CONNECT_TIMEOUT": 5,
+    "DEFAULT_READ_TIMEOUT": 10,
+    "DEFAULT_MAX_CONCURRENT_CALLS": None,
+    "DEFAULT_CIRCUIT_BREAKER_FAILURES": None,
+    "DEFAULT_CIRCUIT_BREAKER_RESET_TIMEOUT": 30,
+    "CIRCUIT_BREAKER_CACHE": "default",
+    "MFA_METHODS_CACHE": None,
+    "MFA_METHODS_CACHE_TIMEOUT": 300,
+    "INSTRUMENTATION_SINKS": (),
+    "TRACER": None,
     "MFA_METHODS": {
         "sms_twilio": {
             VERBOSE_NAME: _("sms_twilio"),
@@ -120,3 +202,11 @@ DEFAULTS = {
 trench_settings = TrenchAPISettings(
     user_settings=None, defaults=DEFAULTS, import_strings=None
 )
+
+
+def reload_trench_settings(*args: Any, **kwargs: Any) -> None:
+    if kwargs["setting"] == TrenchAPISettings._FIELD_TRENCH_AUTH:
+        trench_settings.reload()
+
+
+setting_changed.connect(reload_trench_settings)
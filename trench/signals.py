@@ -0,0 +1,11 @@
+from django.dispatch import Signal
+
+
+# Sent when a message with MFA code could not be delivered. Provides
+# ``mfa_method`` and ``response`` (a ``FailedDispatchResponse``).
+message_dispatch_failed = Signal()
+
+# Sent when backup codes regenerated with ``BACKUP_CODES_BACKGROUND_HASHING``
+# could not be hashed or stored, so the previous codes remain valid.
+# Provides ``mfa_method_id`` and ``exception``.
+backup_codes_hashing_failed = Signal()
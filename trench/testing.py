@@ -0,0 +1,25 @@
+from contextlib import contextmanager
+from typing import Iterator, List
+
+from trench.instrumentation import Measurement, capture_measurements
+
+
+@contextmanager
+def assert_query_budget(name: str, max_queries: int) -> Iterator[List[Measurement]]:
+    """
+    Fails when the trench view or command called ``name`` (e.g.
+    ``view.MFAFirstStepJWTView`` or ``command.activate_mfa_method``) issues
+    more than ``max_queries`` queries in the enclosed block, or is not
+    called at all.
+    """
+    with capture_measurements() as measurements:
+        yield measurements
+    matching = [measurement for measurement in measurements if measurement.name == name]
+    if not matching:
+        raise AssertionError(f"{name} was not called.")
+    for measurement in matching:
+        if measurement.queries > max_queries:
+            raise AssertionError(
+                f"{name} issued {measurement.queries} queries, "
+                f"budget is {max_queries}: {measurement!r}"
+            )
@@ -0,0 +1,63 @@
+from django.utils.module_loading import import_string
+
+from abc import ABC, abstractmethod
+from contextlib import nullcontext
+from functools import lru_cache
+from typing import Any, ContextManager, Dict, Optional
+
+from trench.settings import trench_settings
+
+
+_NO_SPAN: ContextManager = nullcontext()
+
+
+class AbstractTracer(ABC):
+    @abstractmethod
+    def start_span(self, name: str, attributes: Dict[str, Any]) -> ContextManager:
+        """
+        Returns a context manager covering the traced operation. Spans
+        started inside it should become its children.
+        """
+        raise NotImplementedError  # pragma: no cover
+
+
+class OpenTelemetryTracer(AbstractTracer):
+    """
+    Reports spans through the OpenTelemetry API, using the globally
+    configured tracer provider. Requires the ``opentelemetry-api`` package.
+    """
+
+    INSTRUMENTATION_NAME = "trench"
+
+    def __init__(self) -> None:
+        from opentelemetry import trace
+
+        self._tracer = trace.get_tracer(self.INSTRUMENTATION_NAME)
+
+    def start_span(self, name: str, attributes: Dict[str, Any]) -> ContextManager:
+        return self._tracer.start_as_current_span(
+            f"{self.INSTRUMENTATION_NAME}.{name}", attributes=attributes
+        )
+
+
+@lru_cache(maxsize=None)
+def _load_tracer(path: str) -> AbstractTracer:
+    return import_string(path)()
+
+
+def get_tracer() -> Optional[AbstractTracer]:
+    path = trench_settings.TRACER
+    if path is None:
+        return None
+    return _load_tracer(path)
+
+
+def span(name: str, **attributes: Any) -> ContextManager:
+    """
+    Traces the enclosed block with the tracer set in ``TRACER``.
+    Does nothing when no tracer is configured.
+    """
+    tracer = get_tracer()
+    if tracer is None:
+        return _NO_SPAN
+    return tracer.start_span(name, attributes)
@@ -3,29 +3,56 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.core.exceptions import ValidationError
+from django.core.signing import BadSignature, Signer
+from django.db import close_old_connections
 from django.utils.crypto import constant_time_compare, salted_hmac
 from django.utils.http import base36_to_int, int_to_base36
 from django.utils.translation import gettext_lazy as _
 
+from asgiref.sync import sync_to_async
 from datetime import datetime
-from typing import List, Optional, Tuple, Type
+from functools import wraps
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+)
 
 from trench.models import MFAMethod
 from trench.settings import VERBOSE_NAME, trench_settings
+from trench.tracing import span
 
 
 User: AbstractUser = get_user_model()
 
+T = TypeVar("T")
+
+
+class EphemeralToken(NamedTuple):
+    user_pk: str
+    timestamp: int
+    fingerprint: str
+
 
 class UserTokenGenerator(PasswordResetTokenGenerator):
     """
     Custom token generator:
         - user pk in token
         - expires after 15 minutes
-        - longer hash (40 instead of 20)
+        - signed, so it can be verified without querying the database
+        - fingerprint of user's state (password, last login) is checked
+          once the user is loaded
     """
 
     KEY_SALT = "django.contrib.auth.tokens.PasswordResetTokenGenerator"
+    SIGNER_SALT = "trench.utils.UserTokenGenerator"
     SECRET = settings.SECRET_KEY
     EXPIRY_TIME = 60 * 15
 
@@ -33,33 +60,82 @@ class UserTokenGenerator(PasswordResetTokenGenerator):
         return self._make_token_with_timestamp(user, int(datetime.now().timestamp()))
 
     def check_token(self, user: User, token: str) -> Optional[User]:
-        user_model = get_user_model()
+        with span("ephemeral_token.check"):
+            ephemeral_token = self.parse_token(token)
+            if ephemeral_token is None:
+                return None
+            return self.get_user(ephemeral_token)
+
+    def parse_token(self, token: str) -> Optional[EphemeralToken]:
+        """
+        Verifies signature and expiry time of the token without touching
+        the database.
+        """
         if not token:
             return None
+        with span("ephemeral_token.parse"):
+            return self._parse_token(token)
+
+    def _parse_token(self, token: str) -> Optional[EphemeralToken]:
         try:
-            token = str(token)
-            user_pk, ts_b36, token_hash = token.rsplit("-", 2)
+            payload = self._get_signer().unsign(str(token))
+            user_pk, ts_b36, fingerprint = payload.rsplit(":", 2)
             ts = base36_to_int(ts_b36)
-            user = user_model._default_manager.get(pk=user_pk)
-        except (ValueError, TypeError, user_model.DoesNotExist):
+        except (BadSignature, ValueError, TypeError):
             return None
 
         if (datetime.now().timestamp() - ts) > self.EXPIRY_TIME:
             return None  # pragma: no cover
 
-        if not constant_time_compare(self._make_token_with_timestamp(user, ts), token):
-            return None  # pragma: no cover
+        return EphemeralToken(user_pk=user_pk, timestamp=ts, fingerprint=fingerprint)
+
+    def get_user(self, ephemeral_token: EphemeralToken) -> Optional[User]:
+        """
+        Loads the user the token was issued for, unless the user's state
+        changed since then.
+        """
+        with span("ephemeral_token.get_user"):
+            return self._get_user(ephemeral_token)
+
+    async def aget_user(self, ephemeral_token: EphemeralToken) -> Optional[User]:
+        with span("ephemeral_token.get_user"):
+            user_model = get_user_model()
+            try:
+                user = await user_model._default_manager.aget(
+                    pk=ephemeral_token.user_pk
+                )
+            except (ValueError, TypeError, ValidationError, user_model.DoesNotExist):
+                return None
+            return user if self._matches_fingerprint(user, ephemeral_token) else None
+
+    def _get_user(self, ephemeral_token: EphemeralToken) -> Optional[User]:
+        user_model = get_user_model()
+        try:
+            user = user_model._default_manager.get(pk=ephemeral_token.user_pk)
+        except (ValueError, TypeError, ValidationError, user_model.DoesNotExist):
+            return None
+        return user if self._matches_fingerprint(user, ephemeral_token) else None
 
-        return user
+    def _matches_fingerprint(self, user: User, ephemeral_token: EphemeralToken) -> bool:
+        return constant_time_compare(
+            self._make_fingerprint(user, ephemeral_token.timestamp),
+            ephemeral_token.fingerprint,
+        )
 
     def _make_token_with_timestamp(self, user: User, timestamp: int, **kwargs) -> str:
         ts_b36 = int_to_base36(timestamp)
-        token_hash = salted_hmac(
+        fingerprint = self._make_fingerprint(user, timestamp)
+        return self._get_signer().sign(f"{user.pk}:{ts_b36}:{fingerprint}")
+
+    def _make_fingerprint(self, user: User, timestamp: int) -> str:
+        return salted_hmac(
             self.KEY_SALT,
             self._make_hash_value(user, timestamp),
             secret=self.SECRET,
         ).hexdigest()
-        return f"{user.pk}-{ts_b36}-{token_hash}"
+
+    def _get_signer(self) -> Signer:
+        return Signer(key=self.SECRET, salt=self.SIGNER_SALT, algorithm="sha256")
 
 
 user_token_generator = UserTokenGenerator()
@@ -74,3 +150,22 @@ def available_method_choices() -> List[Tuple[str, str]]:
         (method_name, method_config.get(VERBOSE_NAME, _(method_name)))
         for method_name, method_config in trench_settings.MFA_METHODS.items()
     ]
+
+
+def run_in_executor(func: Callable[..., T]) -> Callable[..., Awaitable[T]]:
+    """
+    Makes a blocking function, e.g. one hashing passwords, awaitable from
+    async views. It runs in the default executor of the event loop rather
+    than in the single thread shared by thread-sensitive ``sync_to_async``
+    calls. Database connections it opened are closed as at the end of
+    a request.
+    """
+
+    @wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> T:
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(wrapper, thread_sensitive=False)
@@ -5,10 +5,17 @@ from rest_framework.authtoken.models import Token
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.request import Request
 from rest_framework.response import Response
-from rest_framework.views import APIView
 
 from trench.serializers import TokenSerializer
-from trench.views import MFAFirstStepMixin, MFASecondStepMixin, MFAStepMixin, User
+from trench.views import (
+    AsyncMFAFirstStepMixin,
+    AsyncMFASecondStepMixin,
+    InstrumentedAPIView,
+    MFAFirstStepMixin,
+    MFASecondStepMixin,
+    MFAStepMixin,
+    User,
+)
 
 
 class MFAAuthTokenView(MFAStepMixin):
@@ -26,7 +33,15 @@ class MFASecondStepAuthTokenView(MFAAuthTokenView, MFASecondStepMixin):
     pass
 
 
-class MFALogoutView(APIView):
+class AsyncMFAFirstStepAuthTokenView(MFAAuthTokenView, AsyncMFAFirstStepMixin):
+    pass
+
+
+class AsyncMFASecondStepAuthTokenView(MFAAuthTokenView, AsyncMFASecondStepMixin):
+    pass
+
+
+class MFALogoutView(InstrumentedAPIView):
     permission_classes = (IsAuthenticated,)
 
     @staticmethod
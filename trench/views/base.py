@@ -1,9 +1,13 @@
+from django import VERSION as DJANGO_VERSION
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AbstractUser
 from django.db.models import QuerySet
+from django.http import HttpRequest
 from django.utils.translation import gettext_lazy as _
 
 from abc import ABC, abstractmethod
+from asgiref.sync import sync_to_async
+from inspect import isawaitable
 from rest_framework.generics import ListAPIView
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.request import Request
@@ -14,22 +18,31 @@ from rest_framework.status import (
     HTTP_401_UNAUTHORIZED,
 )
 from rest_framework.views import APIView
+from typing import Any
 
-from trench.backends.provider import get_mfa_handler
 from trench.command.activate_mfa_method import activate_mfa_method_command
-from trench.command.authenticate_second_factor import authenticate_second_step_command
+from trench.command.authenticate_second_factor import (
+    aauthenticate_second_step_command,
+    authenticate_second_step_command,
+)
 from trench.command.authenticate_user import authenticate_user_command
 from trench.command.create_mfa_method import create_mfa_method_command
 from trench.command.deactivate_mfa_method import deactivate_mfa_method_command
+from trench.command.dispatch_message import (
+    adispatch_message_command,
+    dispatch_message_command,
+)
 from trench.command.replace_mfa_method_backup_codes import (
     regenerate_backup_codes_for_mfa_method_command,
 )
 from trench.command.set_primary_mfa_method import set_primary_mfa_method_command
 from trench.exceptions import (
+    AsyncViewsUnsupportedError,
     MFAMethodDoesNotExistError,
     MFASourceFieldDoesNotExistError,
     MFAValidationError,
 )
+from trench.instrumentation import measure
 from trench.query.get_mfa_config_by_name import get_mfa_config_by_name_query
 from trench.responses import ErrorResponse
 from trench.serializers import (
@@ -44,13 +57,68 @@ from trench.serializers import (
     UserMFAMethodSerializer,
 )
 from trench.settings import SOURCE_FIELD, trench_settings
-from trench.utils import available_method_choices, get_mfa_model, user_token_generator
+from trench.utils import (
+    available_method_choices,
+    get_mfa_model,
+    run_in_executor,
+    user_token_generator,
+)
 
 
 User: AbstractUser = get_user_model()
 
 
-class MFAStepMixin(APIView, ABC):
+class InstrumentedAPIView(APIView):
+    def dispatch(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Any:
+        with measure(f"view.{self.__class__.__name__}"):
+            return super().dispatch(request, *args, **kwargs)
+
+
+class AsyncInstrumentedAPIView(InstrumentedAPIView):
+    """
+    API view with coroutine handlers, served on the event loop under ASGI.
+    Authentication, permission and throttling checks may query the
+    database, so they run through ``sync_to_async``.
+
+    These views use the async ORM, and rely on ``csrf_exempt`` keeping
+    views asynchronous, which is the case since Django 5.0.
+    """
+
+    MIN_DJANGO_VERSION = (5, 0)
+
+    @classmethod
+    def as_view(cls, **initkwargs: Any) -> Any:
+        if DJANGO_VERSION < cls.MIN_DJANGO_VERSION:
+            raise AsyncViewsUnsupportedError(
+                view_name=cls.__name__,
+                django_version=".".join(map(str, cls.MIN_DJANGO_VERSION)),
+            )
+        return super().as_view(**initkwargs)
+
+    async def dispatch(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Any:
+        with measure(f"view.{self.__class__.__name__}"):
+            self.args = args
+            self.kwargs = kwargs
+            request = self.initialize_request(request, *args, **kwargs)
+            self.request = request
+            self.headers = self.default_response_headers
+            try:
+                await sync_to_async(self.initial)(request, *args, **kwargs)
+                handler = self.http_method_not_allowed
+                if request.method.lower() in self.http_method_names:
+                    handler = getattr(
+                        self, request.method.lower(), self.http_method_not_allowed
+                    )
+                response = handler(request, *args, **kwargs)
+                if isawaitable(response):
+                    response = await response
+            except Exception as exc:
+                response = self.handle_exception(exc)
+            self.response = self.finalize_response(request, response, *args, **kwargs)
+            return self.response
+
+
+class MFAStepMixin(InstrumentedAPIView, ABC):
     permission_classes = (AllowAny,)
 
     @abstractmethod
@@ -73,7 +141,8 @@ class MFAFirstStepMixin(MFAStepMixin, ABC):
         try:
             mfa_model = get_mfa_model()
             mfa_method = mfa_model.objects.get_primary_active(user_id=user.id)
-            get_mfa_handler(mfa_method=mfa_method).dispatch_message()
+            mfa_method.user = user
+            dispatch_message_command(mfa_method=mfa_method)
             return Response(
                 data={
                     "ephemeral_token": user_token_generator.make_token(user),
@@ -98,7 +167,58 @@ class MFASecondStepMixin(MFAStepMixin, ABC):
             return ErrorResponse(error=cause, status=HTTP_401_UNAUTHORIZED)
 
 
-class MFAMethodActivationView(APIView):
+class AsyncMFAStepMixin(MFAStepMixin, AsyncInstrumentedAPIView, ABC):
+    async def _asuccessful_authentication_response(self, user: User) -> Response:
+        return await sync_to_async(self._successful_authentication_response)(user=user)
+
+
+class AsyncMFAFirstStepMixin(AsyncMFAStepMixin, ABC):
+    """
+    Password hashing runs in an executor, database lookups of MFA methods
+    and message dispatch are awaited.
+    """
+
+    async def post(self, request: Request) -> Response:
+        serializer = LoginSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            user = await run_in_executor(authenticate_user_command)(
+                request=request,
+                username=serializer.validated_data[User.USERNAME_FIELD],
+                password=serializer.validated_data["password"],
+            )
+        except MFAValidationError as cause:
+            return ErrorResponse(error=cause)
+        try:
+            mfa_model = get_mfa_model()
+            mfa_method = await mfa_model.objects.aget_primary_active(user_id=user.id)
+            mfa_method.user = user
+            await adispatch_message_command(mfa_method=mfa_method)
+            return Response(
+                data={
+                    "ephemeral_token": user_token_generator.make_token(user),
+                    "method": mfa_method.name,
+                }
+            )
+        except MFAMethodDoesNotExistError:
+            return await self._asuccessful_authentication_response(user=user)
+
+
+class AsyncMFASecondStepMixin(AsyncMFAStepMixin, ABC):
+    async def post(self, request: Request) -> Response:
+        serializer = CodeLoginSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            user = await aauthenticate_second_step_command(
+                code=serializer.validated_data["code"],
+                ephemeral_token=serializer.validated_data["ephemeral_token"],
+            )
+            return await self._asuccessful_authentication_response(user=user)
+        except MFAValidationError as cause:
+            return ErrorResponse(error=cause, status=HTTP_401_UNAUTHORIZED)
+
+
+class MFAMethodActivationView(InstrumentedAPIView):
     permission_classes = (IsAuthenticated,)
 
     @staticmethod
@@ -121,10 +241,11 @@ class MFAMethodActivationView(APIView):
             )
         except MFAValidationError as cause:
             return ErrorResponse(error=cause)
-        return get_mfa_handler(mfa_method=mfa).dispatch_message()
+        mfa.user = user
+        return dispatch_message_command(mfa_method=mfa)
 
 
-class MFAMethodConfirmActivationView(APIView):
+class MFAMethodConfirmActivationView(InstrumentedAPIView):
     permission_classes = (IsAuthenticated,)
 
     @staticmethod
@@ -145,7 +266,7 @@ class MFAMethodConfirmActivationView(APIView):
             return ErrorResponse(error=cause)
 
 
-class MFAMethodDeactivationView(APIView):
+class MFAMethodDeactivationView(InstrumentedAPIView):
     permission_classes = (IsAuthenticated,)
 
     @staticmethod
@@ -164,7 +285,7 @@ class MFAMethodDeactivationView(APIView):
             return ErrorResponse(error=cause)
 
 
-class MFAMethodBackupCodesRegenerationView(APIView):
+class MFAMethodBackupCodesRegenerationView(InstrumentedAPIView):
     permission_classes = (IsAuthenticated,)
 
     @staticmethod
@@ -186,7 +307,7 @@ class MFAMethodBackupCodesRegenerationView(APIView):
             return ErrorResponse(error=cause)
 
 
-class MFAConfigView(APIView):
+class MFAConfigView(InstrumentedAPIView):
     permission_classes = (AllowAny,)
 
     @staticmethod
@@ -204,7 +325,7 @@ class MFAConfigView(APIView):
         )
 
 
-class MFAListActiveUserMethodsView(ListAPIView):
+class MFAListActiveUserMethodsView(InstrumentedAPIView, ListAPIView):
     serializer_class = UserMFAMethodSerializer
     permission_classes = (IsAuthenticated,)
 
@@ -213,7 +334,7 @@ class MFAListActiveUserMethodsView(ListAPIView):
         return mfa_model.objects.list_active(user_id=self.request.user.id)
 
 
-class MFAMethodRequestCodeView(APIView):
+class MFAMethodRequestCodeView(InstrumentedAPIView):
     permission_classes = (IsAuthenticated,)
 
     @staticmethod
@@ -227,13 +348,37 @@ class MFAMethodRequestCodeView(APIView):
                 method = mfa_model.objects.get_primary_active_name(
                     user_id=request.user.id
                 )
-            mfa = mfa_model.objects.get_by_name(user_id=request.user.id, name=method)
-            return get_mfa_handler(mfa_method=mfa).dispatch_message()
+            mfa = mfa_model.objects.get_by_name(
+                user_id=request.user.id, name=method, select_recipient=True
+            )
+            return dispatch_message_command(mfa_method=mfa)
+        except MFAValidationError as cause:
+            return ErrorResponse(error=cause)
+
+
+class AsyncMFAMethodRequestCodeView(AsyncInstrumentedAPIView):
+    permission_classes = (IsAuthenticated,)
+
+    @staticmethod
+    async def post(request: Request) -> Response:
+        serializer = MFAMethodCodeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            method = serializer.validated_data.get("method")
+            mfa_model = get_mfa_model()
+            if method is None:
+                method = await mfa_model.objects.aget_primary_active_name(
+                    user_id=request.user.id
+                )
+            mfa = await mfa_model.objects.aget_by_name(
+                user_id=request.user.id, name=method, select_recipient=True
+            )
+            return await adispatch_message_command(mfa_method=mfa)
         except MFAValidationError as cause:
             return ErrorResponse(error=cause)
 
 
-class MFAPrimaryMethodChangeView(APIView):
+class MFAPrimaryMethodChangeView(InstrumentedAPIView):
     permission_classes = (IsAuthenticated,)
 
     @staticmethod
@@ -1,7 +1,14 @@
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from trench.views import MFAFirstStepMixin, MFASecondStepMixin, MFAStepMixin, User
+from trench.views import (
+    AsyncMFAFirstStepMixin,
+    AsyncMFASecondStepMixin,
+    MFAFirstStepMixin,
+    MFASecondStepMixin,
+    MFAStepMixin,
+    User,
+)
 
 
 class MFAJWTView(MFAStepMixin):
@@ -16,3 +23,11 @@ class MFAFirstStepJWTView(MFAJWTView, MFAFirstStepMixin):
 
 class MFASecondStepJWTView(MFAJWTView, MFASecondStepMixin):
     pass
+
+
+class AsyncMFAFirstStepJWTView(MFAJWTView, AsyncMFAFirstStepMixin):
+    pass
+
+
+class AsyncMFASecondStepJWTView(MFAJWTView, AsyncMFASecondStepMixin):
+    pass